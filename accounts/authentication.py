@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import ParentStudentLink
+
+# What views need for role decisions, resolved once per token instead of once per request.
+AuthContext = namedtuple('AuthContext', [
+    'role', 'school_id', 'student_profile_id', 'teacher_profile_id', 'parent_profile_id', 'linked_student_ids',
+])
+
+
+# Revocation markers in the shared cache: when a user's (or every) cached token was last
+# invalidated. Any process drops a cached entry loaded before the marker, so logouts and password
+# changes take effect on every worker at once, not after AUTH_TOKEN_CACHE_TTL.
+USER_REVOKED_KEY = 'auth-tokens:revoked:{}'
+ALL_REVOKED_KEY = 'auth-tokens:revoked'
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token key -> (expires_at, token, user, loaded_at) with a TTL. Entries live in
+    the process that loaded them; revocations are published through the shared cache, and each hit
+    is checked against them (one cache read, no queries).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        # Bumped by every invalidation so a lookup that raced with one is not cached.
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+        user_key = USER_REVOKED_KEY.format(entry[2].pk)
+        revoked = cache.get_many([ALL_REVOKED_KEY, user_key])
+        if entry[3] <= max(revoked.get(ALL_REVOKED_KEY, 0), revoked.get(user_key, 0)):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._discard(key)
+            return None
+        return entry[1], entry[2]
+
+    def set(self, key, token, user, generation, loaded_at):
+        # `loaded_at` is the wall-clock time taken before the token was read from the database.
+        ttl = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+        max_size = getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + ttl, token, user, loaded_at)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > max_size:
+                self._discard(next(iter(self._entries)))
+
+    def _publish(self, marker_key):
+        # Entries older than the TTL are gone anyway, so the marker needn't outlive it.
+        cache.set(marker_key, time.time(), getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60) + 1)
+
+    def invalidate_token(self, key, user_id=None):
+        with self._lock:
+            self.generation += 1
+            self._discard(key)
+        if user_id is not None:
+            self._publish(USER_REVOKED_KEY.format(user_id))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self.generation += 1
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._discard(key)
+        self._publish(USER_REVOKED_KEY.format(user_id))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+        self._publish(ALL_REVOKED_KEY)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._keys_by_user.get(entry[2].pk)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_user[entry[2].pk]
+
+
+token_cache = TokenCache()
+
+
+def _profile_id(user, name):
+    # A missing reverse one-to-one raises RelatedObjectDoesNotExist, an AttributeError.
+    profile = getattr(user, name, None)
+    return profile.pk if profile is not None else None
+
+
+def build_auth_context(user):
+    linked = ()
+    if user.role == 'Parent':
+        linked = tuple(ParentStudentLink.objects.filter(parent=user).values_list('student_id', flat=True))
+    return AuthContext(
+        role=user.role,
+        school_id=user.school_id,
+        student_profile_id=_profile_id(user, 'student_profile'),
+        teacher_profile_id=_profile_id(user, 'teacher_profile'),
+        parent_profile_id=_profile_id(user, 'parent_profile'),
+        linked_student_ids=linked,
+    )
+
+
+def linked_student_ids(user):
+    """
+    Ids of the students linked to a parent, from the auth context when the request carried one.
+    """
+    context = getattr(user, 'auth_context', None)
+    if context is not None:
+        return list(context.linked_student_ids)
+    return list(ParentStudentLink.objects.filter(parent=user).values_list('student_id', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that loads the user together with school and role profiles in one query,
+    attaches an AuthContext, and caches the result so a warm request makes no auth queries.
+    Each request gets its own copy of the cached user, so views may mutate it freely.
+    """
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            generation, loaded_at = token_cache.generation, time.time()
+            model = self.get_model()
+            try:
+                token = model.objects.select_related(
+                    'user', 'user__school', 'user__student_profile', 'user__teacher_profile', 'user__parent_profile',
+                ).get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            token.user.auth_context = build_auth_context(token.user)
+            token_cache.set(key, token, token.user, generation, loaded_at)
+            cached = (token, token.user)
+        token, user = cached
+        return copy.deepcopy(user), token
@@ -0,0 +1,176 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Password hashing (PBKDF2 by default) is deliberately CPU-heavy, so it runs on a process pool
+# instead of serially on the request thread. The pool and its admission limits belong to each web
+# worker process: N workers run N pools.
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = None
+_bulk_in_flight = None
+
+
+class HashingBusy(APIException):
+    # DRF's exception handler turns `wait` into a Retry-After header.
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy. Please try again shortly."
+    default_code = 'hashing_busy'
+
+    def __init__(self, detail=None, wait=None):
+        super().__init__(detail)
+        self.wait = wait if wait is not None else getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 2)
+
+
+def _init_worker():
+    # Workers started with 'spawn' import a fresh interpreter; DJANGO_SETTINGS_MODULE is inherited.
+    django.setup()
+
+
+def _hash_one(password):
+    return make_password(password)
+
+
+def _verify_one(password, encoded):
+    # Returns (valid, needs_rehash) so an outdated hash can be upgraded after a successful login.
+    valid = check_password(password, encoded)
+    if not valid:
+        return False, False
+    hasher = identify_hasher(encoded)
+    return True, hasher.algorithm != get_hasher().algorithm or hasher.must_update(encoded)
+
+
+def worker_count():
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', 2)
+
+
+def max_pending():
+    return getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', None) or worker_count() * 8
+
+
+def bulk_in_flight():
+    # Bulk jobs queued or running at once. Keeping this at about one per worker keeps the pool's queue
+    # shallow, so an interactive job never waits behind a whole roster.
+    return getattr(settings, 'PASSWORD_HASHING_BULK_IN_FLIGHT', None) or worker_count()
+
+
+def get_executor():
+    global _executor, _pending, _bulk_in_flight
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=worker_count(), initializer=_init_worker)
+            _pending = threading.BoundedSemaphore(max_pending())
+            _bulk_in_flight = threading.BoundedSemaphore(min(bulk_in_flight(), max(1, max_pending() - 1)))
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _run_on_pool(fn, *args):
+    """
+    Runs one interactive hashing job on the pool. Admission is bounded by PASSWORD_HASHING_MAX_PENDING
+    jobs queued or running; past that, or if the job waits longer than PASSWORD_HASHING_TIMEOUT
+    seconds, the request fails fast with a 503 instead of tying up the request worker. With
+    PASSWORD_HASHING_WORKERS = 1 (or less) there is no pool and the job runs inline.
+    """
+    if worker_count() <= 1:
+        return fn(*args)
+    executor = get_executor()
+    pending = _pending
+    if not pending.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        pending.release()
+        _reset_executor()
+        raise HashingBusy()
+    future.add_done_callback(lambda _: pending.release())
+    try:
+        return future.result(timeout=getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 10))
+    except FutureTimeoutError:
+        future.cancel()
+        raise HashingBusy()
+    except BrokenProcessPool:
+        _reset_executor()
+        raise HashingBusy()
+
+
+def hash_password(password):
+    """
+    make_password() on the pool. Empty passwords become unusable without a round trip.
+    """
+    if not password:
+        return make_password(None)
+    return _run_on_pool(_hash_one, password)
+
+
+def set_password(user, raw_password):
+    """
+    Pool-backed equivalent of user.set_password(); the caller still saves the user.
+    """
+    user.password = hash_password(raw_password)
+    user._password = raw_password  # Lets save() notify password validators, as set_password() does.
+
+
+def verify_password(user, raw_password):
+    """
+    Pool-backed equivalent of user.check_password(), including the hash upgrade on success.
+    """
+    if not raw_password or not user.has_usable_password():
+        return False
+    valid, needs_rehash = _run_on_pool(_verify_one, raw_password, user.password)
+    if valid and needs_rehash:
+        set_password(user, raw_password)
+        user.save(update_fields=['password'])
+    return valid
+
+
+def hash_passwords(passwords):
+    """
+    Hashes a batch of raw passwords in parallel, preserving order. None or '' produce an
+    unusable password without touching the pool. Jobs are fed to the pool a few at a time and
+    count against PASSWORD_HASHING_MAX_PENDING like interactive ones; a bulk import waits for a
+    free slot instead of failing, and always leaves at least one slot for logins and signups.
+    """
+    results = [make_password(None) if not password else None for password in passwords]
+    pending = [(index, password) for index, password in enumerate(passwords) if password]
+    if not pending:
+        return results
+    if worker_count() <= 1:
+        for index, password in pending:
+            results[index] = make_password(password)
+        return results
+    executor = get_executor()
+    admission, in_flight = _pending, _bulk_in_flight
+
+    def release(_):
+        admission.release()
+        in_flight.release()
+
+    futures = []
+    for index, password in pending:
+        in_flight.acquire()
+        admission.acquire()
+        try:
+            future = executor.submit(_hash_one, password)
+        except (BrokenProcessPool, RuntimeError):
+            release(None)
+            _reset_executor()
+            raise
+        future.add_done_callback(release)
+        futures.append((index, future))
+    for index, future in futures:
+        results[index] = future.result()
+    return results
@@ -0,0 +1,130 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Profile pictures arrive as multi-megabyte phone photos. Small WebP and JPEG variants are rendered
+# beside the original after upload, on a thread pool (Pillow releases the GIL while resizing and
+# encoding), so the request that uploaded the picture doesn't wait for them.
+
+logger = logging.getLogger(__name__)
+
+# (extension, Pillow format) of every size rendered; WebP first, as the preferred one.
+VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def variant_sizes():
+    # label -> edge in pixels; each variant is a centre-cropped square.
+    return _setting('PROFILE_PICTURE_VARIANTS', {'thumb': 128, 'medium': 512})
+
+
+def worker_count():
+    return _setting('PROFILE_PICTURE_WORKERS', 2)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix='profile-pictures')
+        return _executor
+
+
+def variant_url(picture, variants, label):
+    """
+    URL of the `label` variant of a profile picture, preferring WebP, from the names stored on the
+    profile row. Until the variants for the current picture exist, the original's URL.
+    """
+    if not picture:
+        return None
+    name = picture.name
+    if variants and variants.get('source') == name:
+        name = next((variants[key] for key in (f"{label}.{extension}" for extension, _ in VARIANT_FORMATS) if key in variants), name)
+    return picture.storage.url(name)
+
+
+def _render(image, edge, image_format):
+    resized = ImageOps.fit(image, (edge, edge), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    resized.save(buffer, image_format, quality=_setting('PROFILE_PICTURE_QUALITY', 80), optimize=image_format == 'JPEG')
+    return buffer.getvalue()
+
+
+def build_variants(model, pk, name):
+    """
+    Renders every variant of the picture `name` and records them on the profile. Identical pictures
+    share a blob, so variants that already exist beside it are reused rather than rendered again.
+    The profile is only updated if it still shows `name`; a newer upload has its own job.
+    """
+    field = model._meta.get_field('profile_picture')
+    storage = field.storage
+    sizes = variant_sizes()
+    wanted = {f"{label}.{extension}": (edge, image_format) for label, edge in sizes.items() for extension, image_format in VARIANT_FORMATS}
+    variants = {'source': name}
+    missing = {}
+    for suffix, spec in wanted.items():
+        derived = storage.derived_name(name, suffix)
+        if storage.exists(derived):
+            variants[suffix] = derived
+        else:
+            missing[suffix] = spec
+
+    if missing:
+        try:
+            with storage.open(name, 'rb') as handle:
+                image = Image.open(handle)
+                # Lets the JPEG decoder downscale while decoding: far less memory for large photos.
+                image.draft('RGB', (max(sizes.values()) * 2,) * 2)
+                image = ImageOps.exif_transpose(image).convert('RGB')
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+            # Recorded without variants, so clients fall back to the original instead of retrying.
+            logger.warning("Could not render variants of %s: %s", name, e)
+            missing = {}
+        for suffix, (edge, image_format) in missing.items():
+            variants[suffix] = storage.save_derived(name, suffix, _render(image, edge, image_format))
+
+    model.objects.filter(pk=pk, profile_picture=name).update(profile_picture_variants=variants)
+    return variants
+
+
+def _build_in_worker(model, pk, name):
+    try:
+        build_variants(model, pk, name)
+    except Exception:
+        logger.exception("Rendering variants of %s failed", name)
+    finally:
+        connections.close_all()  # Pool threads outlive requests; don't leave their connections open.
+
+
+def schedule_variants(profile):
+    """
+    Queues variant rendering for the profile's current picture once the transaction commits.
+    With PROFILE_PICTURE_WORKERS = 0 the variants are rendered inline instead.
+    """
+    model, pk, name = type(profile), profile.pk, profile.profile_picture.name
+
+    def submit():
+        if worker_count() <= 0:
+            build_variants(model, pk, name)
+        else:
+            get_executor().submit(_build_in_worker, model, pk, name)
+    transaction.on_commit(submit)
+
+
+def needs_variants(profile):
+    # Loaded straight from __dict__ so a deferred field isn't fetched.
+    picture = profile.__dict__.get('profile_picture')
+    name = getattr(picture, 'name', picture)
+    variants = profile.__dict__.get('profile_picture_variants')
+    return bool(name) and variants is not None and variants.get('source') != name
@@ -0,0 +1,307 @@
+import csv
+import io
+from itertools import islice
+
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from content.models import Class as ContentClass
+from .authentication import token_cache
+from .hashing import hash_passwords
+from .models import CustomUser, ParentProfile, ParentStudentLink, StudentProfile, TeacherProfile
+
+try:
+    import openpyxl
+except ImportError:  # XLSX rosters are optional; CSV always works.
+    openpyxl = None
+
+ROSTER_COLUMNS = [
+    'username', 'email', 'password', 'role', 'full_name',
+    'admission_number', 'class_name', 'parent_email',
+]
+IMPORTABLE_ROLES = ('Student', 'Teacher', 'Parent')
+DEFAULT_CHUNK_SIZE = 500
+
+
+class RosterFormatError(Exception):
+    pass
+
+
+def _normalize(row):
+    return {key.strip().lower(): (str(value).strip() if value is not None else '') for key, value in row.items() if key}
+
+
+def iter_roster_rows(uploaded_file):
+    """
+    Yields one dict per data row from a CSV or XLSX upload without loading the whole file.
+    """
+    name = (uploaded_file.name or '').lower()
+    if name.endswith('.xlsx'):
+        if openpyxl is None:
+            raise RosterFormatError("XLSX rosters require the openpyxl package; upload a CSV instead.")
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip().lower() if cell is not None else '' for cell in next(rows, ())]
+            for values in rows:
+                if any(value is not None for value in values):
+                    yield _normalize(dict(zip(header, values)))
+        finally:
+            workbook.close()
+        return
+
+    text = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.DictReader(text):
+            yield _normalize(row)
+    except UnicodeDecodeError:
+        raise RosterFormatError("The roster must be UTF-8 encoded CSV or XLSX.")
+    finally:
+        text.detach()
+
+
+class RosterImport:
+    """
+    Validates and inserts a roster chunk by chunk: one existence query per chunk, passwords
+    hashed on the process pool, and bulk_create for users, profiles and parent links.
+    """
+    def __init__(self, school=None, dry_run=False, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.school = school
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self.rows_processed = 0
+        self.created = 0
+        self.errors = []
+        self._seen_usernames = set()
+        self._seen_admission_numbers = set()
+        self._parent_ids_by_email = {}
+        self._class_ids = {}
+        if school is not None:
+            self._class_ids = {name.lower(): pk for pk, name in ContentClass.objects.filter(school=school).values_list('id', 'name')}
+
+    def run(self, rows):
+        numbered = enumerate(rows, start=2)  # Row 1 is the header.
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                break
+            self.rows_processed += len(chunk)
+            valid = self._validate_chunk(chunk)
+            if valid and not self.dry_run:
+                self._persist_chunk(valid)
+        return self
+
+    def report(self):
+        return {
+            'dry_run': self.dry_run,
+            'rows_processed': self.rows_processed,
+            'created': self.created,
+            'error_count': len(self.errors),
+            'errors': self.errors,
+        }
+
+    def _error(self, line, row, errors):
+        self.errors.append({'row': line, 'username': row.get('username', ''), 'errors': errors})
+
+    def _validate_chunk(self, chunk):
+        usernames = {row.get('username') for _, row in chunk if row.get('username')}
+        existing = set(CustomUser.objects.filter(username__in=usernames).values_list('username', flat=True))
+        admission_numbers = {row.get('admission_number') for _, row in chunk if row.get('admission_number')}
+        taken_admissions = set()
+        if admission_numbers and self.school is not None:
+            taken_admissions = set(StudentProfile.objects.filter(school=self.school, admission_number__in=admission_numbers).values_list('admission_number', flat=True))
+
+        valid = []
+        for line, row in chunk:
+            errors = {}
+            username = row.get('username', '')
+            role = (row.get('role') or 'Student').capitalize()
+            if not username:
+                errors['username'] = "This field is required."
+            elif username in existing or username in self._seen_usernames:
+                errors['username'] = "A user with this username already exists."
+            else:
+                try:
+                    CustomUser._meta.get_field('username').run_validators(username)
+                except DjangoValidationError as e:
+                    errors['username'] = list(e.messages)
+            if role not in IMPORTABLE_ROLES:
+                errors['role'] = f"Invalid role. Choose from {', '.join(IMPORTABLE_ROLES)}."
+            for field in ('email', 'parent_email'):
+                if row.get(field):
+                    try:
+                        validate_email(row[field])
+                    except DjangoValidationError:
+                        errors[field] = "Enter a valid email address."
+            if row.get('password'):
+                try:
+                    validate_password(row['password'])
+                except DjangoValidationError as e:
+                    errors['password'] = list(e.messages)
+            admission_number = row.get('admission_number')
+            if role == 'Student' and admission_number:
+                if admission_number in taken_admissions or admission_number in self._seen_admission_numbers:
+                    errors['admission_number'] = "This admission number is already used in this school."
+            class_name = row.get('class_name')
+            if class_name and class_name.lower() not in self._class_ids:
+                errors['class_name'] = "No class with this name in the school."
+
+            if errors:
+                self._error(line, row, errors)
+                continue
+            self._seen_usernames.add(username)
+            if role == 'Student' and admission_number:
+                self._seen_admission_numbers.add(admission_number)
+            valid.append((line, {**row, 'role': role}))
+        return valid
+
+    def _persist_chunk(self, valid):
+        hashed = hash_passwords([row.get('password') for _, row in valid])
+        try:
+            with transaction.atomic():
+                users = CustomUser.objects.bulk_create([
+                    CustomUser(
+                        username=row['username'], email=row.get('email', ''), password=password,
+                        role=row['role'], school=self.school, is_active=True,
+                    )
+                    for (_, row), password in zip(valid, hashed)
+                ])
+                self._create_profiles(users, [row for _, row in valid])
+        except IntegrityError as e:
+            # A concurrent signup took one of the usernames; report the whole chunk rather than guess.
+            for line, row in valid:
+                self._error(line, row, {'non_field_errors': f"Chunk rolled back: {e}"})
+            return
+        self.created += len(users)
+
+    def _create_profiles(self, users, rows):
+        students, teachers, parents = [], [], []
+        for user, row in zip(users, rows):
+            common = {'user': user, 'full_name': row.get('full_name') or None}
+            if user.role == 'Student':
+                students.append(StudentProfile(
+                    school=self.school,
+                    enrolled_class_id=self._class_ids.get((row.get('class_name') or '').lower()),
+                    admission_number=row.get('admission_number') or None,
+                    parent_email_for_linking=row.get('parent_email') or None,
+                    **common,
+                ))
+            elif user.role == 'Teacher':
+                teachers.append(TeacherProfile(school=self.school, **common))
+            else:
+                parents.append(ParentProfile(**common))
+                if user.email:
+                    self._parent_ids_by_email[user.email.lower()] = user.id
+        StudentProfile.objects.bulk_create(students)
+        TeacherProfile.objects.bulk_create(teachers)
+        ParentProfile.objects.bulk_create(parents)
+
+        wanted = {profile.parent_email_for_linking.lower() for profile in students if profile.parent_email_for_linking}
+        missing = wanted - self._parent_ids_by_email.keys()
+        if missing:
+            parents_by_email = CustomUser.objects.annotate(email_lower=Lower('email')).filter(role='Parent', email_lower__in=missing)
+            for parent_id, email in parents_by_email.values_list('id', 'email'):
+                self._parent_ids_by_email.setdefault(email.lower(), parent_id)
+        links = [
+            ParentStudentLink(parent_id=self._parent_ids_by_email[profile.parent_email_for_linking.lower()], student_id=profile.user.id)
+            for profile in students
+            if profile.parent_email_for_linking and profile.parent_email_for_linking.lower() in self._parent_ids_by_email
+        ]
+        ParentStudentLink.objects.bulk_create(links, ignore_conflicts=True)
+        # bulk_create sends no signals, so drop cached auth contexts of parents who gained links here.
+        for parent_id in {link.parent_id for link in links}:
+            token_cache.invalidate_user(parent_id)
+
+
+class ParentLinkImport:
+    """
+    Links parents to students in bulk from rows of (parent_email or parent_username, admission_number).
+    Each chunk costs one student lookup on the (school, admission_number) index, one parent lookup,
+    one query for links that already exist and one bulk insert.
+    """
+    def __init__(self, school, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.school = school
+        self.chunk_size = chunk_size
+        self.rows_processed = 0
+        self.linked = 0
+        self.already_linked = 0
+        self.errors = []
+
+    def run(self, rows, first_row=2):
+        # Files number rows from 2 (row 1 is the header); JSON lists pass 0 to report list indexes.
+        numbered = enumerate(rows, start=first_row)
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                break
+            self.rows_processed += len(chunk)
+            self._link_chunk(chunk)
+        return self
+
+    def report(self):
+        return {
+            'rows_processed': self.rows_processed,
+            'linked': self.linked,
+            'already_linked': self.already_linked,
+            'error_count': len(self.errors),
+            'errors': self.errors,
+        }
+
+    def _link_chunk(self, chunk):
+        numbers = {row.get('admission_number') for _, row in chunk if row.get('admission_number')}
+        emails = {row['parent_email'].lower() for _, row in chunk if row.get('parent_email')}
+        usernames = {row['parent_username'] for _, row in chunk if row.get('parent_username')}
+
+        student_ids = dict(
+            StudentProfile.objects.filter(school=self.school, admission_number__in=numbers)
+            .values_list('admission_number', 'user_id')
+        )
+        parents_by_email, parents_by_username = {}, {}
+        if emails or usernames:
+            parents = (
+                CustomUser.objects.annotate(email_lower=Lower('email'))
+                .filter(Q(email_lower__in=emails) | Q(username__in=usernames), role='Parent')
+                .order_by('id').values_list('id', 'email_lower', 'username')
+            )
+            for parent_id, email, username in parents:
+                if email:
+                    parents_by_email.setdefault(email, parent_id)
+                parents_by_username[username] = parent_id
+
+        pairs = {}
+        for line, row in chunk:
+            errors = {}
+            student_id = student_ids.get(row.get('admission_number'))
+            if student_id is None:
+                errors['admission_number'] = "No student with this admission number in the school."
+            if row.get('parent_username'):
+                parent_id = parents_by_username.get(row['parent_username'])
+            else:
+                parent_id = parents_by_email.get((row.get('parent_email') or '').lower())
+            if parent_id is None:
+                errors['parent'] = "No parent account with this email or username."
+            if errors:
+                self.errors.append({'row': line, 'admission_number': row.get('admission_number', ''), 'errors': errors})
+            else:
+                pairs[(parent_id, student_id)] = line
+        if not pairs:
+            return
+
+        existing = set(
+            ParentStudentLink.objects.filter(
+                parent_id__in={parent_id for parent_id, _ in pairs}, student_id__in={student_id for _, student_id in pairs},
+            ).values_list('parent_id', 'student_id')
+        )
+        new_pairs = [pair for pair in pairs if pair not in existing]
+        ParentStudentLink.objects.bulk_create(
+            [ParentStudentLink(parent_id=parent_id, student_id=student_id) for parent_id, student_id in new_pairs],
+            ignore_conflicts=True,
+        )
+        self.linked += len(new_pairs)
+        self.already_linked += len(pairs) - len(new_pairs)
+        for parent_id in {parent_id for parent_id, _ in new_pairs}:
+            token_cache.invalidate_user(parent_id)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts import images
+from accounts.models import ParentProfile, StudentProfile, TeacherProfile
+
+
+class Command(BaseCommand):
+    help = "Renders missing profile picture variants, e.g. for pictures uploaded before variants existed."
+
+    def handle(self, *args, **options):
+        built = 0
+        for model in (StudentProfile, TeacherProfile, ParentProfile):
+            profiles = model.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+            for profile in profiles.only('pk', 'profile_picture', 'profile_picture_variants').iterator():
+                if images.needs_variants(profile):
+                    images.build_variants(model, profile.pk, profile.profile_picture.name)
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} profile pictures."))
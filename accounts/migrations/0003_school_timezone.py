@@ -0,0 +1,19 @@
+# Generated by Django 5.1.9 on 2026-10-19 12:00
+
+import accounts.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_school_admin_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='timezone',
+            field=models.CharField(default='UTC', help_text="IANA time zone used to bucket activity into the school's local days, e.g. 'Asia/Kolkata'.", max_length=64, validators=[accounts.models.validate_timezone_name]),
+        ),
+    ]
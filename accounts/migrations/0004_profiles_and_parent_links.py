@@ -0,0 +1,88 @@
+# Generated by Django 5.1.9 on 2026-10-19 14:00
+# Catches the migration history up with models that were added to models.py without one.
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_school_timezone'),
+        ('content', '0013_activeusersketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='is_school_admin',
+            field=models.BooleanField(default=False, help_text='Designates if this admin user manages a specific school.'),
+        ),
+        migrations.CreateModel(
+            name='ParentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_completed', models.BooleanField(default=False)),
+                ('full_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('mobile_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('profile_picture', models.ImageField(blank=True, null=True, upload_to='profile_pictures/parents/')),
+                ('user', models.OneToOneField(limit_choices_to={'role': 'Parent'}, on_delete=django.db.models.deletion.CASCADE, related_name='parent_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_completed', models.BooleanField(default=False)),
+                ('full_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('preferred_language', models.CharField(blank=True, default='en', max_length=10, null=True)),
+                ('father_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('mother_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('place_of_birth', models.CharField(blank=True, max_length=100, null=True)),
+                ('date_of_birth', models.DateField(blank=True, null=True)),
+                ('blood_group', models.CharField(blank=True, max_length=10, null=True)),
+                ('needs_assistant_teacher', models.BooleanField(default=False)),
+                ('admission_number', models.CharField(blank=True, max_length=50, null=True)),
+                ('parent_email_for_linking', models.EmailField(blank=True, help_text="Parent's email to verify and link account.", max_length=254, null=True)),
+                ('parent_mobile_for_linking', models.CharField(blank=True, max_length=20, null=True)),
+                ('parent_occupation', models.CharField(blank=True, max_length=100, null=True)),
+                ('hobbies', models.TextField(blank=True, null=True)),
+                ('favorite_sports', models.CharField(blank=True, max_length=255, null=True)),
+                ('interested_in_gardening_farming', models.BooleanField(default=False)),
+                ('nickname', models.CharField(blank=True, max_length=100, null=True)),
+                ('profile_picture', models.ImageField(blank=True, null=True, upload_to='profile_pictures/students/')),
+                ('enrolled_class', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='enrolled_students', to='content.class')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='accounts.school')),
+                ('user', models.OneToOneField(limit_choices_to={'role': 'Student'}, on_delete=django.db.models.deletion.CASCADE, related_name='student_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TeacherProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_completed', models.BooleanField(default=False)),
+                ('full_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('interested_in_tuition', models.BooleanField(default=False)),
+                ('mobile_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('profile_picture', models.ImageField(blank=True, null=True, upload_to='profile_pictures/teachers/')),
+                ('assigned_classes', models.ManyToManyField(blank=True, related_name='teachers_assigned', to='content.class')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='teachers', to='accounts.school')),
+                ('subject_expertise', models.ManyToManyField(blank=True, related_name='expert_teachers', to='content.subject')),
+                ('user', models.OneToOneField(limit_choices_to={'role': 'Teacher'}, on_delete=django.db.models.deletion.CASCADE, related_name='teacher_profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParentStudentLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parent', models.ForeignKey(limit_choices_to={'role': 'Parent'}, on_delete=django.db.models.deletion.CASCADE, related_name='parent_links', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(limit_choices_to={'role': 'Student'}, on_delete=django.db.models.deletion.CASCADE, related_name='student_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('parent', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.9 on 2026-10-19 15:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def deduplicate_admission_numbers(apps, schema_editor):
+    """
+    Blank admission numbers become NULL. Within a school, the oldest profile keeps a duplicated
+    number and the others get a "-dup<id>" suffix so an admin can spot and correct them.
+    Profiles without a school never collide and are left alone.
+    """
+    StudentProfile = apps.get_model('accounts', 'StudentProfile')
+    StudentProfile.objects.filter(admission_number='').update(admission_number=None)
+
+    duplicates = (
+        StudentProfile.objects.filter(school__isnull=False, admission_number__isnull=False)
+        .values('school_id', 'admission_number')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    max_length = StudentProfile._meta.get_field('admission_number').max_length
+    for group in duplicates:
+        profiles = StudentProfile.objects.filter(
+            school_id=group['school_id'], admission_number=group['admission_number'],
+        ).order_by('id')
+        for profile in profiles[1:]:
+            suffix = f"-dup{profile.pk}"
+            profile.admission_number = profile.admission_number[:max_length - len(suffix)] + suffix
+            profile.save(update_fields=['admission_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_profiles_and_parent_links'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_admission_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentprofile',
+            constraint=models.UniqueConstraint(fields=('school', 'admission_number'), name='uniq_student_admission_per_school'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.9 on 2026-10-19 16:00
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of accounts.models.normalize_school_name and accounts.search.name_trigrams (with the
+# default stop words) as they were when this migration was written, so later changes to the live
+# helpers or to SCHOOL_SEARCH_STOP_WORDS don't change what it does.
+STOP_WORDS = {
+    'school', 'schools', 'public', 'high', 'primary', 'secondary', 'senior', 'junior', 'academy',
+    'college', 'international', 'convent', 'the', 'of', 'and',
+}
+
+
+def normalize_school_name(name):
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return re.sub(r'[\W_]+', ' ', stripped.casefold()).strip()
+
+
+def name_trigrams(normalized):
+    grams = set()
+    for word in normalized.split():
+        if word in STOP_WORDS:
+            continue
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def backfill_search_index(apps, schema_editor):
+    School = apps.get_model('accounts', 'School')
+    SchoolNameTrigram = apps.get_model('accounts', 'SchoolNameTrigram')
+    schools = []
+    for school in School.objects.only('id', 'name').iterator():
+        school.normalized_name = normalize_school_name(school.name)
+        schools.append(school)
+    School.objects.bulk_update(schools, ['normalized_name'], batch_size=1000)
+    SchoolNameTrigram.objects.bulk_create(
+        [SchoolNameTrigram(school_id=school.id, trigram=gram) for school in schools for gram in name_trigrams(school.normalized_name)],
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_studentprofile_uniq_student_admission_per_school'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='normalized_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='SchoolNameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_trigrams', to='accounts.school')),
+            ],
+            options={
+                'unique_together': {('trigram', 'school')},
+            },
+        ),
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.9 on 2026-10-19 22:00
+
+import content.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_school_normalized_name_schoolnametrigram'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parentprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_blob_storage, upload_to='profile_pictures/parents/'),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_blob_storage, upload_to='profile_pictures/students/'),
+        ),
+        migrations.AlterField(
+            model_name='teacherprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_blob_storage, upload_to='profile_pictures/teachers/'),
+        ),
+    ]
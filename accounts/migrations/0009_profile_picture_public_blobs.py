@@ -0,0 +1,82 @@
+# Generated by Django 5.1.9 on 2026-10-20 10:00
+
+import os
+import shutil
+
+import content.storage
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+PROFILE_MODELS = ('StudentProfile', 'TeacherProfile', 'ParentProfile')
+
+
+def move_pictures_to_public_blobs(apps, schema_editor):
+    """
+    Copies existing profile pictures and their variants from blobs/ into blobs/public/ and points
+    the profiles and reference counts at the copies. Copied rather than moved, since a book may
+    share the blob; `manage.py collect_blobs` removes the old copy once nothing references it.
+    """
+    StoredBlob = apps.get_model('content', 'StoredBlob')
+    prefix = getattr(settings, 'BLOB_STORAGE_PREFIX', 'blobs') + '/'
+    public = prefix + 'public/'
+
+    def public_name(name):
+        return public + name[len(prefix):] if name.startswith(prefix) and not name.startswith(public) else name
+
+    def copy_with_derived(name):
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        directory, filename = os.path.split(source)
+        stem = os.path.splitext(filename)[0] + '.'
+        target_directory = os.path.dirname(os.path.join(settings.MEDIA_ROOT, public_name(name)))
+        os.makedirs(target_directory, exist_ok=True)
+        for entry in os.listdir(directory):
+            if entry == filename or entry.startswith(stem):
+                shutil.copy2(os.path.join(directory, entry), os.path.join(target_directory, entry))
+
+    copied = set()
+    for model_name in PROFILE_MODELS:
+        Profile = apps.get_model('accounts', model_name)
+        profiles = Profile.objects.filter(profile_picture__startswith=prefix).exclude(profile_picture__startswith=public)
+        for profile in profiles.iterator():
+            old = profile.profile_picture.name
+            new = public_name(old)
+            if old not in copied:
+                if not os.path.exists(os.path.join(settings.MEDIA_ROOT, old)):
+                    continue  # Nothing to copy; the profile keeps its (broken) name.
+                copy_with_derived(old)
+                copied.add(old)
+            profile.profile_picture = new
+            profile.profile_picture_variants = {key: public_name(value) for key, value in (profile.profile_picture_variants or {}).items()}
+            profile.save(update_fields=['profile_picture', 'profile_picture_variants'])
+
+            StoredBlob.objects.filter(name=old).update(ref_count=F('ref_count') - 1)
+            blob, _ = StoredBlob.objects.get_or_create(name=new, defaults={'size': os.path.getsize(os.path.join(settings.MEDIA_ROOT, new))})
+            StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_profile_picture_variants'),
+        ('content', '0017_storedblob_book_file_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parentprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_public_blob_storage, upload_to='profile_pictures/parents/'),
+        ),
+        migrations.AlterField(
+            model_name='studentprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_public_blob_storage, upload_to='profile_pictures/students/'),
+        ),
+        migrations.AlterField(
+            model_name='teacherprofile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=content.storage.get_public_blob_storage, upload_to='profile_pictures/teachers/'),
+        ),
+        migrations.RunPython(move_pictures_to_public_blobs, migrations.RunPython.noop),
+    ]
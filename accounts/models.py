@@ -1,7 +1,29 @@
 
+import re
+import unicodedata
+import zoneinfo
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from content.storage import get_public_blob_storage
+
+
+def validate_timezone_name(value):
+    if value not in zoneinfo.available_timezones():
+        raise ValidationError(f"'{value}' is not a valid IANA time zone name.")
+
+
+def normalize_school_name(name):
+    """
+    Search key for a school name: accents stripped, case-folded, punctuation collapsed to single spaces.
+    """
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return re.sub(r'[\W_]+', ' ', stripped.casefold()).strip()
 
 # Forward declaration for School model if needed, or ensure it's defined before use
 # For simplicity, we'll ensure School is defined before CustomUser uses it as ForeignKey.
@@ -24,10 +46,34 @@ class School(models.Model):
         related_name='administered_school',
         help_text="The primary admin user for this school, created during registration."
     )
+    timezone = models.CharField(max_length=64, default=settings.TIME_ZONE, validators=[validate_timezone_name], help_text="IANA time zone used to bucket activity into the school's local days, e.g. 'Asia/Kolkata'.")
+    # Maintained from `name` on save; the B-tree index serves prefix searches as range scans.
+    normalized_name = models.CharField(max_length=255, db_index=True, editable=False, default='')
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_school_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+
+    def local_date(self, when=None):
+        return local_date_for(self.timezone, when)
+
+
+def local_date_for(tz_name, when=None):
+    """
+    Calendar date of `when` (default: now) in the given time zone, falling back to settings.TIME_ZONE.
+    """
+    try:
+        tz = zoneinfo.ZoneInfo(tz_name) if tz_name else timezone.get_default_timezone()
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        tz = timezone.get_default_timezone()
+    return timezone.localtime(when or timezone.now(), tz).date()
+
 class CustomUser(AbstractUser):
     ROLE_CHOICES = [
         ('Student', 'Student'),
@@ -42,6 +88,20 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def save(self, **kwargs):
+        # Users built from signed access-token claims (accounts/tokens.py) hold role, school and
+        # flags as of issue time. Write back only the claimed fields a view actually changed, so a
+        # plain save() can't undo a demotion made since the token was issued.
+        claims = getattr(self, 'token_claims', None)
+        if claims is not None and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and (field.attname not in claims or getattr(self, field.attname) != claims[field.attname])
+            ]
+        super().save(**kwargs)
+
 class StudentProfile(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='student_profile', limit_choices_to={'role': 'Student'})
     profile_completed = models.BooleanField(default=False)
@@ -63,14 +123,23 @@ class StudentProfile(models.Model):
     favorite_sports = models.CharField(max_length=255, blank=True, null=True)
     interested_in_gardening_farming = models.BooleanField(default=False)
     nickname = models.CharField(max_length=100, blank=True, null=True)
-    profile_picture = models.ImageField(upload_to='profile_pictures/students/', null=True, blank=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures/students/', storage=get_public_blob_storage, null=True, blank=True)
+    # Resized variants of profile_picture, written by accounts.images: {'source': name, 'thumb.webp': name, ...}
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
 
 
     class Meta:
-        # Ensure admission_number is unique per school. Requires custom validation or a more complex setup.
-        # For now, we'll rely on application logic to enforce this uniqueness.
-        # unique_together = (('school', 'admission_number'),) # If admission_number cannot be null with school
-        pass
+        constraints = [
+            # Also the index behind parent linking by (school, admission number). NULLs never collide,
+            # so students without an admission number are unaffected.
+            models.UniqueConstraint(fields=['school', 'admission_number'], name='uniq_student_admission_per_school'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.admission_number is not None:
+            # Blank numbers are stored as NULL so they don't collide under the unique constraint.
+            self.admission_number = self.admission_number.strip() or None
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username}'s Profile ({self.full_name or 'N/A'})"
@@ -85,7 +154,9 @@ class TeacherProfile(models.Model):
     interested_in_tuition = models.BooleanField(default=False)
     mobile_number = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
-    profile_picture = models.ImageField(upload_to='profile_pictures/teachers/', null=True, blank=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures/teachers/', storage=get_public_blob_storage, null=True, blank=True)
+    # Resized variants of profile_picture, written by accounts.images: {'source': name, 'thumb.webp': name, ...}
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user.username}'s Teacher Profile ({self.full_name or 'N/A'})"
@@ -96,7 +167,9 @@ class ParentProfile(models.Model):
     full_name = models.CharField(max_length=255, blank=True, null=True)
     mobile_number = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
-    profile_picture = models.ImageField(upload_to='profile_pictures/parents/', null=True, blank=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures/parents/', storage=get_public_blob_storage, null=True, blank=True)
+    # Resized variants of profile_picture, written by accounts.images: {'source': name, 'thumb.webp': name, ...}
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     # child_admission_id for linking will be handled via ParentStudentLink model and application logic.
 
     def __str__(self):
@@ -112,3 +185,18 @@ class ParentStudentLink(models.Model):
 
     def __str__(self):
         return f"{self.parent.username} is parent of {self.student.username}"
+
+
+class SchoolNameTrigram(models.Model):
+    """
+    Trigram postings for fuzzy school search (see accounts.search); rebuilt whenever a school's name changes.
+    """
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='name_trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        # Leading with trigram makes this the covering index for "which schools share these trigrams".
+        unique_together = ('trigram', 'school')
+
+    def __str__(self):
+        return f"{self.trigram!r} -> {self.school_id}"
@@ -55,3 +55,13 @@ class IsAdminOfThisSchoolOrPlatformStaff(permissions.BasePermission):
         if request.user.role == 'Admin' and request.user.is_school_admin and obj.admin_user == request.user:
             return True
         return False
+
+class IsSchoolAdminOrPlatformStaff(permissions.BasePermission):
+    """
+    Allows access to platform staff and to school admins who are attached to a school.
+    """
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        return user.is_staff or (user.role == 'Admin' and user.is_school_admin and user.school_id is not None)
@@ -0,0 +1,103 @@
+from hashlib import blake2b
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import School, SchoolNameTrigram, normalize_school_name
+
+CACHE_VERSION_KEY = 'school-search:version'
+MAX_LIMIT = 20
+SIMILARITY_THRESHOLD = 0.3  # pg_trgm's default cut-off for the % operator
+# Words shared by most school names would give huge trigram posting lists for no ranking signal.
+DEFAULT_STOP_WORDS = {
+    'school', 'schools', 'public', 'high', 'primary', 'secondary', 'senior', 'junior', 'academy',
+    'college', 'international', 'convent', 'the', 'of', 'and',
+}
+RESULT_FIELDS = ('id', 'name', 'school_id_code')
+
+
+def _stop_words():
+    return getattr(settings, 'SCHOOL_SEARCH_STOP_WORDS', DEFAULT_STOP_WORDS)
+
+
+def name_trigrams(normalized):
+    """
+    Trigrams of each word padded with one space on either side. Unlike pg_trgm there is no
+    two-space "  x" gram: with only 26-odd values each would match a large share of all schools.
+    """
+    grams = set()
+    for word in normalized.split():
+        if word in _stop_words():
+            continue
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def index_school(school):
+    SchoolNameTrigram.objects.filter(school=school).delete()
+    SchoolNameTrigram.objects.bulk_create(
+        [SchoolNameTrigram(school=school, trigram=gram) for gram in name_trigrams(school.normalized_name)],
+        ignore_conflicts=True,
+    )
+
+
+def invalidate_cache():
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, 2, None)
+
+
+def _prefix_matches(prefix, limit):
+    # A range scan on the normalized_name index; LIKE 'x%' can't use a plain B-tree on every backend.
+    return list(
+        School.objects.filter(normalized_name__gte=prefix, normalized_name__lt=prefix + '\U0010ffff')
+        .order_by('normalized_name').values(*RESULT_FIELDS)[:limit]
+    )
+
+
+def _fuzzy_matches(normalized, limit, exclude_ids):
+    grams = name_trigrams(normalized)
+    if not grams:
+        return []
+    candidate_count = limit * 5
+    candidates = (
+        SchoolNameTrigram.objects.filter(trigram__in=grams).exclude(school_id__in=exclude_ids)
+        .values('school_id').annotate(shared=Count('id'))
+        .filter(shared__gte=max(1, len(grams) // 3)).order_by('-shared')[:candidate_count]
+    )
+    shared = {row['school_id']: row['shared'] for row in candidates}
+    if not shared:
+        return []
+    schools = School.objects.filter(pk__in=shared).values(*RESULT_FIELDS, 'normalized_name')
+    scored = []
+    for school in schools:
+        # Trigram similarity (shared / union), the same measure pg_trgm uses.
+        union = len(grams) + len(name_trigrams(school.pop('normalized_name'))) - shared[school['id']]
+        scored.append((shared[school['id']] / union if union else 0, school))
+    scored = [item for item in scored if item[0] >= SIMILARITY_THRESHOLD]
+    scored.sort(key=lambda item: (-item[0], item[1]['name']))
+    return [school for _, school in scored[:limit]]
+
+
+def search_schools(query, limit=10):
+    """
+    Typeahead search: schools whose normalized name starts with the query, topped up with trigram
+    matches when there are fewer than `limit` (so typos still find something). Cached per query
+    until any school is saved or deleted.
+    """
+    normalized = normalize_school_name(query)
+    limit = max(1, min(limit, MAX_LIMIT))
+    if not normalized:
+        return []
+    version = cache.get_or_set(CACHE_VERSION_KEY, 1, None)
+    key = f"school-search:{version}:{limit}:{blake2b(normalized.encode(), digest_size=16).hexdigest()}"
+    results = cache.get(key)
+    if results is None:
+        results = _prefix_matches(normalized, limit)
+        if len(results) < limit and len(normalized) >= 3:
+            results += _fuzzy_matches(normalized, limit - len(results), [school['id'] for school in results])
+        cache.set(key, results, getattr(settings, 'SCHOOL_SEARCH_CACHE_SECONDS', 300))
+    return results
@@ -1,10 +1,12 @@
 
 from rest_framework import serializers
+from rest_framework.authtoken.serializers import AuthTokenSerializer
 from .models import CustomUser, ParentStudentLink, School, StudentProfile, TeacherProfile, ParentProfile
 from content.models import Class as ContentClass, Subject as ContentSubject # Avoid naming collision
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from . import hashing, images
 
 class SchoolSerializer(serializers.ModelSerializer):
     admin_username = serializers.CharField(write_only=True, required=True)
@@ -16,7 +18,7 @@ class SchoolSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'name', 'school_id_code', 'license_number', 'official_email', 
             'phone_number', 'address', 'principal_full_name', 'principal_contact_number', 
-            'principal_email', 'admin_user', 
+            'principal_email', 'timezone', 'admin_user', 
             'admin_username', 'admin_email', 'admin_password'
         ]
         read_only_fields = ['admin_user'] 
@@ -62,15 +64,34 @@ class SchoolSerializer(serializers.ModelSerializer):
         
         return school
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+class ProfilePictureVariantsMixin(serializers.Serializer):
+    # The variants' names are read from the profile row itself, so listings cost no extra query.
+    profile_picture_thumb_url = serializers.SerializerMethodField()
+    profile_picture_medium_url = serializers.SerializerMethodField()
+
+    def _variant_url(self, obj, label):
+        url = images.variant_url(obj.profile_picture, obj.profile_picture_variants, label)
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_profile_picture_thumb_url(self, obj):
+        return self._variant_url(obj, 'thumb')
+
+    def get_profile_picture_medium_url(self, obj):
+        return self._variant_url(obj, 'medium')
+
+
+class StudentProfileSerializer(ProfilePictureVariantsMixin, serializers.ModelSerializer):
     enrolled_class_name = serializers.CharField(source='enrolled_class.name', read_only=True, allow_null=True)
     school_name = serializers.CharField(source='school.name', read_only=True, allow_null=True)
     profile_picture_url = serializers.SerializerMethodField()
 
     class Meta:
         model = StudentProfile
-        fields = '__all__' 
-        read_only_fields = ['user', 'profile_picture_url', 'school_name', 'enrolled_class_name']
+        exclude = ['profile_picture_variants']
+        read_only_fields = ['user', 'profile_picture_url', 'profile_picture_thumb_url', 'profile_picture_medium_url', 'school_name', 'enrolled_class_name']
         extra_kwargs = {
             'school': {'required': False, 'allow_null': True},
             'enrolled_class': {'required': False, 'allow_null': True},
@@ -86,7 +107,7 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         return None
 
 
-class TeacherProfileSerializer(serializers.ModelSerializer):
+class TeacherProfileSerializer(ProfilePictureVariantsMixin, serializers.ModelSerializer):
     school_name = serializers.CharField(source='school.name', read_only=True, allow_null=True)
     assigned_classes_details = serializers.SerializerMethodField()
     subject_expertise_details = serializers.SerializerMethodField()
@@ -94,8 +115,8 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TeacherProfile
-        fields = '__all__'
-        read_only_fields = ['user', 'profile_picture_url', 'school_name', 'assigned_classes_details', 'subject_expertise_details']
+        exclude = ['profile_picture_variants']
+        read_only_fields = ['user', 'profile_picture_url', 'profile_picture_thumb_url', 'profile_picture_medium_url', 'school_name', 'assigned_classes_details', 'subject_expertise_details']
         extra_kwargs = {
             'school': {'required': False, 'allow_null': True},
             'assigned_classes': {'required': False},
@@ -118,12 +139,12 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
         return None
 
 
-class ParentProfileSerializer(serializers.ModelSerializer):
+class ParentProfileSerializer(ProfilePictureVariantsMixin, serializers.ModelSerializer):
     profile_picture_url = serializers.SerializerMethodField()
     class Meta:
         model = ParentProfile
-        fields = '__all__'
-        read_only_fields = ['user', 'profile_picture_url']
+        exclude = ['profile_picture_variants']
+        read_only_fields = ['user', 'profile_picture_url', 'profile_picture_thumb_url', 'profile_picture_medium_url']
         extra_kwargs = {
             'profile_picture': {'write_only': True, 'required': False, 'allow_null':True},
         }
@@ -168,13 +189,16 @@ class CustomUserSerializer(serializers.ModelSerializer):
         return False 
 
     def create(self, validated_data):
-        user = CustomUser.objects.create_user(**validated_data)
+        password = validated_data.pop('password', None)
+        user = CustomUser(**validated_data)
+        hashing.set_password(user, password)
+        user.save()
         return user
 
     def update(self, instance, validated_data):
         password = validated_data.pop('password', None)
         if password:
-            instance.set_password(password)
+            hashing.set_password(instance, password)
         
         school = validated_data.pop('school', None) 
         if school:
@@ -198,24 +222,47 @@ class UserSignupSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"Invalid role. Choose from {', '.join(valid_roles)}.")
         return value
     
-    @transaction.atomic
     def create(self, validated_data):
-        user = CustomUser.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
+        # Hash on the pool before opening the transaction so it is not held open while waiting.
+        user = CustomUser(
+            username=CustomUser.normalize_username(validated_data['username']),
+            email=CustomUser.objects.normalize_email(validated_data['email']),
             role=validated_data['role'],
-            is_active=True 
+            is_active=True
         )
-        if user.role == 'Student':
-            StudentProfile.objects.create(user=user, profile_completed=False)
-        elif user.role == 'Teacher':
-            TeacherProfile.objects.create(user=user, profile_completed=False)
-        elif user.role == 'Parent':
-            ParentProfile.objects.create(user=user, profile_completed=False)
+        hashing.set_password(user, validated_data['password'])
+        with transaction.atomic():
+            user.save()
+            if user.role == 'Student':
+                StudentProfile.objects.create(user=user, profile_completed=False)
+            elif user.role == 'Teacher':
+                TeacherProfile.objects.create(user=user, profile_completed=False)
+            elif user.role == 'Parent':
+                ParentProfile.objects.create(user=user, profile_completed=False)
         return user
 
 
+class PooledAuthTokenSerializer(AuthTokenSerializer):
+    """
+    Same contract as DRF's AuthTokenSerializer, but the password check runs on the hashing pool
+    instead of through authenticate() on the request worker.
+    """
+    def validate(self, attrs):
+        username = attrs.get('username')
+        password = attrs.get('password')
+        if not (username and password):
+            raise serializers.ValidationError('Must include "username" and "password".', code='authorization')
+
+        user = CustomUser.objects.filter(username=username).first()
+        if user is None:
+            # Hash anyway so unknown usernames take as long as wrong passwords, as ModelBackend does.
+            hashing.hash_password(password)
+        elif hashing.verify_password(user, password) and user.is_active:
+            attrs['user'] = user
+            return attrs
+        raise serializers.ValidationError('Unable to log in with provided credentials.', code='authorization')
+
+
 class ParentStudentLinkSerializer(serializers.ModelSerializer):
     parent_username = serializers.CharField(source='parent.username', read_only=True)
     student_username = serializers.CharField(source='student.username', read_only=True)
@@ -255,6 +302,22 @@ class StudentProfileCompletionSerializer(serializers.ModelSerializer):
             'profile_picture', 'profile_completed'
         ]
         read_only_fields = ['user', 'school', 'enrolled_class'] 
+        # DRF can't build the (school, admission_number) validator when both school and school_id
+        # map to `school`; validate() checks it instead.
+        validators = []
+
+    def validate(self, attrs):
+        if 'admission_number' in attrs or 'school' in attrs:
+            instance = self.instance
+            school = attrs.get('school', instance.school if instance else None)
+            admission_number = attrs.get('admission_number', instance.admission_number if instance else None)
+            if school and admission_number:
+                clashes = StudentProfile.objects.filter(school=school, admission_number=admission_number.strip())
+                if instance is not None and instance.pk:
+                    clashes = clashes.exclude(pk=instance.pk)
+                if clashes.exists():
+                    raise serializers.ValidationError({"admission_number": "This admission number is already used in this school."})
+        return attrs
 
 class TeacherProfileCompletionSerializer(serializers.ModelSerializer):
     school_id = serializers.PrimaryKeyRelatedField(queryset=School.objects.all(), source='school', write_only=True, allow_null=True, required=False)
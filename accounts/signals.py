@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from content.storage import track_blob_fields
+
+from . import images, search
+from .authentication import token_cache
+from .models import CustomUser, ParentProfile, ParentStudentLink, School, StudentProfile, TeacherProfile
+
+for profile in (StudentProfile, TeacherProfile, ParentProfile):
+    track_blob_fields(profile, 'profile_picture')
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_save, sender=ParentProfile)
+def profile_picture_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'profile_picture' not in update_fields:
+        return
+    if images.needs_variants(instance):
+        images.schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate_token(instance.key, instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    # Covers password, role, activation and school changes alike.
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=StudentProfile)
+@receiver([post_save, post_delete], sender=TeacherProfile)
+@receiver([post_save, post_delete], sender=ParentProfile)
+def profile_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=ParentStudentLink)
+def parent_link_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.parent_id)
+
+
+@receiver(post_save, sender=School)
+def school_changed(sender, instance, update_fields=None, **kwargs):
+    # Cached users carry their School; school edits are rare enough to drop everything.
+    token_cache.clear()
+    if update_fields is None or 'name' in update_fields:
+        search.index_school(instance)
+    search.invalidate_cache()
+
+
+@receiver(post_delete, sender=School)
+def school_deleted(sender, **kwargs):
+    search.invalidate_cache()
@@ -1,3 +1,598 @@
-from django.test import TestCase
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core import signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from content.models import Class as ContentClass, Subject as ContentSubject
+from . import hashing, images, search, tokens
+from .authentication import ALL_REVOKED_KEY, USER_REVOKED_KEY, token_cache
+from .serializers import StudentProfileSerializer
+from .models import CustomUser, ParentStudentLink, School, StudentProfile, TeacherProfile, ParentProfile, normalize_school_name
+
+
+class CustomUserQueryBudgetTests(TestCase):
+    """
+    The user listing and /users/me/ must cost a fixed number of queries regardless of page size.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.classes = [ContentClass.objects.create(school=cls.school, name=f"Class {n}") for n in range(1, 4)]
+        cls.subjects = [ContentSubject.objects.create(class_obj=cls.classes[0], name=name) for name in ("Maths", "Science")]
+        cls.admin = CustomUser.objects.create_user(username="platform", password="x", role="Admin", is_staff=True)
+
+    def make_teachers(self, count, start=0):
+        for n in range(start, start + count):
+            user = CustomUser.objects.create_user(username=f"teacher{n}", password="x", role="Teacher", school=self.school)
+            profile = TeacherProfile.objects.create(user=user, school=self.school, full_name=f"Teacher {n}")
+            profile.assigned_classes.set(self.classes)
+            profile.subject_expertise.set(self.subjects)
+
+    def list_teachers(self, client, expected_results):
+        response = client.get('/api/users/', {'role': 'Teacher'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), expected_results)
+        return response
+
+    def test_teacher_listing_query_count_is_flat_in_page_size(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        self.make_teachers(2)
+        # count + users with profiles/schools joined + assigned classes + subject expertise
+        with self.assertNumQueries(4):
+            self.list_teachers(client, 2)
+
+        self.make_teachers(8, start=2)
+        with self.assertNumQueries(4):
+            response = self.list_teachers(client, 10)
+
+        teacher = response.data['results'][0]['teacher_profile']
+        self.assertEqual(len(teacher['assigned_classes_details']), 3)
+        self.assertEqual(len(teacher['subject_expertise_details']), 2)
+        self.assertEqual(teacher['school_name'], "Green Valley")
+
+    def test_me_endpoint_query_count(self):
+        student = CustomUser.objects.create_user(username="student", password="x", role="Student", school=self.school)
+        StudentProfile.objects.create(user=student, school=self.school, enrolled_class=self.classes[0], profile_completed=True)
+        parent = CustomUser.objects.create_user(username="parent", password="x", role="Parent")
+        ParentProfile.objects.create(user=parent)
+
+        for user in (student, parent):
+            token = Token.objects.create(user=user)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+            client.get('/api/users/me/')  # Warms the token cache.
+            # user with profiles/schools joined; authentication itself is served from the cache
+            with self.assertNumQueries(1):
+                response = client.get('/api/users/me/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['username'], user.username)
+
+        self.assertTrue(response.data['parent_profile'] is not None)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.parent = CustomUser.objects.create_user(username="parent", password="x", role="Parent")
+        ParentProfile.objects.create(user=cls.parent)
+        cls.students = [
+            CustomUser.objects.create_user(username=f"student{n}", password="x", role="Student", school=cls.school)
+            for n in range(2)
+        ]
+
+    def setUp(self):
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.parent)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def linked_streaks(self):
+        response = self.client.get('/api/streaks/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_warm_cache_needs_no_auth_queries(self):
+        ParentStudentLink.objects.create(parent=self.parent, student=self.students[0])
+        with self.assertNumQueries(3):  # token + user + profiles, linked students, streak count
+            self.linked_streaks()
+        with self.assertNumQueries(1):  # streak count only
+            self.linked_streaks()
+
+    def test_link_changes_and_token_deletion_invalidate(self):
+        self.linked_streaks()
+        link = ParentStudentLink.objects.create(parent=self.parent, student=self.students[1])
+        self.linked_streaks()
+        self.assertEqual(token_cache.get(self.token.key)[1].auth_context.linked_student_ids, (self.students[1].pk,))
+        link.delete()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        self.linked_streaks()
+        self.parent.set_password("changed")
+        self.parent.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+
+        self.linked_streaks()
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/streaks/').status_code, 401)
+
+    def test_revocations_in_other_processes_reach_this_one_through_the_shared_cache(self):
+        self.linked_streaks()
+        # Another worker logged the user out: its signal cleared its own copy and set the marker.
+        Token.objects.filter(pk=self.token.pk).update(key="0" * 40)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        cache.set(USER_REVOKED_KEY.format(self.parent.pk), time.time())
+        self.assertEqual(self.client.get('/api/streaks/').status_code, 401)
+
+        other = Token.objects.create(user=self.students[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {other.key}")
+        self.linked_streaks()
+        cache.set(ALL_REVOKED_KEY, time.time())
+        self.assertIsNone(token_cache.get(other.key))
+
+
+class ProfileUpdateQueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.class_obj = ContentClass.objects.create(school=cls.school, name="Class 1")
+        cls.student = CustomUser.objects.create_user(username="student", password="x", role="Student")
+        StudentProfile.objects.create(user=cls.student)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def update(self, payload):
+        response = self.client.patch(f'/api/users/{self.student.pk}/profile/', payload, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_profile_update_is_one_transaction_of_changed_fields(self):
+        payload = {
+            'email': 'student@gv.example', 'full_name': 'Sam Student', 'school_id': self.school.pk,
+            'enrolled_class_id': self.class_obj.pk, 'profile_completed': True,
+        }
+        # user with profiles joined, school, class, savepoint, user update, profile update, release
+        with self.assertNumQueries(7):
+            response = self.update(payload)
+        self.assertEqual(response.data['email'], 'student@gv.example')
+        self.assertEqual(response.data['school_name'], "Green Valley")
+        self.assertEqual(response.data['student_profile']['enrolled_class_name'], "Class 1")
+        self.assertTrue(response.data['profile_completed'])
+
+        profile = StudentProfile.objects.select_related('user').get(user=self.student)
+        self.assertEqual((profile.full_name, profile.school_id, profile.user.school_id), ('Sam Student', self.school.pk, self.school.pk))
+
+        # Resubmitting the same form writes nothing.
+        with self.assertNumQueries(3):
+            self.update({'full_name': 'Sam Student', 'email': 'student@gv.example'})
+
+
+def roster_file(*lines):
+    header = "username,email,password,role,full_name,admission_number,class_name,parent_email"
+    return SimpleUploadedFile("roster.csv", "\n".join((header,) + lines).encode(), content_type="text/csv")
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=1)
+class RosterImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        ContentClass.objects.create(school=cls.school, name="Class 1")
+        cls.head = CustomUser.objects.create_user(username="head", password="x", role="Admin", school=cls.school, is_school_admin=True)
+        CustomUser.objects.create_user(username="taken", password="x", role="Student", school=cls.school)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.head)
+
+    def upload(self, *lines, **data):
+        return self.client.post('/api/bulk-upload-users/', {'file': roster_file(*lines), **data}, format='multipart')
+
+    ROWS = (
+        "pat,pat@gv.example,Str0ng-pass!,Parent,Pat Parent,,,",
+        "ana,ana@gv.example,Str0ng-pass!,Student,Ana,A-1,class 1,PAT@gv.example",
+        "taken,,,Student,Dup,,,",
+        "bad,not-an-email,123,Wizard,,,Class 9,",
+        "ben,,,Student,Ben,A-1,,",
+    )
+
+    def test_dry_run_validates_without_writing(self):
+        response = self.upload(*self.ROWS, dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows_processed'], response.data['created'], response.data['error_count']), (5, 0, 3))
+        self.assertFalse(CustomUser.objects.filter(username__in=['pat', 'ana']).exists())
+
+    def test_rows_are_reported_individually_and_valid_rows_committed(self):
+        response = self.upload(*self.ROWS)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {4, 5, 6})
+        self.assertIn('username', errors[4])
+        self.assertEqual(set(errors[5]), {'email', 'password', 'role', 'class_name'})
+        self.assertIn('admission_number', errors[6])  # Same admission number as row 3.
+
+        ana = StudentProfile.objects.select_related('user', 'enrolled_class').get(user__username='ana')
+        self.assertEqual((ana.school, ana.enrolled_class.name, ana.admission_number), (self.school, "Class 1", "A-1"))
+        self.assertTrue(ana.user.check_password("Str0ng-pass!"))
+        self.assertTrue(ParentStudentLink.objects.filter(parent__username='pat', student=ana.user).exists())
+        self.assertTrue(ParentProfile.objects.filter(user__username='pat').exists())
+
+    def test_blank_password_gets_an_unusable_one(self):
+        self.upload("cal,,,Teacher,Cal,,,")
+        teacher = CustomUser.objects.get(username='cal')
+        self.assertFalse(teacher.has_usable_password())
+        self.assertTrue(TeacherProfile.objects.filter(user=teacher, school=self.school).exists())
+
+
+class BulkHashingAdmissionTests(TestCase):
+    def setUp(self):
+        hashing._reset_executor()
+        self.addCleanup(hashing._reset_executor)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=2, PASSWORD_HASHING_MAX_PENDING=4)
+    def test_bulk_hashing_stays_within_its_share_of_the_pool(self):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def slow_hash(password):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return f"hashed:{password}"
+
+        free_slots = []
+
+        def probe(password):
+            # While the bulk job runs, interactive work must still find a free admission slot.
+            acquired = hashing._pending.acquire(blocking=False)
+            if acquired:
+                hashing._pending.release()
+            free_slots.append(acquired)
+            return slow_hash(password)
+
+        with mock.patch.object(hashing, 'ProcessPoolExecutor', lambda max_workers, initializer: ThreadPoolExecutor(max_workers)), \
+                mock.patch.object(hashing, '_hash_one', probe):
+            results = hashing.hash_passwords([f"pw{n}" for n in range(20)] + [''])
+
+        self.assertEqual(results[:20], [f"hashed:pw{n}" for n in range(20)])
+        self.assertFalse(results[20].startswith('hashed:'))
+        self.assertLessEqual(peak[0], 2)
+        self.assertTrue(all(free_slots))
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=2, PASSWORD_HASHING_RETRY_AFTER=7)
+class HashingBackpressureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.create_user(username="sam", password="Str0ng-pass!", role="Student")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.executor = mock.Mock()
+        patcher = mock.patch.object(hashing, 'get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertBusy(self, pending):
+        with mock.patch.object(hashing, '_pending', pending):
+            for url, payload in (
+                ('/api/token-auth/', {'username': "sam", 'password': "Str0ng-pass!"}),
+                ('/api/signup/', {'username': "new", 'email': "new@gv.example", 'role': "Student", 'password': "Str0ng-pass!"}),
+            ):
+                response = self.client.post(url, payload)
+                self.assertEqual(response.status_code, 503, url)
+                self.assertEqual(response['Retry-After'], '7', url)
+        self.assertFalse(CustomUser.objects.filter(username="new").exists())
+
+    def test_full_admission_queue_fails_fast(self):
+        pending = threading.BoundedSemaphore(1)
+        pending.acquire()
+        self.assertBusy(pending)
+        self.executor.submit.assert_not_called()
+
+    @override_settings(PASSWORD_HASHING_TIMEOUT=0.01)
+    def test_slow_hash_times_out_and_frees_its_slot(self):
+        self.executor.submit.side_effect = lambda *args: Future()  # Never completes.
+        pending = threading.BoundedSemaphore(2)
+        self.assertBusy(pending)
+        # The timed-out jobs were cancelled, which released their slots.
+        self.assertTrue(pending.acquire(blocking=False) and pending.acquire(blocking=False))
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=1)
+class SignedTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.head = CustomUser.objects.create_user(username="head", password="Str0ng-pass!", role="Admin", school=cls.school, is_school_admin=True)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def obtain(self):
+        response = self.client.post('/api/token-auth/signed/', {'username': 'head', 'password': 'Str0ng-pass!'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def me(self, access):
+        return self.client.get('/api/users/me/', HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_access_token_authenticates_until_it_expires(self):
+        access = self.obtain()['access']
+        response = self.me(access)
+        self.assertEqual((response.status_code, response.data['username']), (200, 'head'))
+        with self.settings(SIGNED_ACCESS_TOKEN_LIFETIME=-1):
+            self.assertEqual(self.me(access).status_code, 401)
+
+    def test_tampered_tokens_are_rejected(self):
+        access = self.obtain()['access']
+        payload, _, signature = access.rpartition(':')
+        forged = signing.dumps({'uid': self.head.pk, 'su': True}, salt=tokens.ACCESS_SALT).rpartition(':')[0]
+        for token in (f"{payload}:{signature[:-1]}{'A' if signature[-1] != 'A' else 'B'}", f"{forged}:{signature}"):
+            self.assertEqual(self.me(token).status_code, 401)
+
+    def test_refresh_stops_working_after_a_password_change(self):
+        refresh = self.obtain()['refresh']
+        response = self.client.post('/api/token-auth/refresh/', {'refresh': refresh})
+        self.assertEqual(self.me(response.data['access']).status_code, 200)
+
+        self.head.set_password("An0ther-pass!")
+        self.head.save()
+        self.assertEqual(self.client.post('/api/token-auth/refresh/', {'refresh': refresh}).status_code, 401)
+        self.assertEqual(self.client.post('/api/token-auth/refresh/', {'refresh': 'garbage'}).status_code, 401)
+
+    def test_saving_a_claims_user_does_not_write_stale_claims_back(self):
+        user, _ = tokens.SignedTokenAuthentication().authenticate_credentials(tokens.issue_access_token(self.head))
+        CustomUser.objects.filter(pk=self.head.pk).update(is_school_admin=False, role='Teacher')
+
+        user.first_name = "Hana"
+        user.save()
+        self.head.refresh_from_db()
+        self.assertEqual((self.head.first_name, self.head.is_school_admin, self.head.role), ("Hana", False, 'Teacher'))
+
+        user.role = 'Parent'  # Changed on purpose, so it is written.
+        user.save()
+        self.head.refresh_from_db()
+        self.assertEqual((self.head.role, self.head.is_school_admin), ('Parent', False))
+
+
+class ParentLinkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.head = CustomUser.objects.create_user(username="head", password="x", role="Admin", school=cls.school, is_school_admin=True)
+        cls.students = []
+        for n in range(2):
+            student = CustomUser.objects.create_user(username=f"student{n}", password="x", role="Student", school=cls.school)
+            StudentProfile.objects.create(user=student, school=cls.school, admission_number=f"A-{n}")
+            cls.students.append(student)
+        cls.parent = CustomUser.objects.create_user(username="pat", email="Pat@gv.example", password="x", role="Parent")
+        ParentStudentLink.objects.create(parent=cls.parent, student=cls.students[1])
+
+    def test_duplicates_are_linked_once_and_existing_links_counted(self):
+        client = APIClient()
+        client.force_authenticate(self.head)
+        links = [
+            {'parent_email': 'pat@GV.example', 'admission_number': 'A-0'},
+            {'parent_username': 'pat', 'admission_number': 'A-0'},  # Same pair again within the upload.
+            {'parent_email': 'pat@gv.example', 'admission_number': 'A-1'},  # Already linked.
+            {'parent_email': 'nobody@gv.example', 'admission_number': 'A-9'},
+        ]
+        response = client.post('/api/parent-student-links/bulk-link/', {'links': links}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows_processed'], response.data['linked'], response.data['already_linked']), (4, 1, 1))
+        self.assertEqual(response.data['errors'], [{
+            'row': 3, 'admission_number': 'A-9',
+            'errors': {'admission_number': "No student with this admission number in the school.", 'parent': "No parent account with this email or username."},
+        }])
+        self.assertEqual(ParentStudentLink.objects.filter(parent=self.parent).count(), 2)
+
+        response = client.post('/api/parent-student-links/bulk-link/', {'links': links[:1]}, format='json')
+        self.assertEqual((response.data['linked'], response.data['already_linked']), (0, 1))
+
+
+class AdmissionNumberDeduplicationMigrationTests(TransactionTestCase):
+    before = [('accounts', '0004_profiles_and_parent_links')]
+    after = [('accounts', '0005_studentprofile_uniq_student_admission_per_school')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_suffixed_and_blanks_cleared(self):
+        apps = self.migrate(self.before)
+        School, User, Profile = (apps.get_model('accounts', name) for name in ('School', 'CustomUser', 'StudentProfile'))
+        schools = [School.objects.create(name=f"School {n}", school_id_code=f"S{n}", official_email=f"s{n}@example.com") for n in range(2)]
+        ids = []
+        for n, (school, number) in enumerate([(0, "A-1"), (0, "A-1"), (0, ""), (0, ""), (1, "A-1"), (None, "A-1")]):
+            user = User.objects.create(username=f"student{n}", role='Student')
+            ids.append(Profile.objects.create(user=user, school=schools[school] if school is not None else None, admission_number=number).pk)
+
+        apps = self.migrate(self.after)
+        numbers = dict(apps.get_model('accounts', 'StudentProfile').objects.values_list('id', 'admission_number'))
+        self.assertEqual([numbers[pk] for pk in ids], ["A-1", f"A-1-dup{ids[1]}", None, None, "A-1", "A-1"])
+
+
+class SchoolSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        names = ["Green Valley Public School", "Greenwood High", "Sainte-Thérèse Academy", "Riverside School"]
+        cls.schools = [
+            School.objects.create(name=name, school_id_code=f"S{n}", official_email=f"s{n}@example.com")
+            for n, name in enumerate(names)
+        ]
+
+    def setUp(self):
+        search.invalidate_cache()
+
+    def names(self, query, **params):
+        response = APIClient().get('/api/schools/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [school['name'] for school in response.data]
+
+    def test_prefix_matches_ignore_case_accents_and_punctuation(self):
+        self.assertEqual(self.names("GREEN"), ["Green Valley Public School", "Greenwood High"])
+        self.assertEqual(self.names("sainte therese"), ["Sainte-Thérèse Academy"])
+        self.assertEqual(self.names("green", limit=1), ["Green Valley Public School"])
+        self.assertEqual(self.names("  "), [])
+
+    def test_typos_fall_back_to_trigram_matches(self):
+        self.assertEqual(self.names("grene valley")[0], "Green Valley Public School")
+        # Stop words alone carry no signal.
+        self.assertEqual(self.names("xyz school"), [])
+
+    def test_renames_invalidate_cached_results(self):
+        self.assertEqual(self.names("riverside"), ["Riverside School"])
+        self.schools[3].name = "Lakeside School"
+        self.schools[3].save()
+        self.assertEqual(self.names("riverside"), [])
+        self.assertEqual(self.names("lakeside"), ["Lakeside School"])
+
+    def test_bad_limit_is_rejected(self):
+        self.assertEqual(APIClient().get('/api/schools/search/', {'q': 'green', 'limit': 'many'}).status_code, 400)
+
+    def test_migration_copies_match_the_current_helpers(self):
+        # The backfill migration keeps frozen copies; they must index existing schools the same way.
+        migration = importlib.import_module('accounts.migrations.0006_school_normalized_name_schoolnametrigram')
+        for school in self.schools:
+            normalized = normalize_school_name(school.name)
+            self.assertEqual(migration.normalize_school_name(school.name), normalized)
+            self.assertEqual(migration.name_trigrams(normalized), search.name_trigrams(normalized))
+
+
+class PublicProfilePictureMigrationTests(TransactionTestCase):
+    before = [('accounts', '0008_profile_picture_variants'), ('content', '0017_storedblob_book_file_storage')]
+    after = [('accounts', '0009_profile_picture_public_blobs')]
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def write(self, name, data=b"x"):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+
+    def test_pictures_and_variants_are_copied_under_public(self):
+        old, new = "blobs/ab/cd/abcd.jpg", "blobs/public/ab/cd/abcd.jpg"
+        with self.settings(MEDIA_ROOT=self.media_root):
+            apps = self.migrate(self.before)
+            self.write(old, b"picture")
+            self.write("blobs/ab/cd/abcd.thumb.webp")
+            user = apps.get_model('accounts', 'CustomUser').objects.create(username="sam", role='Student')
+            variants = {'source': old, 'thumb.webp': "blobs/ab/cd/abcd.thumb.webp"}
+            apps.get_model('accounts', 'StudentProfile').objects.create(user=user, profile_picture=old, profile_picture_variants=variants)
+            apps.get_model('content', 'StoredBlob').objects.create(name=old, size=7, ref_count=2)  # Shared with a book.
+
+            apps = self.migrate(self.after)
+            profile = apps.get_model('accounts', 'StudentProfile').objects.get()
+            self.assertEqual(profile.profile_picture.name, new)
+            self.assertEqual(profile.profile_picture_variants, {'source': new, 'thumb.webp': "blobs/public/ab/cd/abcd.thumb.webp"})
+            for name in (old, new, "blobs/public/ab/cd/abcd.thumb.webp"):
+                self.assertTrue(os.path.exists(os.path.join(self.media_root, name)), name)
+            counts = dict(apps.get_model('content', 'StoredBlob').objects.values_list('name', 'ref_count'))
+            self.assertEqual(counts, {old: 1, new: 1})
+
+
+def jpeg(name="photo.jpg", size=(800, 600)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(PROFILE_PICTURE_WORKERS=0, PROFILE_PICTURE_VARIANTS={'thumb': 64, 'medium': 256})
+class ProfilePictureVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = self.settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.student = CustomUser.objects.create_user(username="student", password="x", role="Student")
+
+    def upload(self, picture):
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = StudentProfile.objects.create(user=self.student, profile_picture=picture)
+        profile.refresh_from_db()
+        return profile
+
+    def test_variants_are_rendered_after_upload_and_exposed(self):
+        profile = self.upload(jpeg())
+        name = profile.profile_picture.name
+        self.assertEqual(set(profile.profile_picture_variants), {'source', 'thumb.webp', 'thumb.jpg', 'medium.webp', 'medium.jpg'})
+        self.assertEqual(profile.profile_picture_variants['source'], name)
+        with profile.profile_picture.storage.open(profile.profile_picture_variants['medium.jpg']) as handle:
+            self.assertEqual(Image.open(handle).size, (256, 256))
+        self.assertFalse(images.needs_variants(profile))
+
+        data = StudentProfileSerializer(profile).data
+        self.assertTrue(data['profile_picture_thumb_url'].endswith(profile.profile_picture_variants['thumb.webp']))
+        self.assertTrue(data['profile_picture_medium_url'].endswith(profile.profile_picture_variants['medium.webp']))
+
+    def test_identical_pictures_reuse_existing_variants(self):
+        first = self.upload(jpeg())
+        other = CustomUser.objects.create_user(username="other", password="x", role="Student")
+        with self.captureOnCommitCallbacks(execute=True):
+            second = StudentProfile.objects.create(user=other, profile_picture=jpeg("copy.jpg"))
+        second.refresh_from_db()
+        self.assertEqual(second.profile_picture_variants, first.profile_picture_variants)
+
+    def test_needs_variants_follows_the_current_picture(self):
+        profile = self.upload(jpeg())
+        profile.profile_picture_variants = {'source': "blobs/public/older.jpg"}
+        self.assertTrue(images.needs_variants(profile))
+        self.assertFalse(images.needs_variants(StudentProfile(user=self.student)))
+        # A deferred field isn't loaded just to answer.
+        deferred = StudentProfile.objects.only('pk').get(pk=profile.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(images.needs_variants(deferred))
+
+    def test_urls_fall_back_to_the_original(self):
+        profile = self.upload(SimpleUploadedFile("broken.jpg", b"not an image", content_type="image/jpeg"))
+        # Recorded without variants, so it isn't retried.
+        self.assertEqual(profile.profile_picture_variants, {'source': profile.profile_picture.name})
+        self.assertFalse(images.needs_variants(profile))
+        original = profile.profile_picture.url
+        self.assertEqual(images.variant_url(profile.profile_picture, profile.profile_picture_variants, 'medium'), original)
+        # Variants of a previous picture are never shown for the current one.
+        stale = {'source': "blobs/public/older.jpg", 'thumb.webp': "blobs/public/older.thumb.webp"}
+        self.assertEqual(images.variant_url(profile.profile_picture, stale, 'thumb'), original)
+        self.assertIsNone(images.variant_url(StudentProfile().profile_picture, None, 'thumb'))
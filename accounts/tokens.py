@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .authentication import AuthContext
+from .models import CustomUser, ParentStudentLink
+
+ACCESS_SALT = 'accounts.tokens.access'
+REFRESH_SALT = 'accounts.tokens.refresh'
+
+# Claim name -> CustomUser field loaded from it. Everything else on the user stays deferred.
+_USER_CLAIMS = {
+    'uid': 'id', 'usr': 'username', 'role': 'role', 'sid': 'school_id',
+    'adm': 'is_school_admin', 'stf': 'is_staff', 'su': 'is_superuser',
+}
+
+
+def access_lifetime():
+    return getattr(settings, 'SIGNED_ACCESS_TOKEN_LIFETIME', 300)
+
+
+def refresh_lifetime():
+    return getattr(settings, 'SIGNED_REFRESH_TOKEN_LIFETIME', 24 * 60 * 60)
+
+
+def _password_fingerprint(user):
+    # Changes whenever the password does, which revokes outstanding refresh tokens.
+    return user.get_session_auth_hash()[:16]
+
+
+def issue_access_token(user):
+    claims = {claim: getattr(user, field) for claim, field in _USER_CLAIMS.items()}
+    if user.role == 'Parent':
+        claims['lnk'] = list(ParentStudentLink.objects.filter(parent=user).values_list('student_id', flat=True))
+    return signing.dumps(claims, salt=ACCESS_SALT, compress=True)
+
+
+def issue_refresh_token(user):
+    return signing.dumps({'uid': user.pk, 'pwd': _password_fingerprint(user)}, salt=REFRESH_SALT, compress=True)
+
+
+def issue_token_pair(user):
+    return {
+        'access': issue_access_token(user),
+        'refresh': issue_refresh_token(user),
+        'token_type': SignedTokenAuthentication.keyword,
+        'expires_in': access_lifetime(),
+    }
+
+
+def user_for_refresh_token(refresh):
+    """
+    Returns the active user a refresh token was issued to, or raises AuthenticationFailed.
+    Unlike access tokens this does hit the database, so deactivation and password changes apply.
+    """
+    try:
+        claims = signing.loads(refresh, salt=REFRESH_SALT, max_age=refresh_lifetime())
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed(_('Refresh token expired.'))
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed(_('Invalid refresh token.'))
+    user = CustomUser.objects.filter(pk=claims.get('uid'), is_active=True).first()
+    if user is None or _password_fingerprint(user) != claims.get('pwd'):
+        raise exceptions.AuthenticationFailed(_('Invalid refresh token.'))
+    return user
+
+
+def user_from_claims(claims):
+    """
+    Builds the request user from access-token claims without a query. Unclaimed fields are
+    deferred, so reading them loads them lazily; save() writes back only fields that changed,
+    never a claim as it stood at issue time (see CustomUser.save).
+    """
+    loaded = {field: claims[claim] for claim, field in _USER_CLAIMS.items()}
+    loaded['is_active'] = True
+    # from_db() expects values in concrete field order.
+    field_names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in loaded]
+    user = CustomUser.from_db(DEFAULT_DB_ALIAS, field_names, [loaded[name] for name in field_names])
+    user.token_claims = loaded
+    user.auth_context = AuthContext(
+        role=user.role,
+        school_id=user.school_id,
+        student_profile_id=None,
+        teacher_profile_id=None,
+        parent_profile_id=None,
+        linked_student_ids=tuple(claims.get('lnk', ())),
+    )
+    return user
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Stateless authentication with HMAC-signed access tokens:
+
+        Authorization: Bearer <access token>
+
+    Verifying the signature and expiry needs no I/O. The trade-off is that an access token stays
+    valid until it expires (SIGNED_ACCESS_TOKEN_LIFETIME), so keep that short; role, school and
+    parent links are as of issue time.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+        return self.authenticate_credentials(token)
+
+    def authenticate_credentials(self, token):
+        try:
+            claims = signing.loads(token, salt=ACCESS_SALT, max_age=access_lifetime())
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed(_('Token expired.'))
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return user_from_claims(claims), token
+
+    def authenticate_header(self, request):
+        return self.keyword
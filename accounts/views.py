@@ -1,8 +1,11 @@
 
 from rest_framework import viewsets, status, generics, serializers as drf_serializers, permissions
 from rest_framework.generics import CreateAPIView
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.views import APIView
 from .models import CustomUser, ParentStudentLink, School, StudentProfile, TeacherProfile, ParentProfile
 from content.models import Class as ContentClass, Subject as ContentSubject, models as content_models # Import models
+from content.rosters import teacher_roster
 from rest_framework.decorators import action, api_view, permission_classes as dec_permission_classes, parser_classes
 import django_filters.rest_framework
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
@@ -11,10 +14,15 @@ from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .serializers import (
     CustomUserSerializer, UserSignupSerializer, ParentStudentLinkSerializer,
     SchoolSerializer, StudentProfileSerializer, TeacherProfileSerializer, ParentProfileSerializer,
-    StudentProfileCompletionSerializer, TeacherProfileCompletionSerializer, ParentProfileCompletionSerializer
+    StudentProfileCompletionSerializer, TeacherProfileCompletionSerializer, ParentProfileCompletionSerializer,
+    PooledAuthTokenSerializer
 )
-from .permissions import IsParent, IsTeacher, IsTeacherOrReadOnly, IsAdminOfThisSchoolOrPlatformStaff
+from .permissions import IsParent, IsTeacher, IsTeacherOrReadOnly, IsAdminOfThisSchoolOrPlatformStaff, IsSchoolAdminOrPlatformStaff
+from .importers import ParentLinkImport, RosterFormatError, RosterImport, iter_roster_rows
+from . import hashing, search as school_search, tokens
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
 
 
 class SchoolViewSet(viewsets.ModelViewSet):
@@ -30,17 +38,55 @@ class SchoolViewSet(viewsets.ModelViewSet):
             self.permission_classes = [permissions.IsAuthenticated, IsAdminOfThisSchoolOrPlatformStaff]
         elif self.action == 'destroy':
             self.permission_classes = [permissions.IsAdminUser] 
+        elif self.action == 'search':
+            self.permission_classes = [permissions.AllowAny] # Used by the registration page
         else: # list, retrieve
             self.permission_classes = [permissions.IsAuthenticatedOrReadOnly]
         return super().get_permissions()
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Typeahead: ?q=<text>&limit=<n, max 20>. Prefix matches on the normalized name first,
+        then fuzzy (trigram) matches for typos. Returns id, name and school_id_code only.
+        """
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+        return Response(school_search.search_schools(request.query_params.get('q', ''), limit))
+
 
 class CustomUserViewSet(viewsets.ModelViewSet):
-    queryset = CustomUser.objects.all().select_related('student_profile', 'teacher_profile', 'parent_profile', 'school', 'administered_school')
+    queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_fields = ['role', 'username', 'email', 'school'] 
     parser_classes = [MultiPartParser, FormParser] 
+    # role -> (completion serializer, reverse accessor, model) used by update_profile
+    profile_serializers = {
+        'Student': (StudentProfileCompletionSerializer, 'student_profile', StudentProfile),
+        'Teacher': (TeacherProfileCompletionSerializer, 'teacher_profile', TeacherProfile),
+        'Parent': (ParentProfileCompletionSerializer, 'parent_profile', ParentProfile),
+    }
+
+    def get_queryset(self):
+        # Everything CustomUserSerializer touches is joined or prefetched up front, so a page of
+        # users costs the same handful of queries whatever its size.
+        return CustomUser.objects.select_related(
+            'school', 'administered_school',
+            'student_profile__school', 'student_profile__enrolled_class',
+            'teacher_profile__school', 'parent_profile',
+        ).defer(
+            # The profile serializers show only the name of the profile's school and class. The
+            # profile columns themselves are all serialized, so they stay.
+            *_name_only('student_profile__school', School),
+            *_name_only('student_profile__enrolled_class', ContentClass),
+            *_name_only('teacher_profile__school', School),
+        ).prefetch_related(
+            Prefetch('teacher_profile__assigned_classes', queryset=ContentClass.objects.only('id', 'name')),
+            Prefetch('teacher_profile__subject_expertise', queryset=ContentSubject.objects.only('id', 'name')),
+        ).order_by('id')
 
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
@@ -60,88 +106,99 @@ class CustomUserViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='me', permission_classes=[IsAuthenticated])
     def me(self, request):
-        serializer = self.get_serializer(request.user, context=self.get_serializer_context())
+        user = self.get_queryset().get(pk=request.user.pk)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
     @action(detail=True, methods=['patch'], url_path='profile', permission_classes=[IsAuthenticated])
     def update_profile(self, request, pk=None):
+        """
+        Updates the account fields (username, email, password) and the role profile in one go.
+        Everything is validated before anything is written, all writes share one transaction and
+        touch only changed columns, and the response is built from the in-memory objects.
+        """
         user = self.get_object()
         if user != request.user and not request.user.is_staff: 
             raise PermissionDenied("You can only update your own profile or you lack staff permissions.")
 
-        profile_data_from_request = request.data.copy()
-        
-        custom_user_update_data = {}
-        if 'username' in profile_data_from_request and profile_data_from_request['username'] and profile_data_from_request['username'] != user.username:
-            username_val = profile_data_from_request.pop('username')
-            custom_user_update_data['username'] = (username_val[0] if isinstance(username_val, list) else username_val)
-        
-        if 'email' in profile_data_from_request and profile_data_from_request['email'] != user.email:
-            email_val = profile_data_from_request.pop('email')
-            custom_user_update_data['email'] = (email_val[0] if isinstance(email_val, list) else email_val) or ""
-
-
-        if 'password' in profile_data_from_request and profile_data_from_request['password']:
-            password_val = profile_data_from_request.pop('password')
-            custom_user_update_data['password'] = (password_val[0] if isinstance(password_val, list) else password_val)
-        
-        if custom_user_update_data:
-            print(f"DEBUG: custom_user_data_dict being sent to CustomUserSerializer: {custom_user_update_data}") # DEBUG
-            user_serializer = CustomUserSerializer(user, data=custom_user_update_data, partial=True, context=self.get_serializer_context())
-            if user_serializer.is_valid():
-                user_serializer.save()
-            else:
-                print(f"DEBUG: CustomUserSerializer errors: {user_serializer.errors}") # DEBUG
+        data = request.data
+        user_data = {}
+        if data.get('username') and data['username'] != user.username:
+            user_data['username'] = data['username']
+        if 'email' in data and data['email'] != user.email:
+            user_data['email'] = data['email'] or ""
+        if data.get('password'):
+            user_data['password'] = data['password']
+
+        context = self.get_serializer_context()
+        user_serializer = None
+        if user_data:
+            user_serializer = CustomUserSerializer(user, data=user_data, partial=True, context=context)
+            if not user_serializer.is_valid():
                 return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        profile_serializer_class = None
-        profile_instance = None
-        
-        # Use all remaining data for profile, including IDs for FKs/M2Ms
-        profile_specific_data = profile_data_from_request 
-        if 'profile_picture' in request.FILES:
-            profile_specific_data['profile_picture'] = request.FILES['profile_picture']
-
-        if user.role == 'Student':
-            profile_serializer_class = StudentProfileCompletionSerializer
-            profile_instance, _ = StudentProfile.objects.get_or_create(user=user)
-            if 'school_id' in profile_specific_data and profile_specific_data['school_id']:
-                try:
-                    user.school = School.objects.get(pk=profile_specific_data['school_id'])
-                    user.save(update_fields=['school'])
-                except School.DoesNotExist:
-                    pass # Serializer will catch invalid school_id
-        elif user.role == 'Teacher':
-            profile_serializer_class = TeacherProfileCompletionSerializer
-            profile_instance, _ = TeacherProfile.objects.get_or_create(user=user)
-            if 'school_id' in profile_specific_data and profile_specific_data['school_id']:
-                try:
-                    user.school = School.objects.get(pk=profile_specific_data['school_id'])
-                    user.save(update_fields=['school'])
-                except School.DoesNotExist:
-                    pass
-        elif user.role == 'Parent':
-            profile_serializer_class = ParentProfileCompletionSerializer
-            profile_instance, _ = ParentProfile.objects.get_or_create(user=user)
-        
-        if profile_serializer_class and profile_instance:
-            # For profile completion flows, ensure profile_completed is set to True
-            # This key should be present in the data if it's a completion form submission
-            # and the serializer should handle setting it on the profile_instance.
-            # If 'profile_completed' is not in profile_specific_data, it won't be updated unless serializer handles it
-            # For explicit setting from a completion page:
-            if request.path.endswith('/complete-profile/'): # Check if it's a completion endpoint
-                 profile_specific_data['profile_completed'] = True
-
-            profile_serializer = profile_serializer_class(profile_instance, data=profile_specific_data, partial=True, context=self.get_serializer_context())
-            if profile_serializer.is_valid():
-                profile_serializer.save()
-            else:
+        profile_serializer_class, profile_attr, profile_model = self.profile_serializers.get(user.role, (None, None, None))
+        profile = None
+        profile_serializer = None
+        if profile_serializer_class:
+            # Profiles were joined by get_queryset(); build one in memory if the user has none yet.
+            profile = getattr(user, profile_attr, None) or profile_model(user=user)
+            # Unrelated keys (username, email, ...) are ignored by the profile serializers.
+            profile_serializer = profile_serializer_class(profile, data=data, partial=True, context=context)
+            if not profile_serializer.is_valid():
                 return Response(profile_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        user.refresh_from_db() # Crucial to get updated related profile info for the response
-        final_user_serializer = CustomUserSerializer(user, context=self.get_serializer_context())
-        return Response(final_user_serializer.data, status=status.HTTP_200_OK)
+
+        # Hash before the transaction so it isn't held open while the hashing pool works.
+        new_password = user_serializer.validated_data.pop('password', None) if user_serializer else None
+        if new_password:
+            hashing.set_password(user, new_password)
+
+        with transaction.atomic():
+            user_fields = ['password'] if new_password else []
+            if user_serializer:
+                user_fields += _assign_changed(user, user_serializer.validated_data)
+            if profile_serializer:
+                profile_school = profile_serializer.validated_data.get('school')
+                if profile_school and profile_school.pk != user.school_id:
+                    # The profile's school is also the account's school.
+                    user.school = profile_school
+                    user_fields.append('school')
+            if user_fields:
+                user.save(update_fields=user_fields)
+
+            if profile_serializer:
+                validated = dict(profile_serializer.validated_data)
+                many_to_many = {
+                    field.name: validated.pop(field.name)
+                    for field in profile._meta.many_to_many if field.name in validated
+                }
+                profile_fields = _assign_changed(profile, validated)
+                if profile._state.adding:
+                    profile.save()
+                    setattr(user, profile_attr, profile)
+                elif profile_fields:
+                    profile.save(update_fields=profile_fields)
+                for name, values in many_to_many.items():
+                    getattr(profile, name).set(values)
+
+        return Response(CustomUserSerializer(user, context=context).data, status=status.HTTP_200_OK)
+
+
+def _name_only(relation, model):
+    # Lookups deferring every column of a joined model except its id and name.
+    return [f'{relation}__{field.name}' for field in model._meta.concrete_fields if field.name not in ('id', 'name')]
+
+
+def _assign_changed(instance, validated_data):
+    """
+    Sets the attributes that differ from the instance and returns their names for update_fields.
+    """
+    changed = []
+    for attr, value in validated_data.items():
+        if getattr(instance, attr) != value:
+            setattr(instance, attr, value)
+            changed.append(attr)
+    return changed
 
 
 class UserSignupView(CreateAPIView):
@@ -198,11 +255,14 @@ class ParentStudentLinkViewSet(viewsets.ModelViewSet):
             return Response({"error": "Student admission number and school ID code are required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            student_profile = StudentProfile.objects.get(
+            # school_id_code is unique and (school, admission_number) is indexed, so this is one indexed
+            # lookup; the joins also cover everything the response serializes.
+            student_profile = StudentProfile.objects.select_related('user', 'school', 'enrolled_class').get(
                 admission_number=student_admission_number,
                 school__school_id_code=student_school_id_code 
             )
-            if student_profile.parent_email_for_linking != parent_user.email:
+            linking_email = (student_profile.parent_email_for_linking or '').lower()
+            if not linking_email or linking_email != (parent_user.email or '').lower():
                  return Response({"error": "Parent email on student record does not match your email. Verification failed. Ensure the student has your email listed for linking."}, status=status.HTTP_403_FORBIDDEN)
 
             student_user = student_profile.user
@@ -222,26 +282,128 @@ class ParentStudentLinkViewSet(viewsets.ModelViewSet):
         return Response(response_data, status=status_code)
 
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsSchoolAdminOrPlatformStaff],
+            parser_classes=[MultiPartParser, FormParser, JSONParser], url_path='bulk-link')
+    def bulk_link(self, request):
+        """
+        Links a whole parent roster to students of one school. Send a CSV/XLSX 'file' with columns
+        parent_email (or parent_username) and admission_number, or JSON {"links": [{...}, ...]}.
+        Platform staff pass school_id; school admins always act on their own school.
+        """
+        user = request.user
+        school = user.school
+        if user.is_staff and request.data.get('school_id'):
+            school = School.objects.filter(pk=request.data['school_id']).first()
+        if school is None:
+            return Response({"school_id": "School not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = request.FILES.get('file')
+        first_row = 2
+        if upload is not None:
+            rows = iter_roster_rows(upload)
+        else:
+            first_row = 0
+            rows = request.data.get('links')
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                return Response({"error": "Upload a roster as 'file' or send a list of rows as 'links'."}, status=status.HTTP_400_BAD_REQUEST)
+            rows = ({key: str(value).strip() for key, value in row.items() if value is not None} for row in rows)
+
+        importer = ParentLinkImport(school)
+        try:
+            importer.run(rows, first_row=first_row)
+        except RosterFormatError as e:
+            return Response({"error": str(e), **importer.report()}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(importer.report(), status=status.HTTP_200_OK)
+
+
 class TeacherActionsViewSet(viewsets.ViewSet): 
     permission_classes = [IsAuthenticated, IsTeacher | IsAdminUser]
     @action(detail=False, methods=['get'])
     def my_classes(self, request):
+        # Assigned classes with student/subject/lesson counts, average completion and attention counts.
         teacher_profile = getattr(request.user, 'teacher_profile', None)
         if teacher_profile:
-            classes = teacher_profile.assigned_classes.all()
-            # Assuming ClassSerializer is available or using simple dict
-            return Response([{'id': c.id, 'name': c.name} for c in classes])
+            return Response(teacher_roster(teacher_profile))
         return Response([])
 
 
 @api_view(['POST'])
-@dec_permission_classes([IsAuthenticated, IsAdminUser]) 
+@dec_permission_classes([IsAuthenticated, IsSchoolAdminOrPlatformStaff])
 @parser_classes([MultiPartParser, FormParser])
 def bulk_upload_users(request):
-    # Placeholder for bulk user upload logic
-    # This would typically involve parsing a CSV/Excel file
-    return Response({"message": "Bulk user upload received (placeholder)."}, status=status.HTTP_200_OK)
+    """
+    Imports a CSV/XLSX roster (columns: username, email, password, role, full_name,
+    admission_number, class_name, parent_email). Pass dry_run=true to only validate.
+    Rows are validated and inserted in chunks; the response lists per-row errors.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"error": "Upload the roster as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+    school = user.school
+    if user.is_staff and request.data.get('school_id'):
+        school = School.objects.filter(pk=request.data['school_id']).first()
+        if school is None:
+            return Response({"school_id": "School not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+    dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+    importer = RosterImport(school=school, dry_run=dry_run)
+    try:
+        importer.run(iter_roster_rows(upload))
+    except RosterFormatError as e:
+        return Response({"error": str(e), **importer.report()}, status=status.HTTP_400_BAD_REQUEST)
+
+    report = importer.report()
+    status_code = status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED
+    return Response(report, status=status_code)
+
+
+class PooledObtainAuthToken(ObtainAuthToken):
+    """
+    Token login that verifies the password on the hashing pool; answers 503 with Retry-After when the pool is saturated.
+    """
+    serializer_class = PooledAuthTokenSerializer
+
+
+obtain_auth_token = PooledObtainAuthToken.as_view()
+
+
+class SignedTokenObtainView(APIView):
+    """
+    Issues a signed access/refresh token pair for username/password. Send the access token as
+    "Authorization: Bearer <access>"; it needs no database lookup until it expires.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = ()
 
+    def post(self, request, *args, **kwargs):
+        serializer = PooledAuthTokenSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        return Response(tokens.issue_token_pair(serializer.validated_data['user']))
 
 
-    
\ No newline at end of file
+class SignedTokenRefreshView(APIView):
+    """
+    Exchanges a refresh token for a new access token. Refresh tokens stop working once the
+    user is deactivated or changes password.
+    """
+    # No authenticators, so a stale access token sent along does not block the refresh.
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = ()
+
+    def get_authenticate_header(self, request):
+        return tokens.SignedTokenAuthentication.keyword  # Keeps refresh failures at 401.
+
+    def post(self, request, *args, **kwargs):
+        refresh = request.data.get('refresh')
+        if not refresh:
+            raise ValidationError({"refresh": "This field is required."})
+        user = tokens.user_for_refresh_token(refresh)
+        return Response({
+            'access': tokens.issue_access_token(user),
+            'token_type': tokens.SignedTokenAuthentication.keyword,
+            'expires_in': tokens.access_lifetime(),
+        })
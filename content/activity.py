@@ -0,0 +1,78 @@
+# Single entry point for learning activity. Views call these after recording an attempt or a
+# progress write, inside the same transaction, so every derived structure is updated in one place.
+from accounts.models import local_date_for
+from notifications import outbox, pubsub
+from . import rewards, risk, rollups, sketches
+from .gamification import LESSON_COMPLETED_POINTS, quiz_points, record_activity
+from .models import Reward
+from .rewards import ActivityEvent
+from .scoring import record_score
+
+
+def _streak_events(streak):
+    return [ActivityEvent('streak', streak.current_streak), ActivityEvent('points', streak.points)]
+
+
+def rewards_granted(user, reward_ids):
+    # Pushed to the student's stream so clients need not poll user-rewards, and queued as a notice.
+    # Called for rule grants below and, through a post_save signal, for rewards awarded by staff.
+    earned = list(Reward.objects.filter(pk__in=reward_ids).values('id', 'title', 'description', 'icon_name'))
+    pubsub.publish(pubsub.user_channel(user.id), 'rewards_granted', {'rewards': earned})
+    outbox.enqueue(
+        user, 'reward', f"You earned {len(earned)} new reward{'s' if len(earned) != 1 else ''}",
+        '\n'.join(f"{reward['title']}: {reward['description']}" for reward in earned),
+    )
+    return earned
+
+
+def _grant_rewards(user, events):
+    granted = rewards.evaluate(user, events)
+    if granted:
+        rewards_granted(user, granted)
+
+
+def _record(user, when, points, metrics):
+    # Streaks and rollups both bucket by the school's local day so "active today" agrees everywhere.
+    school_id, class_id, tz_name = rollups.activity_scope(user)
+    day = local_date_for(tz_name, when)
+    streak, first_today = record_activity(user, points=points, day=day)
+    if first_today and user.role == 'Student':
+        metrics = {**metrics, 'active_students': 1}
+        sketches.record_active_user(school_id, day, user.id)
+    rollups.append(school_id, class_id, day, metrics)
+    return streak, day, class_id
+
+
+def quiz_attempt_recorded(user, subject_id, score, passed, when, locked_until=None):
+    record_score(user.id, subject_id, score, when)
+    streak, day, class_id = _record(user, when, quiz_points(score, passed), {'quiz_attempts': 1, 'quizzes_passed': int(passed)})
+    if user.role == 'Student':
+        risk.quiz_attempt(user, class_id, day, score, passed, locked_until)
+    events = _streak_events(streak)
+    if passed:
+        events.append(ActivityEvent('quiz_score', score, subject_id))
+    pubsub.publish(pubsub.user_channel(user.id), 'quiz_result', {
+        'subject': subject_id, 'score': score, 'passed': passed, 'locked_until': locked_until,
+        'current_streak': streak.current_streak, 'points': streak.points,
+    })
+    _grant_rewards(user, events)
+
+
+def lesson_progress_recorded(user, progress, newly_completed):
+    points = LESSON_COMPLETED_POINTS if newly_completed else 0
+    streak, day, class_id = _record(user, progress.last_updated, points, {'lesson_progress': 1, 'lessons_completed': int(newly_completed)})
+    if user.role == 'Student':
+        risk.activity(user, class_id, day)
+    events = _streak_events(streak)
+    if newly_completed:
+        events.append(ActivityEvent('lesson_completed', None, progress.lesson.subject_id))
+    _grant_rewards(user, events)
+
+
+def note_saved(user, when):
+    if user.role == 'Student':
+        _, day, class_id = _record(user, when, 0, {'notes_saved': 1})
+        risk.activity(user, class_id, day)
+    else:
+        school_id, class_id, tz_name = rollups.activity_scope(user)
+        rollups.append(school_id, class_id, local_date_for(tz_name, when), {'notes_saved': 1})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Class, Subject, Lesson, Quiz, Question, Choice, Book, Reward, UserReward, ProcessedNote, UserLessonProgress, UserQuizAttempt, Checkpoint, AILessonQuizAttempt, UserNote, TranslatedLessonContent
+from .models import Class, Subject, Lesson, Quiz, Question, Choice, Book, Reward, RewardRule, UserReward, ProcessedNote, UserLessonProgress, UserQuizAttempt, Checkpoint, AILessonQuizAttempt, UserNote, TranslatedLessonContent, ScoreAccumulator, LearningStreak, DailyActivityRollup, ActiveUserSketch, StudentRiskSignal
 
 # Register your models here.
 admin.site.register(Class)
@@ -10,6 +10,7 @@ admin.site.register(Question)
 admin.site.register(Choice)
 admin.site.register(Book)
 admin.site.register(Reward)
+admin.site.register(RewardRule)
 admin.site.register(UserReward)
 admin.site.register(ProcessedNote)
 admin.site.register(UserLessonProgress)
@@ -18,3 +19,8 @@ admin.site.register(Checkpoint)
 admin.site.register(AILessonQuizAttempt)
 admin.site.register(UserNote)
 admin.site.register(TranslatedLessonContent)
+admin.site.register(ScoreAccumulator)
+admin.site.register(LearningStreak)
+admin.site.register(DailyActivityRollup)
+admin.site.register(ActiveUserSketch)
+admin.site.register(StudentRiskSignal)
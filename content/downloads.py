@@ -0,0 +1,155 @@
+import mimetypes
+import os
+import re
+from calendar import timegm
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .storage import blob_digest
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class PassthroughRenderer(JSONRenderer):
+    """
+    Lets file views answer any Accept header (PDF viewers send application/pdf). Files are returned
+    as plain HttpResponses and never reach a renderer; only errors (401, 403, 404) do, and those go
+    out as JSON whatever the client asked for.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return super().render(data, 'application/json', renderer_context)
+
+
+class RangeFile:
+    """
+    File-like view of `length` bytes starting at `start`. It has no fileno(), so servers stream it
+    in chunks instead of sendfile()-ing the whole file past the range.
+    """
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) for a single "bytes=" range, None to serve the whole file (no header, several
+    ranges, which RFC 9110 allows a server to ignore, or an invalid range such as "bytes=5-3",
+    which it says to ignore), or False if unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _validators(field_file, size):
+    digest = blob_digest(field_file.name)
+    if digest:  # Content-addressed: the name is the content's hash, a perfect strong validator.
+        return quote_etag(digest), None
+    try:
+        modified = field_file.storage.get_modified_time(field_file.name)
+    except (NotImplementedError, OSError):
+        return quote_etag(f"{size:x}"), None
+    timestamp = timegm(modified.utctimetuple())
+    return quote_etag(f"{size:x}-{timestamp:x}"), timestamp
+
+
+def _offload(field_file, content_type, filename):
+    mode = getattr(settings, 'PROTECTED_MEDIA_OFFLOAD', None)
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'PROTECTED_MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(field_file.name)
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    else:
+        return None
+    response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+def serve_file(request, field_file, filename=None):
+    """
+    Serves a FileField's file after the caller has checked access. With PROTECTED_MEDIA_OFFLOAD set,
+    the front server (nginx X-Accel-Redirect or Apache/lighttpd X-Sendfile) sends the bytes and
+    handles ranges itself. Otherwise FileResponse streams it: whole files go out through the
+    server's file wrapper (sendfile where available) and single byte ranges get a 206.
+    """
+    filename = filename or os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    offloaded = _offload(field_file, content_type, filename)
+    if offloaded is not None:
+        return offloaded
+
+    size = field_file.size
+    etag, last_modified = _validators(field_file, size)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range and if_range and if_range != etag and (last_modified is None or parse_http_date_safe(if_range) != last_modified):
+        byte_range = None  # The client's partial copy is stale; send it all.
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    file = field_file.storage.open(field_file.name, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type)
+        response.block_size = RANGE_CHUNK_SIZE
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = str(size)
+    response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    digest = blob_digest(field_file.name)
+    if digest and request.GET.get('v') == digest:
+        # A versioned URL always names these exact bytes, so the browser may keep it indefinitely.
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,307 @@
+import html
+import io
+import logging
+import os
+import posixpath
+import zipfile
+from datetime import timedelta
+from functools import reduce
+from html.parser import HTMLParser
+from operator import and_
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import Book, BookPage
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Optional: only needed to index PDFs.
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'content_bookpage_fts'
+# Snippet highlight markers: control characters can't occur in extracted text, so the snippet can
+# be HTML-escaped safely before they become <mark> tags.
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_WORDS = 24
+MAX_QUERY_TERMS = 8
+READ_BLOCK_SIZE = 64 * 1024
+CONTROL_CHARACTERS = dict.fromkeys(range(32), ' ')
+
+
+class UnsupportedBook(Exception):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _clean(text):
+    # Collapse layout whitespace (and control characters, which the snippet markers rely on being
+    # absent) and cap the page so one pathological page can't bloat the index.
+    return ' '.join(text.translate(CONTROL_CHARACTERS).split())[:_setting('BOOK_TEXT_MAX_PAGE_CHARS', 100_000)]
+
+
+def pdf_pages(handle, start=0):
+    """
+    Yields (page number, text) from page `start` + 1 on. pypdf reads objects from the file as
+    each page needs them, so the book is never loaded whole.
+    """
+    if PdfReader is None:
+        raise UnsupportedBook("Indexing PDFs needs the pypdf package.")
+    reader = PdfReader(handle)
+    for index in range(start, len(reader.pages)):
+        yield index + 1, reader.pages[index].extract_text() or ''
+
+
+class _TextParser(HTMLParser):
+    SKIPPED = {'script', 'style', 'head'}
+
+    def __init__(self, limit):
+        super().__init__()
+        self.parts, self.length, self.limit, self.skipping = [], 0, limit, 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping and self.length < self.limit:
+            self.parts.append(data)
+            self.length += len(data)
+
+
+def _html_text(member):
+    # Fed in blocks straight from the zip stream; the text kept is capped like a PDF page.
+    parser = _TextParser(_setting('BOOK_TEXT_MAX_PAGE_CHARS', 100_000))
+    with io.TextIOWrapper(member, encoding='utf-8', errors='replace') as text:
+        for block in iter(lambda: text.read(READ_BLOCK_SIZE), ''):
+            parser.feed(block)
+            if parser.length >= parser.limit:
+                break
+    parser.close()
+    return ' '.join(parser.parts)
+
+
+def epub_pages(handle, start=0):
+    """
+    Yields (chapter number, text) for each document in the EPUB's reading order (its spine),
+    from chapter `start` + 1 on. Chapters are decompressed one at a time.
+    """
+    namespaces = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container', 'opf': 'http://www.idpf.org/2007/opf'}
+    with zipfile.ZipFile(handle) as epub:
+        container = ElementTree.fromstring(epub.read('META-INF/container.xml'))
+        rootfile = container.find('container:rootfiles/container:rootfile', namespaces)
+        if rootfile is None:
+            raise UnsupportedBook("EPUB has no package document.")
+        package_path = rootfile.get('full-path')
+        package = ElementTree.fromstring(epub.read(package_path))
+        manifest = {item.get('id'): item.get('href') for item in package.iterfind('opf:manifest/opf:item', namespaces)}
+        spine = [manifest[ref.get('idref')] for ref in package.iterfind('opf:spine/opf:itemref', namespaces) if ref.get('idref') in manifest]
+        base = posixpath.dirname(package_path)
+        for number, href in enumerate(spine[start:], start + 1):
+            with epub.open(posixpath.normpath(posixpath.join(base, unquote(href)))) as member:
+                yield number, _html_text(member)
+
+
+EXTRACTORS = {'.pdf': pdf_pages, '.epub': epub_pages}
+
+
+def _lease_expired():
+    return Q(text_claimed_until__isnull=True) | Q(text_claimed_until__lt=timezone.now())
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=_setting('BOOK_TEXT_LEASE_SECONDS', 300))
+
+
+def pending_books():
+    # New or replaced files, plus interrupted runs whose worker has stopped renewing its lease.
+    return Book.objects.exclude(file='').filter(
+        ~Q(text_source=F('file')) | Q(text_status='indexing') & _lease_expired()
+    ).order_by('pk')
+
+
+def _claim(book, name):
+    """
+    Takes the book for this worker with a conditional UPDATE, so two workers never index the same
+    file: a new file against the indexing state that was read, a resumed run only once its lease
+    has expired. Returns the lease, or None if another worker got there first.
+    """
+    lease = _lease()
+    if book.text_source != name:
+        books = Book.objects.filter(pk=book.pk, text_source=book.text_source, text_status=book.text_status)
+    else:
+        books = Book.objects.filter(_lease_expired(), pk=book.pk, text_source=name, text_status='indexing')
+    claimed = books.update(text_source=name, text_status='indexing', text_claimed_until=lease)
+    return lease if claimed else None
+
+
+def _store(book, name, lease, batch):
+    """
+    Commits a batch of pages if this worker still holds the book, renewing its lease. Returns the
+    new lease, or None if the file was replaced or the lease lapsed and another worker took over.
+    """
+    renewed = _lease()
+    with transaction.atomic():
+        # The row stays locked until the pages are in, so a new claim can't slip in between.
+        if not Book.objects.filter(pk=book.pk, text_source=name, text_claimed_until=lease).update(text_claimed_until=renewed):
+            return None
+        BookPage.objects.bulk_create(batch)
+    return renewed
+
+
+def _finish(book, name, lease, status):
+    # Conditional on the file indexed and the lease held, in case either changed meanwhile.
+    Book.objects.filter(pk=book.pk, text_source=name, text_claimed_until=lease).update(text_status=status, text_claimed_until=None)
+
+
+def index_book(book):
+    """
+    Extracts the book's file into BookPage rows, committing every BOOK_TEXT_BATCH_SIZE pages. A new
+    file starts over; an interrupted run resumes after the last page it stored. Returns the number
+    of pages stored.
+    """
+    name = book.file.name
+    with transaction.atomic():
+        lease = _claim(book, name)
+        if lease is None:
+            return 0
+        if book.text_source != name:
+            BookPage.objects.filter(book=book).delete()
+            start = 0
+        else:
+            start = BookPage.objects.filter(book=book).aggregate(last=Max('number'))['last'] or 0
+
+    extractor = EXTRACTORS.get(os.path.splitext(name)[1].lower())
+    if extractor is None:
+        _finish(book, name, lease, 'unsupported')
+        return 0
+
+    batch_size = _setting('BOOK_TEXT_BATCH_SIZE', 20)
+    stored, batch = 0, []
+    try:
+        with book.file.storage.open(name, 'rb') as handle:
+            for number, text in extractor(handle, start):
+                text = _clean(text)
+                if text:  # Scanned pages have no text layer.
+                    batch.append(BookPage(book_id=book.pk, number=number, text=text))
+                if len(batch) >= batch_size:
+                    lease = _store(book, name, lease, batch)
+                    if lease is None:
+                        return stored
+                    stored += len(batch)
+                    batch = []
+        lease = _store(book, name, lease, batch)
+        if lease is None:
+            return stored
+        stored += len(batch)
+    except UnsupportedBook as e:
+        logger.info("Not indexing book %s: %s", book.pk, e)
+        _finish(book, name, lease, 'unsupported')
+        return stored
+    except Exception:
+        # A corrupt upload must not stall the queue; it's retried only if the file is replaced.
+        logger.exception("Extracting text from book %s failed", book.pk)
+        _finish(book, name, lease, 'failed')
+        return stored
+    _finish(book, name, lease, 'indexed')
+    return stored
+
+
+def index_pending(limit=None):
+    """
+    Indexes books whose file isn't indexed yet. Returns (books processed, pages stored).
+    """
+    books = pending_books()[:limit or _setting('BOOK_TEXT_BOOKS_PER_RUN', 10)]
+    processed = pages = 0
+    for book in books:
+        pages += index_book(book)
+        processed += 1
+    return processed, pages
+
+
+def _sqlite_match(query):
+    # Every term quoted, so FTS5 operators typed by users are searched as words; the last term is
+    # a prefix so results follow the user's typing.
+    terms = ['"' + term.replace('"', '""') + '"' for term in query.split()[:MAX_QUERY_TERMS]]
+    return ' '.join(terms) + '*'
+
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def _like_snippet(text, terms):
+    # For databases without a full-text index: a window of words around the first matching term.
+    words = text.split()
+    lowered = [word.lower() for word in words]
+    first = next((i for i, word in enumerate(lowered) if any(term in word for term in terms)), 0)
+    start = max(0, first - SNIPPET_WORDS // 2)
+    window = [
+        f"{MARK_START}{word}{MARK_END}" if any(term in word.lower() for term in terms) else word
+        for word in words[start:start + SNIPPET_WORDS]
+    ]
+    return ('…' if start else '') + ' '.join(window) + ('…' if start + SNIPPET_WORDS < len(words) else '')
+
+
+def _result(book_id, title, number, snippet):
+    return {'book': book_id, 'title': title, 'page': number, 'snippet': _highlight(snippet)}
+
+
+def search(query, books, limit=20, offset=0):
+    """
+    Pages of `books` (a Book queryset, already filtered to what the user may read) matching the
+    words of `query`, best first: [{'book', 'title', 'page', 'snippet'}]. Snippets are HTML with
+    the matched words in <mark>.
+    """
+    if not query.split():
+        return []
+    book_sql, book_params = books.order_by().values('pk').query.sql_with_params()
+    page_table, book_table = BookPage._meta.db_table, Book._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql = f"""
+            SELECT page.book_id, book.title, page.number,
+                   snippet({FTS_TABLE}, 0, %s, %s, '…', %s)
+            FROM {FTS_TABLE}
+            JOIN {page_table} page ON page.id = {FTS_TABLE}.rowid
+            JOIN {book_table} book ON book.id = page.book_id
+            WHERE {FTS_TABLE} MATCH %s AND page.book_id IN ({book_sql})
+            ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s
+        """
+        params = [MARK_START, MARK_END, SNIPPET_WORDS, _sqlite_match(query), *book_params, limit, offset]
+    elif connection.vendor == 'postgresql':
+        # websearch_to_tsquery accepts any user input; the vector expression matches the GIN index.
+        sql = f"""
+            SELECT page.book_id, book.title, page.number, ts_headline('simple', page.text, query, %s)
+            FROM {page_table} page
+            JOIN {book_table} book ON book.id = page.book_id,
+                 websearch_to_tsquery('simple', %s) query
+            WHERE to_tsvector('simple', page.text) @@ query AND page.book_id IN ({book_sql})
+            ORDER BY ts_rank(to_tsvector('simple', page.text), query) DESC LIMIT %s OFFSET %s
+        """
+        options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}"
+        params = [options, query, *book_params, limit, offset]
+    else:
+        terms = [term.lower() for term in query.split()[:MAX_QUERY_TERMS]]
+        pages = (
+            BookPage.objects.filter(book__in=books.order_by().values('pk'))
+            .filter(reduce(and_, (Q(text__icontains=term) for term in terms)))
+            .values_list('book_id', 'book__title', 'number', 'text')[offset:offset + limit]
+        )
+        return [_result(book_id, title, number, _like_snippet(text, terms)) for book_id, title, number, text in pages]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [_result(*row) for row in cursor.fetchall()]
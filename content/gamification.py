@@ -0,0 +1,172 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import local_date_for
+from .models import Class, LearningStreak
+
+BITMAP_DAYS = 63
+BITMAP_MASK = (1 << BITMAP_DAYS) - 1
+
+# Points awarded per activity; leaderboards rank students by their running total.
+LESSON_COMPLETED_POINTS = 10
+QUIZ_PASSED_BONUS_POINTS = 5
+
+
+def quiz_points(score, passed):
+    return int(round(float(score) / 10)) + (QUIZ_PASSED_BONUS_POINTS if passed else 0)
+
+
+def record_activity(user, points=0, day=None):
+    """
+    Marks the student as active on `day` (their school's local date), rolls the streak counters and adds points.
+    Returns the updated LearningStreak and whether this was the student's first activity of that day.
+    """
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        streak, _ = LearningStreak.objects.select_for_update().get_or_create(user_id=user.id)
+        first_today = False
+        if streak.last_active_date is None:
+            streak.activity_bitmap = 1
+            streak.current_streak = 1
+            first_today = True
+        else:
+            gap = (day - streak.last_active_date).days
+            if gap > 0:
+                streak.activity_bitmap = ((streak.activity_bitmap << gap) | 1) & BITMAP_MASK if gap < BITMAP_DAYS else 1
+                streak.current_streak = streak.current_streak + 1 if gap == 1 else 1
+                first_today = True
+            elif gap < 0 and -gap < BITMAP_DAYS and not streak.activity_bitmap >> -gap & 1:
+                # Late-arriving activity for an earlier day only back-fills the bitmap.
+                streak.activity_bitmap |= 1 << -gap
+                streak.active_days += 1
+        if first_today:
+            streak.last_active_date = day
+            streak.active_days += 1
+            streak.longest_streak = max(streak.longest_streak, streak.current_streak)
+        streak.points += max(int(points), 0)
+        streak.save()
+
+    if points or first_today:
+        student_profile = getattr(user, 'student_profile', None)
+        class_id = student_profile.enrolled_class_id if student_profile else None
+        transaction.on_commit(lambda: leaderboards.update(user, streak.points, class_id=class_id))
+    return streak, first_today
+
+
+def current_streak(streak, today=None):
+    # A streak is only alive if the student was active today or yesterday, in the school's local
+    # day that record_activity buckets by.
+    if today is None:
+        user = streak.user
+        today = local_date_for(user.school.timezone if user.school_id else None)
+    if streak.last_active_date is None or (today - streak.last_active_date).days > 1:
+        return 0
+    return streak.current_streak
+
+
+class Leaderboard:
+    """
+    Sorted (-points, user_id) entries kept in memory so top-N and rank lookups are a bisect.
+    """
+    def __init__(self, school_id=None):
+        self.school_id = school_id
+        self.loaded_at = time.monotonic()
+        self._entries = []
+        self._points = {}
+        self._names = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set(self, user_id, points, username=None):
+        previous = self._points.get(user_id)
+        if previous is not None:
+            index = bisect_left(self._entries, (-previous, user_id))
+            del self._entries[index]
+        self._points[user_id] = points
+        if username is not None:
+            self._names[user_id] = username
+        insort(self._entries, (-points, user_id))
+
+    def top(self, limit=10):
+        # Standard competition ranking (1, 2, 2, 4), the same tie rule as rank_of().
+        entries = []
+        for index, (neg_points, user_id) in enumerate(self._entries[:limit]):
+            rank = entries[-1]['rank'] if entries and entries[-1]['points'] == -neg_points else index + 1
+            entries.append({'rank': rank, 'user_id': user_id, 'username': self._names.get(user_id), 'points': -neg_points})
+        return entries
+
+    def rank_of(self, user_id):
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        # Students on equal points share the best rank among them.
+        return {'rank': bisect_left(self._entries, (-points, -1)) + 1, 'user_id': user_id, 'username': self._names.get(user_id), 'points': points}
+
+
+class LeaderboardRegistry:
+    """
+    Process-local leaderboards per class and per school, loaded lazily from LearningStreak and
+    updated incrementally on activity. Boards are reloaded after LEADERBOARD_RELOAD_SECONDS so
+    several worker processes converge on the database totals.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}
+
+    def _reload_after(self):
+        return getattr(settings, 'LEADERBOARD_RELOAD_SECONDS', 300)
+
+    def _load(self, scope, scope_id):
+        streaks = LearningStreak.objects.filter(user__role='Student')
+        if scope == 'class':
+            streaks = streaks.filter(user__student_profile__enrolled_class_id=scope_id)
+            school_id = Class.objects.filter(pk=scope_id).values_list('school_id', flat=True).first()
+        else:
+            streaks = streaks.filter(user__school_id=scope_id)
+            school_id = scope_id
+        board = Leaderboard(school_id=school_id)
+        for user_id, username, points in streaks.values_list('user_id', 'user__username', 'points').iterator():
+            board.set(user_id, points, username)
+        return board
+
+    def get(self, scope, scope_id):
+        key = (scope, scope_id)
+        with self._lock:
+            board = self._boards.get(key)
+            if board is not None and time.monotonic() - board.loaded_at < self._reload_after():
+                return board
+        board = self._load(scope, scope_id)
+        with self._lock:
+            self._boards[key] = board
+        return board
+
+    def standings(self, scope, scope_id, limit=10, user_id=None):
+        """
+        Returns (school_id, top entries, the given user's entry) read consistently under the lock.
+        """
+        board = self.get(scope, scope_id)
+        with self._lock:
+            return board.school_id, board.top(limit), board.rank_of(user_id) if user_id else None
+
+    def update(self, user, points, class_id=None):
+        if user.role != 'Student':
+            return  # _load() only ranks students; keep incremental updates consistent with it.
+        keys = [('school', user.school_id), ('class', class_id)]
+        with self._lock:
+            for key in keys:
+                board = self._boards.get(key)
+                if key[1] is not None and board is not None:
+                    board.set(user.id, points, user.username)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+leaderboards = LeaderboardRegistry()
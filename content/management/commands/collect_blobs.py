@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from content.storage import collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = "Deletes content-addressed blobs that no file field references any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Recompute reference counts from the tables first.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting it.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            changed = recount()
+            self.stdout.write(f"Corrected {changed} reference counts.")
+        removed, freed = collect_garbage(dry_run=options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} unreferenced blobs ({freed} bytes)."))
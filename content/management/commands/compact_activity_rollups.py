@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content.rollups import compact
+
+
+class Command(BaseCommand):
+    help = "Merges appended DailyActivityRollup delta rows into one row per (school, class, date, metric)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Only compact rows for the last N days (default: all).")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] is not None:
+            # One extra day covers schools whose local date is behind the server's.
+            since = timezone.localdate() - timedelta(days=options['days'] + 1)
+        before, after = compact(since=since)
+        self.stdout.write(self.style.SUCCESS(f"Compacted {before} rollup rows into {after}."))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from content.fulltext import index_pending
+
+
+class Command(BaseCommand):
+    help = "Extracts the text of new or replaced book files (PDF, EPUB) into the full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Books indexed per batch (default: BOOK_TEXT_BOOKS_PER_RUN).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling for new books.")
+        parser.add_argument('--interval', type=float, default=30, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        total_books = total_pages = 0
+        while True:
+            books, pages = index_pending(limit=options['limit'])
+            total_books += books
+            total_pages += pages
+            if books:
+                continue  # Work through the backlog before sleeping.
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total_pages} pages from {total_books} books."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from content.uploads import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Aborts expired resumable upload sessions and deletes their partial files."
+
+    def handle(self, *args, **options):
+        count = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} expired upload sessions."))
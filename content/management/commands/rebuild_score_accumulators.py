@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from content.models import AILessonQuizAttempt, ScoreAccumulator, UserQuizAttempt
+from content.scoring import term_for
+
+
+class Command(BaseCommand):
+    help = "Rebuilds ScoreAccumulator rows from the full quiz attempt history to repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild accumulators for this user id.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_id = options.get('user')
+        quiz_attempts = UserQuizAttempt.objects.order_by('completed_at', 'id')
+        ai_attempts = AILessonQuizAttempt.objects.order_by('attempted_at', 'id')
+        if user_id:
+            quiz_attempts = quiz_attempts.filter(user_id=user_id)
+            ai_attempts = ai_attempts.filter(user_id=user_id)
+
+        totals = {}
+
+        def fold(user, subject, score, when):
+            key = (user, subject, term_for(when))
+            row = totals.get(key)
+            if row is None:
+                row = totals[key] = {'count': 0, 'sum': 0.0, 'squares': 0.0, 'min': score, 'max': score, 'last': score, 'last_at': when}
+            row['count'] += 1
+            row['sum'] += score
+            row['squares'] += score * score
+            row['min'] = min(row['min'], score)
+            row['max'] = max(row['max'], score)
+            if when >= row['last_at']:
+                row['last'], row['last_at'] = score, when
+
+        for user, subject, score, when in quiz_attempts.values_list('user_id', 'quiz__lesson__subject_id', 'score', 'completed_at').iterator():
+            fold(user, subject, score, when)
+        for user, subject, score, when in ai_attempts.values_list('user_id', 'lesson__subject_id', 'score', 'attempted_at').iterator():
+            fold(user, subject, score, when)
+
+        rows = [
+            ScoreAccumulator(
+                user_id=user, subject_id=subject, term=term,
+                attempt_count=row['count'], score_sum=row['sum'], score_sum_squares=row['squares'],
+                min_score=row['min'], max_score=row['max'], last_score=row['last'],
+            )
+            for (user, subject, term), row in totals.items()
+        ]
+
+        with transaction.atomic():
+            existing = ScoreAccumulator.objects.all()
+            if user_id:
+                existing = existing.filter(user_id=user_id)
+            existing.delete()
+            ScoreAccumulator.objects.bulk_create(rows, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(rows)} score accumulators."))
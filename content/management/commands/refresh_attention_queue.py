@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from content.risk import refresh
+
+
+class Command(BaseCommand):
+    help = "Re-evaluates student risk signals that time alone changes (inactivity, expired lockouts) and adds missing ones."
+
+    def handle(self, *args, **options):
+        updated = refresh()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {updated} student risk signals."))
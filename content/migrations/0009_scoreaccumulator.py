@@ -0,0 +1,36 @@
+# Generated by Django 5.1.9 on 2026-10-19 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('content', '0008_usernote_translatedlessoncontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreAccumulator',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(help_text="Academic term label, e.g. '2025-T2'.", max_length=20)),
+                ('attempt_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0.0)),
+                ('score_sum_squares', models.FloatField(default=0.0)),
+                ('min_score', models.FloatField(blank=True, null=True)),
+                ('max_score', models.FloatField(blank=True, null=True)),
+                ('last_score', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_accumulators', to='content.subject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_accumulators', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'subject', 'term'],
+                'unique_together': {('user', 'subject', 'term')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.9 on 2026-10-19 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('content', '0009_scoreaccumulator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LearningStreak',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_active_date', models.DateField(blank=True, null=True)),
+                ('activity_bitmap', models.BigIntegerField(default=0)),
+                ('current_streak', models.PositiveIntegerField(default=0)),
+                ('longest_streak', models.PositiveIntegerField(default=0)),
+                ('active_days', models.PositiveIntegerField(default=0)),
+                ('points', models.PositiveIntegerField(db_index=True, default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='learning_streak', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-points'],
+            },
+        ),
+    ]
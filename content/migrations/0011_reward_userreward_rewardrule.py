@@ -0,0 +1,57 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:00
+# Reward and UserReward were added to models.py without a migration; they are created here
+# alongside RewardRule, which references them.
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('content', '0010_learningstreak'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reward',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('icon_name', models.CharField(help_text='Lucide icon name (e.g., Award, Star, Trophy)', max_length=50)),
+            ],
+            options={
+                'ordering': ['title'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserReward',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('achieved_at', models.DateTimeField(auto_now_add=True)),
+                ('reward', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_achievements', to='content.reward')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='achieved_rewards', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-achieved_at'],
+                'unique_together': {('user', 'reward')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RewardRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigger', models.CharField(choices=[('lesson_completed', 'Lessons completed'), ('quiz_score', 'Quiz passed with score'), ('streak', 'Daily learning streak'), ('points', 'Points earned')], db_index=True, max_length=20)),
+                ('threshold', models.FloatField(help_text='Lessons completed, minimum quiz score (%), streak days or points required.')),
+                ('is_active', models.BooleanField(default=True)),
+                ('reward', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='content.reward')),
+                ('subject', models.ForeignKey(blank=True, help_text='Optional: only count activity in this subject', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reward_rules', to='content.subject')),
+            ],
+            options={
+                'ordering': ['trigger', 'threshold'],
+            },
+        ),
+    ]
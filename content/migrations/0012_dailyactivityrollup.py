@@ -0,0 +1,30 @@
+# Generated by Django 5.1.9 on 2026-10-19 12:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_school_timezone'),
+        ('content', '0011_reward_userreward_rewardrule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text="Day in the school's local time zone.")),
+                ('metric', models.CharField(choices=[('active_students', 'Active students'), ('lesson_progress', 'Lesson progress updates'), ('lessons_completed', 'Lessons completed'), ('quiz_attempts', 'Quiz attempts'), ('quizzes_passed', 'Quizzes passed'), ('notes_saved', 'Notes saved')], max_length=20)),
+                ('value', models.PositiveIntegerField(default=1)),
+                ('class_obj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='content.class')),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='accounts.school')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['school', 'metric', 'date'], name='rollup_school_metric_date'), models.Index(fields=['class_obj', 'metric', 'date'], name='rollup_class_metric_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.9 on 2026-10-19 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_school_timezone'),
+        ('content', '0012_dailyactivityrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveUserSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text="Day in the school's local time zone.")),
+                ('registers', models.BinaryField()),
+                ('school', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='active_user_sketches', to='accounts.school')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='sketch_date')],
+                'unique_together': {('school', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 5.1.9 on 2026-10-19 14:00
+# Catches the migration history up with models that were added to models.py without one.
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_profiles_and_parent_links'),
+        ('content', '0013_activeusersketch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='choice',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='class',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterModelOptions(
+            name='processednote',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AlterModelOptions(
+            name='question',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterModelOptions(
+            name='quiz',
+            options={'ordering': ['title']},
+        ),
+        migrations.AlterModelOptions(
+            name='subject',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterModelOptions(
+            name='userlessonprogress',
+            options={'ordering': ['user', 'lesson']},
+        ),
+        migrations.AlterModelOptions(
+            name='userquizattempt',
+            options={'ordering': ['-completed_at']},
+        ),
+        migrations.RenameField(
+            model_name='processednote',
+            old_name='original_text',
+            new_name='original_notes',
+        ),
+        migrations.RenameField(
+            model_name='processednote',
+            old_name='processed_text',
+            new_name='processed_output',
+        ),
+        migrations.AddField(
+            model_name='class',
+            name='school',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='classes', to='accounts.school'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='audio_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='image_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='simplified_content',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='pass_mark_percentage',
+            field=models.FloatField(default=70.0, help_text='Percentage required to pass this quiz.'),
+        ),
+        migrations.AddField(
+            model_name='userlessonprogress',
+            name='completed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='userquizattempt',
+            name='answers',
+            field=models.JSONField(blank=True, help_text="Stores the user's answers for each question.", null=True),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='requires_previous_quiz',
+            field=models.BooleanField(default=True, help_text='If true, student must pass the quiz of the previous lesson in order to access this one.'),
+        ),
+        migrations.AlterField(
+            model_name='userlessonprogress',
+            name='progress_data',
+            field=models.JSONField(blank=True, help_text='Stores specific progress within a lesson, e.g., last video timestamp, scroll position.', null=True),
+        ),
+        migrations.AlterField(
+            model_name='userquizattempt',
+            name='score',
+            field=models.FloatField(default=0.0, help_text='Score as a percentage (0-100).'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='userlessonprogress',
+            unique_together={('user', 'lesson')},
+        ),
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('author', models.CharField(blank=True, max_length=255, null=True)),
+                ('file', models.FileField(upload_to='books/')),
+                ('class_obj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='books', to='content.class')),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='books', to='content.subject')),
+            ],
+            options={
+                'ordering': ['title'],
+            },
+        ),
+    ]
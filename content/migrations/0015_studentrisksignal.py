@@ -0,0 +1,37 @@
+# Generated by Django 5.1.9 on 2026-10-19 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0014_sync_models_with_migrations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRiskSignal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, help_text='Latest quiz cooldown (can_reattempt_at) after a failed attempt.', null=True)),
+                ('last_active_date', models.DateField(blank=True, null=True)),
+                ('score_fast_avg', models.FloatField(blank=True, help_text='Exponential moving average of quiz scores reacting quickly.', null=True)),
+                ('score_slow_avg', models.FloatField(blank=True, help_text='Exponential moving average of quiz scores reacting slowly.', null=True)),
+                ('reasons', models.JSONField(blank=True, default=list)),
+                ('risk_score', models.FloatField(default=0)),
+                ('needs_attention', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('class_obj', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='risk_signals', to='content.class')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='risk_signal', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-risk_score'],
+                'indexes': [models.Index(fields=['class_obj', 'needs_attention', '-risk_score'], name='risk_class_attention_queue')],
+            },
+        ),
+    ]
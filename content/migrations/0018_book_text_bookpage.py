@@ -0,0 +1,75 @@
+# Generated by Django 5.1.9 on 2026-10-20 00:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The index lives outside the model: FTS5 on SQLite (external content, so the text is stored once,
+# kept in step by triggers) and a GIN expression index on PostgreSQL. Other databases fall back to
+# unindexed LIKE matching in content/fulltext.py. Note that SQLite migrations which alter
+# content_bookpage rebuild the table, dropping these triggers; such a migration must recreate them.
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE content_bookpage_fts USING fts5("
+    "text, content='content_bookpage', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER content_bookpage_fts_insert AFTER INSERT ON content_bookpage BEGIN "
+    "INSERT INTO content_bookpage_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER content_bookpage_fts_delete AFTER DELETE ON content_bookpage BEGIN "
+    "INSERT INTO content_bookpage_fts(content_bookpage_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER content_bookpage_fts_update AFTER UPDATE ON content_bookpage BEGIN "
+    "INSERT INTO content_bookpage_fts(content_bookpage_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO content_bookpage_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS content_bookpage_fts_insert",
+    "DROP TRIGGER IF EXISTS content_bookpage_fts_delete",
+    "DROP TRIGGER IF EXISTS content_bookpage_fts_update",
+    "DROP TABLE IF EXISTS content_bookpage_fts",
+]
+POSTGRES_FTS = ["CREATE INDEX content_bookpage_tsv ON content_bookpage USING GIN (to_tsvector('simple', text))"]
+POSTGRES_FTS_DROP = ["DROP INDEX IF EXISTS content_bookpage_tsv"]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS, 'postgresql': POSTGRES_FTS})
+
+
+def drop_fulltext_index(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRES_FTS_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0017_storedblob_book_file_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='text_status',
+            field=models.CharField(blank=True, choices=[('indexing', 'Indexing'), ('indexed', 'Indexed'), ('unsupported', 'Unsupported format'), ('failed', 'Failed')], default='', editable=False, max_length=12),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='content.book')),
+            ],
+            options={
+                'ordering': ['book', 'number'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'number'), name='uniq_book_page_number')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-20 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0018_book_text_bookpage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,8 +1,10 @@
+import uuid
 
 from django.db import models
 from django.db.models import JSONField # Corrected import
 from django.conf import settings
 from accounts.models import School 
+from .storage import get_blob_storage
 
 class Class(models.Model):
     school = models.ForeignKey(School, related_name='classes', on_delete=models.CASCADE, null=True, blank=True) 
@@ -125,11 +127,23 @@ class ProcessedNote(models.Model):
         return f"Note from {self.user.username} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
 
 class Book(models.Model):
+    TEXT_STATUS_CHOICES = [
+        ('indexing', 'Indexing'),
+        ('indexed', 'Indexed'),
+        ('unsupported', 'Unsupported format'),
+        ('failed', 'Failed'),
+    ]
+
     class_obj = models.ForeignKey(Class, related_name='books', on_delete=models.CASCADE, null=True, blank=True)
     subject = models.ForeignKey(Subject, related_name='books', on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255, blank=True, null=True)
-    file = models.FileField(upload_to='books/')
+    file = models.FileField(upload_to='books/', storage=get_blob_storage)
+    # Full-text indexing state (content/fulltext.py): the file whose pages are in BookPage, how far it
+    # got, and until when the worker indexing it holds the book.
+    text_source = models.CharField(max_length=255, blank=True, default='', editable=False)
+    text_status = models.CharField(max_length=12, choices=TEXT_STATUS_CHOICES, blank=True, default='', editable=False)
+    text_claimed_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['title'] # Added default ordering
@@ -141,7 +155,7 @@ class Reward(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     icon_name = models.CharField(max_length=50, help_text="Lucide icon name (e.g., Award, Star, Trophy)") # Store icon name
-    # points_required = models.PositiveIntegerField(default=0) # Or other criteria
+    # Automatic award criteria live in RewardRule.
 
     class Meta:
         ordering = ['title']
@@ -149,6 +163,25 @@ class Reward(models.Model):
     def __str__(self):
         return self.title
 
+class RewardRule(models.Model):
+    TRIGGER_CHOICES = [
+        ('lesson_completed', 'Lessons completed'),
+        ('quiz_score', 'Quiz passed with score'),
+        ('streak', 'Daily learning streak'),
+        ('points', 'Points earned'),
+    ]
+    reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name='rules')
+    trigger = models.CharField(max_length=20, choices=TRIGGER_CHOICES, db_index=True)
+    threshold = models.FloatField(help_text="Lessons completed, minimum quiz score (%), streak days or points required.")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, null=True, blank=True, related_name='reward_rules', help_text="Optional: only count activity in this subject")
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['trigger', 'threshold']
+
+    def __str__(self):
+        return f"{self.reward.title}: {self.get_trigger_display()} >= {self.threshold:g}"
+
 class UserReward(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='achieved_rewards')
     reward = models.ForeignKey(Reward, on_delete=models.CASCADE, related_name='user_achievements')
@@ -217,3 +250,209 @@ class TranslatedLessonContent(models.Model):
 
     def __str__(self):
         return f"Translation for {self.lesson.title} into {self.language_code}"
+
+class ScoreAccumulator(models.Model):
+    # Running totals of quiz scores per (student, subject, term) so averages, bests and
+    # variance can be read in O(1) instead of re-aggregating the full attempt history.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='score_accumulators')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='score_accumulators')
+    term = models.CharField(max_length=20, help_text="Academic term label, e.g. '2025-T2'.")
+    attempt_count = models.PositiveIntegerField(default=0)
+    score_sum = models.FloatField(default=0.0)
+    score_sum_squares = models.FloatField(default=0.0)
+    min_score = models.FloatField(null=True, blank=True)
+    max_score = models.FloatField(null=True, blank=True)
+    last_score = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['user', 'subject', 'term']
+        unique_together = ('user', 'subject', 'term')
+
+    def __str__(self):
+        return f"{self.user.username}'s scores in {self.subject.name} ({self.term})"
+
+    @property
+    def average_score(self):
+        if not self.attempt_count:
+            return None
+        return self.score_sum / self.attempt_count
+
+    @property
+    def score_variance(self):
+        # Population variance from the running sums; clamped because float rounding can dip below zero.
+        if not self.attempt_count:
+            return None
+        mean = self.score_sum / self.attempt_count
+        return max(self.score_sum_squares / self.attempt_count - mean * mean, 0.0)
+
+class LearningStreak(models.Model):
+    # Daily activity bitmap: bit 0 is last_active_date, bit n is n days before it (63 days kept).
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='learning_streak')
+    last_active_date = models.DateField(null=True, blank=True)
+    activity_bitmap = models.BigIntegerField(default=0)
+    current_streak = models.PositiveIntegerField(default=0)
+    longest_streak = models.PositiveIntegerField(default=0)
+    active_days = models.PositiveIntegerField(default=0)
+    points = models.PositiveIntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-points']
+
+    def __str__(self):
+        return f"{self.user.username}'s streak ({self.current_streak} days)"
+
+    def was_active_on(self, day):
+        if self.last_active_date is None:
+            return False
+        offset = (self.last_active_date - day).days
+        return 0 <= offset < 63 and bool(self.activity_bitmap >> offset & 1)
+
+class DailyActivityRollup(models.Model):
+    # Append-only daily counters keyed by (school, class, local date, metric). Writers insert
+    # delta rows; the compact_activity_rollups command periodically merges them per key.
+    METRIC_CHOICES = [
+        ('active_students', 'Active students'),
+        ('lesson_progress', 'Lesson progress updates'),
+        ('lessons_completed', 'Lessons completed'),
+        ('quiz_attempts', 'Quiz attempts'),
+        ('quizzes_passed', 'Quizzes passed'),
+        ('notes_saved', 'Notes saved'),
+    ]
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='activity_rollups')
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True, related_name='activity_rollups')
+    date = models.DateField(help_text="Day in the school's local time zone.")
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    value = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['school', 'metric', 'date'], name='rollup_school_metric_date'),
+            models.Index(fields=['class_obj', 'metric', 'date'], name='rollup_class_metric_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} on {self.date}: {self.value}"
+
+class ActiveUserSketch(models.Model):
+    # HyperLogLog registers (see content/sketches.py) of the students active at a school on a local day.
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='active_user_sketches')
+    date = models.DateField(help_text="Day in the school's local time zone.")
+    registers = models.BinaryField()
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ('school', 'date')
+        indexes = [models.Index(fields=['date'], name='sketch_date')]
+
+    def __str__(self):
+        return f"Active users sketch for {self.school or 'no school'} on {self.date}"
+
+class StudentRiskSignal(models.Model):
+    # Per-student warning signs, updated incrementally on every attempt and progress write (see
+    # content/risk.py). Flagged rows form each class's attention queue, read via the class index.
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='risk_signal')
+    class_obj = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True, related_name='risk_signals')
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Latest quiz cooldown (can_reattempt_at) after a failed attempt.")
+    last_active_date = models.DateField(null=True, blank=True)
+    score_fast_avg = models.FloatField(null=True, blank=True, help_text="Exponential moving average of quiz scores reacting quickly.")
+    score_slow_avg = models.FloatField(null=True, blank=True, help_text="Exponential moving average of quiz scores reacting slowly.")
+    reasons = models.JSONField(default=list, blank=True)
+    risk_score = models.FloatField(default=0)
+    needs_attention = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-risk_score']
+        indexes = [models.Index(fields=['class_obj', 'needs_attention', '-risk_score'], name='risk_class_attention_queue')]
+
+    def __str__(self):
+        return f"Risk signal for {self.user.username} ({self.risk_score:.0f})"
+
+    @property
+    def score_trend(self):
+        # Fast minus slow average: negative means recent scores are below the student's norm.
+        if self.score_fast_avg is None or self.score_slow_avg is None:
+            return None
+        return round(self.score_fast_avg - self.score_slow_avg, 1)
+
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload. Chunks are appended to a partial file on disk at the session's
+    offset; completing the session moves that file into place and attaches it to a new Book.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('complete', 'Complete'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default='', help_text="Optional checksum of the whole file, checked on completion.")
+    # Book fields applied on completion.
+    title = models.CharField(max_length=255)
+    author = models.CharField(max_length=255, blank=True, null=True)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='upload_session_expiry'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size}, {self.status})"
+
+
+class StoredBlob(models.Model):
+    """
+    One unique file in the content-addressed storage and how many model fields point at it.
+    collect_blobs deletes blobs whose count has dropped to zero.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='stored_blob_gc'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class BookPage(models.Model):
+    """
+    Extracted text of one PDF page or EPUB chapter. The text is searched through a full-text index
+    created by migration 0018: an FTS5 table kept in step by triggers on SQLite, a GIN index on
+    to_tsvector('simple', text) on PostgreSQL.
+    """
+    book = models.ForeignKey(Book, related_name='pages', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ['book', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'number'], name='uniq_book_page_number'),
+        ]
+
+    def __str__(self):
+        return f"{self.book} p. {self.number}"
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import RewardRule, UserLessonProgress, UserReward
+
+# trigger: one of RewardRule.TRIGGER_CHOICES; value: the measured quantity; subject_id: where it happened.
+ActivityEvent = namedtuple('ActivityEvent', ['trigger', 'value', 'subject_id'], defaults=[None])
+
+RULES_VERSION_KEY = 'reward-rules:version'
+
+_rules_lock = threading.Lock()
+_rules_cache = None  # (shared version, monotonic load time, rules by trigger)
+
+
+def invalidate_rules():
+    # The version lives in the shared cache so every worker drops its copy, not just this one.
+    global _rules_cache
+    with _rules_lock:
+        _rules_cache = None
+    try:
+        cache.incr(RULES_VERSION_KEY)
+    except ValueError:
+        cache.set(RULES_VERSION_KEY, 2, None)
+
+
+def rules_by_trigger():
+    """
+    Active rules grouped by trigger, cached in-process. A copy is used while the shared version
+    matches and is younger than REWARD_RULES_CACHE_SECONDS, which bounds staleness even if the
+    version key is evicted.
+    """
+    global _rules_cache
+    version = cache.get_or_set(RULES_VERSION_KEY, 1, None)
+    with _rules_lock:
+        if _rules_cache is not None:
+            cached_version, loaded_at, index = _rules_cache
+            if cached_version == version and time.monotonic() - loaded_at < getattr(settings, 'REWARD_RULES_CACHE_SECONDS', 60):
+                return index
+    index = defaultdict(list)
+    for rule in RewardRule.objects.filter(is_active=True).only('id', 'reward_id', 'trigger', 'threshold', 'subject_id'):
+        index[rule.trigger].append(rule)
+    with _rules_lock:
+        _rules_cache = (version, time.monotonic(), dict(index))
+        return _rules_cache[2]
+
+
+def _lesson_completion_counts(user, subject_ids):
+    # One aggregate query: overall completed lessons plus one conditional count per subject in scope.
+    aggregates = {'total': Count('id')}
+    for subject_id in subject_ids:
+        aggregates[f'subject_{subject_id}'] = Count('id', filter=Q(lesson__subject_id=subject_id))
+    counts = UserLessonProgress.objects.filter(user=user, completed=True).aggregate(**aggregates)
+    return counts
+
+
+def evaluate(user, events):
+    """
+    Checks one user's batch of activity events against the rules for those triggers only and
+    grants every newly met reward in a single bulk insert. Returns the granted reward ids.
+    """
+    index = rules_by_trigger()
+    candidates = [(rule, event) for event in events for rule in index.get(event.trigger, ())]
+    if not candidates:
+        return []
+
+    held = set(UserReward.objects.filter(user=user, reward_id__in={rule.reward_id for rule, _ in candidates}).values_list('reward_id', flat=True))
+    candidates = [(rule, event) for rule, event in candidates if rule.reward_id not in held]
+    if not candidates:
+        return []
+
+    lesson_counts = None
+    if any(rule.trigger == 'lesson_completed' for rule, _ in candidates):
+        subject_ids = {rule.subject_id for rule, _ in candidates if rule.trigger == 'lesson_completed' and rule.subject_id}
+        lesson_counts = _lesson_completion_counts(user, subject_ids)
+
+    granted = set()
+    for rule, event in candidates:
+        if rule.reward_id in granted:
+            continue
+        if rule.trigger == 'lesson_completed':
+            value = lesson_counts[f'subject_{rule.subject_id}'] if rule.subject_id else lesson_counts['total']
+        elif rule.subject_id and rule.subject_id != event.subject_id:
+            continue
+        else:
+            value = event.value
+        if value is not None and value >= rule.threshold:
+            granted.add(rule.reward_id)
+
+    if granted:
+        # unique_together (user, reward) makes a concurrent duplicate grant a no-op.
+        UserReward.objects.bulk_create([UserReward(user=user, reward_id=reward_id) for reward_id in granted], ignore_conflicts=True)
+    return sorted(granted)
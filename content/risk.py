@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from accounts.models import StudentProfile
+from .models import StudentRiskSignal
+
+FAST_ALPHA = 0.5
+SLOW_ALPHA = 0.15
+REFRESH_BATCH_SIZE = 1000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def evaluate(signal, today, now=None):
+    """
+    Recomputes reasons, risk_score and needs_attention from the signal's counters. Pure: no queries.
+    """
+    now = now or timezone.now()
+    reasons = []
+    score = 0.0
+    if signal.consecutive_failures >= _setting('ATTENTION_FAILURE_STREAK', 3):
+        reasons.append('failing')
+        score += 10 * signal.consecutive_failures
+    if signal.locked_until and signal.locked_until > now:
+        reasons.append('locked_out')
+        score += 15
+    inactive_days = (today - signal.last_active_date).days if signal.last_active_date else None
+    if inactive_days is None or inactive_days >= _setting('ATTENTION_INACTIVE_DAYS', 7):
+        reasons.append('inactive')
+        score += min(inactive_days or 60, 60)
+    trend = signal.score_trend
+    if trend is not None and trend <= -_setting('ATTENTION_SCORE_DROP', 10):
+        reasons.append('declining')
+        score += -trend
+    signal.reasons = reasons
+    signal.risk_score = round(score, 1)
+    signal.needs_attention = bool(reasons)
+    return signal
+
+
+def _locked_signal(user_id):
+    signal = StudentRiskSignal.objects.select_for_update().filter(user_id=user_id).first()
+    if signal is None:
+        signal, _ = StudentRiskSignal.objects.get_or_create(user_id=user_id)
+    return signal
+
+
+def quiz_attempt(user, class_id, day, score, passed, locked_until=None):
+    """
+    Folds one quiz attempt into the student's signal: failure streak, cooldown lockout and the
+    fast/slow score averages whose difference is the score trend.
+    """
+    with transaction.atomic():
+        signal = _locked_signal(user.id)
+        signal.class_obj_id = class_id
+        signal.last_active_date = max(day, signal.last_active_date or day)
+        signal.consecutive_failures = 0 if passed else signal.consecutive_failures + 1
+        if locked_until is not None or passed:
+            signal.locked_until = locked_until
+        if signal.score_fast_avg is None:
+            signal.score_fast_avg = signal.score_slow_avg = float(score)
+        else:
+            signal.score_fast_avg += FAST_ALPHA * (score - signal.score_fast_avg)
+            signal.score_slow_avg += SLOW_ALPHA * (score - signal.score_slow_avg)
+        evaluate(signal, day)
+        signal.save()
+    return signal
+
+
+def activity(user, class_id, day):
+    """
+    Records non-quiz activity (lesson progress), which clears inactivity.
+    """
+    with transaction.atomic():
+        signal = _locked_signal(user.id)
+        signal.class_obj_id = class_id
+        signal.last_active_date = max(day, signal.last_active_date or day)
+        evaluate(signal, day)
+        signal.save()
+    return signal
+
+
+def attention_queue(class_id):
+    # Served straight from the (class_obj, needs_attention, -risk_score) index.
+    return StudentRiskSignal.objects.filter(class_obj_id=class_id, needs_attention=True).order_by('-risk_score')
+
+
+def refresh(today=None):
+    """
+    Catches up on what writes alone can't see: students who never had a signal, students who just
+    crossed the inactivity threshold, expired lockouts and class changes. Returns rows updated.
+    """
+    today = today or timezone.localdate()
+    now = timezone.now()
+
+    enrolled = StudentProfile.objects.filter(user__risk_signal__isnull=True).values_list('user_id', 'enrolled_class_id')
+    missing = [StudentRiskSignal(user_id=user_id, class_obj_id=class_id) for user_id, class_id in enrolled.iterator()]
+    for signal in missing:
+        evaluate(signal, today, now)
+    StudentRiskSignal.objects.bulk_create(missing, batch_size=REFRESH_BATCH_SIZE, ignore_conflicts=True)
+
+    # Students who changed class since their last write.
+    moved = StudentRiskSignal.objects.exclude(class_obj_id=F('user__student_profile__enrolled_class_id'))
+    moved_count = moved.update(
+        class_obj_id=Subquery(StudentProfile.objects.filter(user_id=OuterRef('user_id')).values('enrolled_class_id')[:1])
+    )
+
+    cutoff = today - timedelta(days=_setting('ATTENTION_INACTIVE_DAYS', 7))
+    stale = StudentRiskSignal.objects.filter(Q(last_active_date__lte=cutoff) | Q(locked_until__lte=now))
+    changed = 0
+    batch = []
+    for signal in stale.iterator(chunk_size=REFRESH_BATCH_SIZE):
+        if signal.locked_until and signal.locked_until <= now:
+            signal.locked_until = None
+        batch.append(evaluate(signal, today, now))
+        if len(batch) >= REFRESH_BATCH_SIZE:
+            changed += _save_evaluated(batch)
+            batch = []
+    changed += _save_evaluated(batch)
+    return len(missing) + moved_count + changed
+
+
+def _save_evaluated(signals):
+    StudentRiskSignal.objects.bulk_update(signals, ['locked_until', 'reasons', 'risk_score', 'needs_attention'])
+    return len(signals)
@@ -0,0 +1,85 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import DailyActivityRollup
+
+
+def activity_scope(user):
+    """
+    Returns (school_id, class_id, school time zone) for attributing a user's activity.
+    """
+    student_profile = getattr(user, 'student_profile', None)
+    class_id = student_profile.enrolled_class_id if student_profile else None
+    tz_name = user.school.timezone if user.school_id else None
+    return user.school_id, class_id, tz_name
+
+
+def append(school_id, class_id, day, metrics):
+    """
+    Appends one delta row per metric for a school/class local day. `metrics` maps metric name to the amount to add.
+    """
+    rows = [
+        DailyActivityRollup(school_id=school_id, class_obj_id=class_id, date=day, metric=metric, value=value)
+        for metric, value in metrics.items() if value
+    ]
+    if rows:
+        DailyActivityRollup.objects.bulk_create(rows)
+
+
+def series(metric, start, end, school_id=None, class_id=None, group_by_class=False):
+    """
+    Per-day totals for a metric between two dates (inclusive). Reads compacted and not yet
+    compacted rows alike, so results are exact between compactions.
+    """
+    rows = DailyActivityRollup.objects.filter(metric=metric, date__gte=start, date__lte=end)
+    if school_id is not None:
+        rows = rows.filter(school_id=school_id)
+    if class_id is not None:
+        rows = rows.filter(class_obj_id=class_id)
+    keys = ['date', 'class_obj_id'] if group_by_class else ['date']
+    return list(rows.values(*keys).annotate(total=Sum('value')).order_by(*keys))
+
+
+def _sum_rows(pending, batch_size):
+    totals = {}
+    summed_ids = []
+    for row_id, school_id, class_id, day, metric, value in pending.values_list(
+        'id', 'school_id', 'class_obj_id', 'date', 'metric', 'value',
+    ).order_by().iterator(chunk_size=batch_size):
+        key = (school_id, class_id, day, metric)
+        totals[key] = totals.get(key, 0) + value
+        summed_ids.append(row_id)
+    return totals, summed_ids
+
+
+def compact(since=None, batch_size=1000):
+    """
+    Merges all delta rows that exist at call time into one row per (school, class, date, metric),
+    optionally only for days on or after `since`. Exactly the rows that were summed are deleted, by
+    primary key, so a row committed mid-compaction (even with a lower id) is never dropped unsummed;
+    it is picked up by the next pass. If an overlapping run deleted some of them first, this run
+    rolls back and returns (0, 0) rather than adding its totals a second time. Returns
+    (rows_before, rows_after).
+    """
+    with transaction.atomic():
+        pending = DailyActivityRollup.objects.all()
+        if since is not None:
+            pending = pending.filter(date__gte=since)
+        totals, summed_ids = _sum_rows(pending, batch_size)
+        rows_before = len(summed_ids)
+        if len(totals) == rows_before:
+            return rows_before, rows_before
+        deleted = 0
+        for start in range(0, rows_before, batch_size):
+            deleted += DailyActivityRollup.objects.filter(pk__in=summed_ids[start:start + batch_size]).delete()[0]
+        if deleted != rows_before:
+            transaction.set_rollback(True)
+            return 0, 0
+        DailyActivityRollup.objects.bulk_create(
+            [
+                DailyActivityRollup(school_id=school_id, class_obj_id=class_id, date=day, metric=metric, value=value)
+                for (school_id, class_id, day, metric), value in totals.items()
+            ],
+            batch_size=batch_size,
+        )
+    return rows_before, len(totals)
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import StudentProfile
+from .models import Class, Lesson, StudentRiskSignal, Subject, UserLessonProgress
+
+
+def _count(queryset, group_by):
+    # Correlated COUNT(*) for use inside annotate(); Coalesce turns "no rows" into 0.
+    counted = queryset.order_by().values(group_by).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def class_roster(class_ids):
+    """
+    Per-class summary rows for the given classes, computed in one query: students, subjects,
+    lessons, average lesson completion (%) and students flagged in the attention queue.
+    """
+    students = StudentProfile.objects.filter(enrolled_class=OuterRef('pk'))
+    classes = Class.objects.filter(pk__in=class_ids).annotate(
+        student_count=_count(students, 'enrolled_class'),
+        subject_count=_count(Subject.objects.filter(class_obj=OuterRef('pk')), 'class_obj'),
+        lesson_count=_count(Lesson.objects.filter(subject__class_obj=OuterRef('pk')), 'subject__class_obj'),
+        completed_count=_count(
+            UserLessonProgress.objects.filter(
+                completed=True,
+                lesson__subject__class_obj=OuterRef('pk'),
+                user__student_profile__enrolled_class=OuterRef('pk'),
+            ),
+            'lesson__subject__class_obj',
+        ),
+        pending_attention_count=_count(
+            StudentRiskSignal.objects.filter(class_obj=OuterRef('pk'), needs_attention=True), 'class_obj'
+        ),
+    ).order_by('name')
+
+    rows = []
+    for class_obj in classes:
+        possible = class_obj.student_count * class_obj.lesson_count
+        rows.append({
+            'id': class_obj.id,
+            'name': class_obj.name,
+            'school': class_obj.school_id,
+            'student_count': class_obj.student_count,
+            'subject_count': class_obj.subject_count,
+            'lesson_count': class_obj.lesson_count,
+            'average_completion': round(100 * class_obj.completed_count / possible, 1) if possible else None,
+            'pending_attention_count': class_obj.pending_attention_count,
+        })
+    return rows
+
+
+def teacher_roster(teacher_profile):
+    """
+    class_roster() for a teacher's assigned classes, cached for TEACHER_ROSTER_CACHE_SECONDS.
+    """
+    key = f"teacher-roster:{teacher_profile.pk}"
+    rows = cache.get(key)
+    if rows is None:
+        class_ids = teacher_profile.assigned_classes.values_list('id', flat=True)
+        rows = class_roster(class_ids)
+        cache.set(key, rows, getattr(settings, 'TEACHER_ROSTER_CACHE_SECONDS', 60))
+    return rows
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from .models import ScoreAccumulator
+
+# Months in which a new academic term begins. Override with ACADEMIC_TERM_START_MONTHS in settings.
+DEFAULT_TERM_START_MONTHS = (1, 5, 9)
+
+
+def term_for(when=None):
+    """
+    Returns the academic term label (e.g. '2025-T2') that a timestamp falls into.
+    """
+    when = timezone.localtime(when) if when is not None else timezone.localtime()
+    start_months = sorted(getattr(settings, 'ACADEMIC_TERM_START_MONTHS', DEFAULT_TERM_START_MONTHS))
+    term_index = 0
+    for index, month in enumerate(start_months):
+        if when.month >= month:
+            term_index = index
+    year = when.year
+    if when.month < start_months[0]:
+        # Before the first term start of the calendar year: still in last year's final term.
+        year -= 1
+        term_index = len(start_months) - 1
+    return f"{year}-T{term_index + 1}"
+
+
+def record_score(user_id, subject_id, score, when=None):
+    """
+    Folds one quiz score into the (student, subject, term) accumulator.
+    The update is a single UPDATE with F() expressions, so concurrent attempts never lose a write.
+    """
+    score = float(score)
+    term = term_for(when)
+    accumulator, _ = ScoreAccumulator.objects.get_or_create(user_id=user_id, subject_id=subject_id, term=term)
+    ScoreAccumulator.objects.filter(pk=accumulator.pk).update(
+        attempt_count=F('attempt_count') + 1,
+        score_sum=F('score_sum') + score,
+        score_sum_squares=F('score_sum_squares') + score * score,
+        # Coalesce covers the first attempt, where min/max are still NULL on every backend.
+        min_score=Coalesce(Least(F('min_score'), Value(score)), Value(score)),
+        max_score=Coalesce(Greatest(F('max_score'), Value(score)), Value(score)),
+        last_score=score,
+        updated_at=timezone.now(),
+    )
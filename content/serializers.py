@@ -1,7 +1,11 @@
-
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Class, Subject, Lesson, Quiz, Question, Choice, UserLessonProgress, ProcessedNote, Book, UserQuizAttempt, Reward, UserReward, Checkpoint, AILessonQuizAttempt, UserNote, TranslatedLessonContent
+from .models import Class, Subject, Lesson, Quiz, Question, Choice, UserLessonProgress, ProcessedNote, Book, UserQuizAttempt, Reward, RewardRule, UserReward, Checkpoint, AILessonQuizAttempt, UserNote, TranslatedLessonContent, ScoreAccumulator, LearningStreak, StudentRiskSignal, UploadSession
 from accounts.models import School # Import School model
+from .gamification import current_streak
+from .uploads import max_chunk_size
+from .storage import blob_digest
 
 class ChoiceSerializer(serializers.ModelSerializer):
     class Meta:
@@ -191,12 +195,15 @@ class BookSerializer(serializers.ModelSerializer):
         extra_kwargs = {'file': {'write_only': True} } # File itself is write-only, url is read-only
 
     def get_file_url(self, obj):
+        # The protected download endpoint, not the raw media URL: access is checked on every fetch.
+        if not obj.file:
+            return None
+        url = reverse('book-download', args=[obj.pk])
+        digest = blob_digest(obj.file.name)
+        if digest:  # Versioned by content, so the response can be cached as immutable.
+            url = f"{url}?v={digest}"
         request = self.context.get('request')
-        if obj.file and hasattr(obj.file, 'url'):
-            if request is not None:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
-        return None
+        return request.build_absolute_uri(url) if request is not None else url
 
 class UserQuizAttemptSerializer(serializers.ModelSerializer):
     quiz_title = serializers.CharField(source='quiz.title', read_only=True)
@@ -218,10 +225,18 @@ class UserQuizAttemptSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class RewardRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RewardRule
+        fields = ['id', 'trigger', 'threshold', 'subject', 'is_active']
+
+
 class RewardSerializer(serializers.ModelSerializer):
+    rules = RewardRuleSerializer(many=True, read_only=True)
+
     class Meta:
         model = Reward
-        fields = ['id', 'title', 'description', 'icon_name']
+        fields = ['id', 'title', 'description', 'icon_name', 'rules']
 
 class UserRewardSerializer(serializers.ModelSerializer):
     reward_details = RewardSerializer(source='reward', read_only=True)
@@ -268,3 +283,81 @@ class TranslatedLessonContentSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['created_at']
 
+
+class ScoreAccumulatorSerializer(serializers.ModelSerializer):
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    average_score = serializers.FloatField(read_only=True)
+    score_variance = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ScoreAccumulator
+        fields = [
+            'id', 'user', 'subject', 'subject_name', 'term', 'attempt_count',
+            'average_score', 'score_variance', 'min_score', 'max_score', 'last_score', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class LearningStreakSerializer(serializers.ModelSerializer):
+    user_username = serializers.CharField(source='user.username', read_only=True)
+    current_streak = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LearningStreak
+        fields = [
+            'id', 'user', 'user_username', 'current_streak', 'longest_streak', 'active_days',
+            'last_active_date', 'activity_bitmap', 'points', 'updated_at'
+        ]
+        read_only_fields = fields
+
+    def get_current_streak(self, obj):
+        return current_streak(obj)
+
+
+class StudentRiskSignalSerializer(serializers.ModelSerializer):
+    user_username = serializers.CharField(source='user.username', read_only=True)
+    full_name = serializers.CharField(source='user.student_profile.full_name', read_only=True, default=None)
+    score_trend = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = StudentRiskSignal
+        fields = [
+            'id', 'user', 'user_username', 'full_name', 'class_obj', 'needs_attention', 'risk_score', 'reasons',
+            'consecutive_failures', 'locked_until', 'last_active_date', 'score_trend', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    subject_id = serializers.PrimaryKeyRelatedField(queryset=Subject.objects.all(), source='subject', allow_null=True, required=False)
+    class_obj_id = serializers.PrimaryKeyRelatedField(queryset=Class.objects.all(), source='class_obj', allow_null=True, required=False)
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'received_size', 'sha256', 'chunk_size',
+            'title', 'author', 'subject_id', 'class_obj_id', 'book', 'status', 'expires_at'
+        ]
+        read_only_fields = ['id', 'received_size', 'book', 'status', 'expires_at']
+
+    def get_chunk_size(self, obj):
+        return max_chunk_size()
+
+    def validate_filename(self, value):
+        # Only the base name is kept; storage decides the directory.
+        name = value.replace('\\', '/').rsplit('/', 1)[-1].strip()
+        if not name:
+            raise serializers.ValidationError("Enter a file name.")
+        return name
+
+    def validate_total_size(self, value):
+        limit = getattr(settings, 'UPLOAD_MAX_SIZE', 500 * 1024 * 1024)
+        if value <= 0 or value > limit:
+            raise serializers.ValidationError(f"File size must be between 1 and {limit} bytes.")
+        return value
+
+    def validate_sha256(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdefABCDEF' for c in value)):
+            raise serializers.ValidationError("Enter a hex SHA-256 digest.")
+        return value.lower()
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import activity
+from .models import Book, RewardRule, UserReward
+from .rewards import invalidate_rules
+from .storage import track_blob_fields
+
+track_blob_fields(Book, 'file')
+
+
+@receiver([post_save, post_delete], sender=RewardRule)
+def reward_rules_changed(sender, **kwargs):
+    invalidate_rules()
+
+
+@receiver(post_save, sender=UserReward)
+def reward_awarded(sender, instance, created=False, raw=False, **kwargs):
+    # Rule grants are bulk-created, so this only sees rewards awarded one at a time, e.g. by staff.
+    if created and not raw:
+        activity.rewards_granted(instance.user, [instance.reward_id])
@@ -0,0 +1,239 @@
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+def blob_prefix():
+    return getattr(settings, 'BLOB_STORAGE_PREFIX', 'blobs')
+
+
+def blob_digest(name):
+    """
+    The SHA-256 a content-addressed name was derived from, or None for ordinary file names.
+    """
+    if not name or not name.startswith(blob_prefix() + '/'):
+        return None
+    digest = os.path.splitext(os.path.basename(name))[0]
+    return digest if len(digest) == 64 else None
+
+
+def _stored_blob_model():
+    # Looked up lazily: accounts.models uses this storage, and content.models imports accounts.models.
+    return apps.get_model('content', 'StoredBlob')
+
+
+@deconstructible(path='content.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct file once, under blobs/[<subdirectory>/]ab/cd/<sha256><ext>. The hash is
+    computed while the upload is streamed to a temporary file, so content is read once; a file that
+    already exists is simply not written again. Names are immutable, so their URLs can be cached
+    forever. Reference counts live in StoredBlob and are kept by track_blob_fields().
+    """
+    def __init__(self, subdirectory='', **kwargs):
+        super().__init__(**kwargs)
+        self.subdirectory = subdirectory
+
+    def get_available_name(self, name, max_length=None):
+        # _save() picks the final name from the content; no need to probe for a free one.
+        return name
+
+    def _blob_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        directory = f"{blob_prefix()}/{self.subdirectory}" if self.subdirectory else blob_prefix()
+        return f"{directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large uploads, resumable uploads): hash it in place and move it.
+            source = content.temporary_file_path()
+            with open(source, 'rb') as handle:
+                for block in iter(lambda: handle.read(READ_BLOCK_SIZE), b''):
+                    digest.update(block)
+                    size += len(block)
+            temporary = None
+        else:
+            fd, temporary = tempfile.mkstemp(dir=self.location, prefix='.blob-')
+            with os.fdopen(fd, 'wb') as handle:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    handle.write(chunk)
+            source = temporary
+
+        blob_name = self._blob_name(digest.hexdigest(), name)
+        full_path = self.path(blob_name)
+        # Register the blob, or refresh it so garbage collection's grace period restarts, before
+        # trusting an existing file: collect_garbage() deletes the file while its row deletion is
+        # uncommitted, so a refresh that finds the row can rely on the file, and one that doesn't
+        # writes the file again.
+        StoredBlob = _stored_blob_model()
+        registered = StoredBlob.objects.filter(name=blob_name).update(updated_at=timezone.now())
+        if not registered:
+            StoredBlob.objects.get_or_create(name=blob_name, defaults={'size': size})
+        try:
+            if registered and os.path.exists(full_path):
+                return blob_name  # Deduplicated: the identical file is already stored.
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_move_safe(source, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        finally:
+            if temporary and os.path.exists(temporary):
+                os.remove(temporary)
+        return blob_name
+
+    def derived_name(self, name, suffix):
+        # Files derived from a stored file (image variants) sit beside it and are collected with it.
+        return f"{os.path.splitext(name)[0]}.{suffix}"
+
+    def save_derived(self, name, suffix, data):
+        """
+        Writes `data` as the `suffix` variant of `name`, replacing it atomically. Returns its name.
+        """
+        derived = self.derived_name(name, suffix)
+        full_path = self.path(derived)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.derived-')
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(data)
+        os.replace(temporary, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return derived
+
+    def delete_with_derived(self, name):
+        self.delete(name)
+        directory, filename = os.path.split(name)
+        prefix = os.path.splitext(filename)[0] + '.'
+        try:
+            files = self.listdir(directory)[1]
+        except FileNotFoundError:
+            return
+        for derived in files:
+            if derived.startswith(prefix):
+                self.delete(f"{directory}/{derived}")
+
+
+blob_storage = ContentAddressedStorage()
+# Profile pictures: the only blobs a front server may serve straight from MEDIA_URL. Book files
+# stay outside this subdirectory, reachable only through the protected download.
+public_blob_storage = ContentAddressedStorage(subdirectory='public')
+
+
+def get_blob_storage():
+    # Referenced by FileField(storage=...) so migrations record a callable, not storage settings.
+    return blob_storage
+
+
+def get_public_blob_storage():
+    return public_blob_storage
+
+
+def _adjust(name, delta):
+    if blob_digest(name):
+        _stored_blob_model().objects.filter(name=name).update(ref_count=F('ref_count') + delta, updated_at=timezone.now())
+
+
+def track_blob_fields(model, *field_names):
+    """
+    Keeps StoredBlob.ref_count in step with `model`'s file fields: the names seen when an instance
+    loads are compared with those it saves, and deletes release theirs. bulk and queryset updates
+    bypass this; `manage.py collect_blobs --recount` repairs any drift.
+    """
+    def loaded_name(instance, field):
+        # Straight from __dict__: a deferred field is absent, and reading it would cost a query.
+        value = instance.__dict__.get(field)
+        return getattr(value, 'name', value) or None
+
+    def remember(sender, instance, **kwargs):
+        instance._blob_names = {field: loaded_name(instance, field) for field in field_names}
+
+    def saved(sender, instance, update_fields=None, **kwargs):
+        previous = getattr(instance, '_blob_names', {})
+        for field in field_names:
+            if field not in instance.__dict__ or (update_fields is not None and field not in update_fields):
+                continue
+            new = loaded_name(instance, field)
+            old = previous.get(field)
+            if new != old:
+                _adjust(new, 1)
+                _adjust(old, -1)
+        remember(sender, instance)
+
+    def deleted(sender, instance, **kwargs):
+        for field in field_names:
+            _adjust(previous_or_loaded(instance, field), -1)
+
+    def previous_or_loaded(instance, field):
+        return loaded_name(instance, field) if field in instance.__dict__ else getattr(instance, '_blob_names', {}).get(field)
+
+    uid = f"blob-refs:{model._meta.label}"
+    post_init.connect(remember, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=uid)
+
+
+def blob_fields():
+    # Every (model, field name) stored in the content-addressed storage.
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(getattr(field, 'storage', None), ContentAddressedStorage):
+                yield model, field.name
+
+
+def recount():
+    """
+    Recomputes every ref_count from the tables that reference blobs. Returns blobs whose count changed.
+    """
+    StoredBlob = _stored_blob_model()
+    counts = {}
+    for model, field in blob_fields():
+        names = model._base_manager.filter(**{f"{field}__startswith": blob_prefix() + '/'}).values_list(field, flat=True)
+        for name in names.iterator():
+            counts[name] = counts.get(name, 0) + 1
+    changed = []
+    for blob in StoredBlob.objects.iterator():
+        actual = counts.get(blob.name, 0)
+        if blob.ref_count != actual:
+            blob.ref_count = actual
+            changed.append(blob)
+    StoredBlob.objects.bulk_update(changed, ['ref_count'], batch_size=1000)
+    return len(changed)
+
+
+def collect_garbage(dry_run=False):
+    """
+    Deletes blobs nobody references. A grace period (BLOB_GC_GRACE_SECONDS) protects blobs that were
+    just written but whose row has not been saved yet. Returns (blobs removed, bytes freed).
+    """
+    StoredBlob = _stored_blob_model()
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'BLOB_GC_GRACE_SECONDS', 60 * 60))
+    removed = freed = 0
+    for blob in StoredBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff).iterator():
+        removed += 1
+        freed += blob.size
+        if not dry_run:
+            # Conditional delete: a reference taken since the scan keeps the blob. The file goes
+            # before the row's deletion commits, so a save of the same content waits on the row
+            # and then writes the file again (see ContentAddressedStorage._save).
+            with transaction.atomic():
+                if StoredBlob.objects.filter(pk=blob.pk, ref_count__lte=0, updated_at__lt=cutoff).delete()[0]:
+                    blob_storage.delete_with_derived(blob.name)
+    return removed, freed
@@ -1,3 +1,700 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.views.static import serve
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser, School, StudentProfile, TeacherProfile
+from notifications import pubsub
+from stepwise_backend import urls as project_urls
+from . import activity, fulltext, rewards, risk, rollups, sketches, storage, uploads
+from .downloads import parse_range
+from .rosters import class_roster, teacher_roster
+from .gamification import Leaderboard, current_streak, leaderboards, record_activity
+from .models import (
+    Book, BookPage, Class, DailyActivityRollup, LearningStreak, Lesson, Quiz, Reward, RewardRule, ScoreAccumulator, StoredBlob, StudentRiskSignal,
+    Subject, UploadSession, UserLessonProgress, UserQuizAttempt, UserReward,
+)
+from .scoring import record_score, term_for
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class MediaRootMixin:
+    """
+    Points MEDIA_ROOT (and so blob storage and upload sessions) at a temporary directory.
+    """
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = self.settings(MEDIA_ROOT=media_root, UPLOAD_SESSION_DIR=f"{media_root}/uploads/partial")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ContentTestData(TestCase):
+    """
+    A school with one class, subject and quiz, a teacher and a student.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.class_obj = Class.objects.create(school=cls.school, name="Class 6")
+        cls.subject = Subject.objects.create(class_obj=cls.class_obj, name="Science")
+        cls.lesson = Lesson.objects.create(subject=cls.subject, title="Plants", content="...")
+        cls.quiz = Quiz.objects.create(lesson=cls.lesson, title="Plants quiz")
+        cls.teacher = CustomUser.objects.create_user(username="tina", password="x", role="Teacher", school=cls.school)
+        cls.student = CustomUser.objects.create_user(username="sam", password="x", role="Student", school=cls.school)
+
+
+@override_settings(ACADEMIC_TERM_START_MONTHS=(1, 5, 9))
+class ScoreAccumulatorTests(ContentTestData):
+    def test_term_for_wraps_into_last_years_final_term(self):
+        self.assertEqual(term_for(utc(2026, 5, 10, 12)), '2026-T2')
+        self.assertEqual(term_for(utc(2026, 12, 31, 12)), '2026-T3')
+        with self.settings(ACADEMIC_TERM_START_MONTHS=(6,)):
+            self.assertEqual(term_for(utc(2026, 3, 1, 12)), '2025-T1')
+
+    def test_record_score_accumulates_totals(self):
+        when = utc(2026, 10, 1, 12)
+        for score in (60, 90, 75):
+            record_score(self.student.pk, self.subject.pk, score, when)
+        row = ScoreAccumulator.objects.get()
+        self.assertEqual((row.term, row.attempt_count, row.score_sum, row.score_sum_squares), ('2026-T3', 3, 225, 60 ** 2 + 90 ** 2 + 75 ** 2))
+        self.assertEqual((row.min_score, row.max_score, row.last_score, row.average_score), (60, 90, 75, 75))
+
+        record_score(self.student.pk, self.subject.pk, 50, utc(2027, 1, 15, 12))
+        self.assertEqual(ScoreAccumulator.objects.count(), 2)
+
+    def test_rebuild_replaces_drifted_rows_from_history(self):
+        for score in (40, 80):
+            attempt = UserQuizAttempt.objects.create(user=self.student, quiz=self.quiz, score=score)
+            UserQuizAttempt.objects.filter(pk=attempt.pk).update(completed_at=utc(2026, 10, 1 + score // 40, 12))
+        ScoreAccumulator.objects.create(user=self.student, subject=self.subject, term='2026-T3', attempt_count=9, score_sum=1)
+
+        call_command('rebuild_score_accumulators', stdout=StringIO())
+        row = ScoreAccumulator.objects.get()
+        self.assertEqual((row.attempt_count, row.score_sum, row.min_score, row.max_score, row.last_score), (2, 120, 40, 80, 80))
+
+
+class StreakTests(ContentTestData):
+    def test_consecutive_days_extend_the_streak_and_gaps_reset_it(self):
+        day = date(2026, 10, 1)
+        for offset in (0, 1, 2):
+            record_activity(self.student, day=day + timedelta(days=offset))
+        streak, first_today = record_activity(self.student, day=day + timedelta(days=2))
+        self.assertFalse(first_today)
+        self.assertEqual((streak.current_streak, streak.active_days, streak.activity_bitmap), (3, 3, 0b111))
+
+        streak, _ = record_activity(self.student, day=day + timedelta(days=5))
+        self.assertEqual((streak.current_streak, streak.longest_streak, streak.activity_bitmap), (1, 3, 0b111001))
+
+    def test_late_activity_backfills_the_bitmap_once(self):
+        day = date(2026, 10, 10)
+        record_activity(self.student, day=day)
+        for _ in range(2):
+            streak, first_today = record_activity(self.student, day=day - timedelta(days=3))
+        self.assertFalse(first_today)
+        self.assertEqual((streak.activity_bitmap, streak.active_days, streak.last_active_date), (0b1001, 2, day))
+
+    def test_gap_longer_than_the_bitmap_starts_over(self):
+        record_activity(self.student, day=date(2026, 1, 1))
+        streak, _ = record_activity(self.student, day=date(2026, 6, 1))
+        self.assertEqual(streak.activity_bitmap, 1)
+
+    def test_current_streak_uses_the_schools_local_day(self):
+        School.objects.filter(pk=self.school.pk).update(timezone='Pacific/Kiritimati')  # UTC+14
+        record_activity(self.student, day=date(2026, 10, 9))
+        record_activity(self.student, day=date(2026, 10, 10))
+        streak = LearningStreak.objects.select_related('user__school').get(user=self.student)
+        with mock.patch('django.utils.timezone.now', return_value=utc(2026, 10, 10, 12)):
+            self.assertEqual(current_streak(streak), 2)
+        # Still the 11th on the server, but already the 12th at the school: a day was missed.
+        with mock.patch('django.utils.timezone.now', return_value=utc(2026, 10, 11, 12)):
+            self.assertEqual(current_streak(streak), 0)
+
+
+class LeaderboardTests(ContentTestData):
+    def test_top_and_rank_of_share_the_tie_rule(self):
+        board = Leaderboard()
+        for user_id, points in ((1, 50), (2, 40), (3, 40), (4, 10)):
+            board.set(user_id, points)
+        self.assertEqual([entry['rank'] for entry in board.top()], [1, 2, 2, 4])
+        self.assertEqual([board.rank_of(user_id)['rank'] for user_id in (1, 2, 3, 4)], [1, 2, 2, 4])
+
+    def test_incremental_updates_match_a_reload(self):
+        leaderboards.clear()
+        self.addCleanup(leaderboards.clear)
+        LearningStreak.objects.create(user=self.student, points=30)
+        self.assertEqual(len(leaderboards.get('school', self.school.pk)), 1)
+
+        leaderboards.update(self.teacher, 100)
+        leaderboards.update(self.student, 45)
+        _, top, _ = leaderboards.standings('school', self.school.pk)
+        self.assertEqual([(entry['user_id'], entry['points']) for entry in top], [(self.student.pk, 45)])
+
+
+class RewardRuleTests(ContentTestData):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.badge = Reward.objects.create(title="Sharp", description="...", icon_name="Star")
+
+    def setUp(self):
+        rewards.invalidate_rules()
+
+    def test_rules_are_granted_once(self):
+        RewardRule.objects.create(reward=self.badge, trigger='quiz_score', threshold=80, subject=self.subject)
+        event = rewards.ActivityEvent('quiz_score', 79, self.subject.pk)
+        self.assertEqual(rewards.evaluate(self.student, [event]), [])
+        self.assertEqual(rewards.evaluate(self.student, [event._replace(value=85)]), [self.badge.pk])
+        self.assertEqual(rewards.evaluate(self.student, [event._replace(value=95)]), [])
+        self.assertEqual(UserReward.objects.filter(user=self.student).count(), 1)
+
+    def test_edits_in_another_process_are_picked_up_through_the_shared_version(self):
+        rule = RewardRule.objects.create(reward=self.badge, trigger='streak', threshold=5)
+        self.assertEqual(len(rewards.rules_by_trigger()['streak']), 1)
+        # Another worker's save: the row changes and the shared version moves, but this process's
+        # copy is not cleared by a local signal.
+        RewardRule.objects.filter(pk=rule.pk).update(is_active=False)
+        self.assertEqual(len(rewards.rules_by_trigger()['streak']), 1)
+        cache.incr(rewards.RULES_VERSION_KEY)
+        self.assertNotIn('streak', rewards.rules_by_trigger())
+
+    def test_every_grant_is_published_to_the_students_stream(self):
+        RewardRule.objects.create(reward=self.badge, trigger='streak', threshold=1)
+        staff_pick = Reward.objects.create(title="Helper", description="...", icon_name="Heart")
+        with mock.patch.object(pubsub, 'publish') as publish:
+            activity.lesson_progress_recorded(self.student, UserLessonProgress.objects.create(user=self.student, lesson=self.lesson), False)
+            UserReward.objects.create(user=self.student, reward=staff_pick)  # Awarded by staff.
+        granted = [
+            (channel, [reward['id'] for reward in data['rewards']])
+            for channel, kind, data in (call.args for call in publish.call_args_list) if kind == 'rewards_granted'
+        ]
+        channel = pubsub.user_channel(self.student.pk)
+        self.assertEqual(granted, [(channel, [self.badge.pk]), (channel, [staff_pick.pk])])
+
+    @override_settings(REWARD_RULES_CACHE_SECONDS=0)
+    def test_copies_expire_even_without_a_version_change(self):
+        rule = RewardRule.objects.create(reward=self.badge, trigger='points', threshold=100)
+        self.assertIn('points', rewards.rules_by_trigger())
+        RewardRule.objects.filter(pk=rule.pk).update(is_active=False)  # No signal, no version change.
+        self.assertNotIn('points', rewards.rules_by_trigger())
+
+
+class ActivityRollupTests(ContentTestData):
+    def test_compaction_keeps_totals_and_merges_per_key(self):
+        day = date(2026, 10, 1)
+        for _ in range(3):
+            rollups.append(self.school.pk, self.class_obj.pk, day, {'quiz_attempts': 2, 'quizzes_passed': 1})
+        rollups.append(self.school.pk, self.class_obj.pk, day + timedelta(days=1), {'quiz_attempts': 5, 'notes_saved': 0})
+
+        self.assertEqual(rollups.compact(), (7, 3))
+        self.assertEqual(rollups.compact(), (3, 3))
+        self.assertEqual(
+            [(row['date'], row['total']) for row in rollups.series('quiz_attempts', day, day + timedelta(days=1), school_id=self.school.pk)],
+            [(day, 6), (day + timedelta(days=1), 5)],
+        )
+
+    def test_compaction_since_leaves_older_days_alone(self):
+        day = date(2026, 10, 1)
+        for offset in (0, 0, 5, 5):
+            rollups.append(self.school.pk, None, day + timedelta(days=offset), {'lessons_completed': 1})
+        self.assertEqual(rollups.compact(since=day + timedelta(days=5)), (2, 1))
+        self.assertEqual(DailyActivityRollup.objects.filter(date=day).count(), 2)
+
+    def test_overlapping_compaction_does_not_double_count(self):
+        day = date(2026, 10, 1)
+        for _ in range(3):
+            rollups.append(self.school.pk, None, day, {'quiz_attempts': 1})
+        sum_rows = rollups._sum_rows
+
+        def overlapped(pending, batch_size):
+            summed = sum_rows(pending, batch_size)
+            # Another run compacts the same rows between this run's read and its delete.
+            with mock.patch.object(rollups, '_sum_rows', sum_rows):
+                self.assertEqual(rollups.compact(), (3, 1))
+            return summed
+
+        with mock.patch.object(rollups, '_sum_rows', overlapped):
+            self.assertEqual(rollups.compact(), (0, 0))
+        self.assertEqual(rollups.series('quiz_attempts', day, day, school_id=self.school.pk), [{'date': day, 'total': 3}])
+
+    def test_non_numeric_ids_are_rejected(self):
+        staff = CustomUser.objects.create_user(username="ops", password="x", role="Admin", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(staff)
+        for params in ({'school': 'abc'}, {'class_obj': '1;2'}):
+            response = client.get('/api/activity-rollups/', params)
+            self.assertEqual(response.status_code, 400, params)
+        self.assertEqual(client.get('/api/activity-rollups/', {'school': self.school.pk}).status_code, 200)
+
+
+class ActiveUserSketchTests(ContentTestData):
+    def test_merged_days_count_each_user_once(self):
+        day = date(2026, 10, 1)
+        for offset in range(3):
+            for user_id in range(200):
+                sketches.record_active_user(self.school.pk, day + timedelta(days=offset), user_id + offset * 50)
+        sketches.record_active_user(None, day, 99999)
+        self.assertAlmostEqual(sketches.distinct_active_users(day, day, self.school.pk), 200, delta=10)
+        self.assertAlmostEqual(sketches.distinct_active_users(day, day + timedelta(days=2), self.school.pk), 300, delta=15)
+        self.assertAlmostEqual(sketches.distinct_active_users(day, day), 201, delta=10)
+
+    def test_merge_is_register_wise_max(self):
+        left, right = sketches.HyperLogLog(), sketches.HyperLogLog()
+        for value in range(300):
+            (left if value % 2 else right).add(value)
+        both = sketches.HyperLogLog()
+        for value in range(300):
+            both.add(value)
+        self.assertEqual(left.merge(right).registers, both.registers)
+        with self.assertRaises(ValueError):
+            sketches.HyperLogLog(b'short')
+
+    def test_active_users_endpoint(self):
+        day = self.school.local_date()
+        sketches.record_active_user(self.school.pk, day, self.student.pk)
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        self.assertEqual(client.get('/api/active-users/').status_code, 403)
+
+        admin = CustomUser.objects.create_user(username="head", password="x", role="Admin", school=self.school, is_school_admin=True)
+        client.force_authenticate(admin)
+        response = client.get('/api/active-users/', {'school': 'elsewhere'})
+        self.assertEqual(response.status_code, 400)
+        response = client.get('/api/active-users/')
+        self.assertEqual((response.data['school'], response.data['daily'], response.data['monthly']), (self.school.pk, 1, 1))
+
+    def test_only_students_count_as_active(self):
+        when = utc(2026, 10, 1, 9)
+        for user in (self.teacher, self.student):
+            activity.quiz_attempt_recorded(user, self.subject.pk, 80, True, when)
+        day = date(2026, 10, 1)
+        self.assertEqual(sketches.distinct_active_users(day, day, self.school.pk), 1)
+        self.assertEqual(rollups.series('active_students', day, day, school_id=self.school.pk), [{'date': day, 'total': 1}])
+
+
+class ClassRosterTests(ContentTestData):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.empty_class = Class.objects.create(school=cls.school, name="Class 5")
+        cls.other_lesson = Lesson.objects.create(subject=cls.subject, title="Animals", content="...")
+        cls.classmate = CustomUser.objects.create_user(username="sia", password="x", role="Student", school=cls.school)
+        cls.newcomer = CustomUser.objects.create_user(username="neo", password="x", role="Student", school=cls.school)
+        for user, class_obj in ((cls.student, cls.class_obj), (cls.classmate, cls.class_obj), (cls.newcomer, cls.empty_class)):
+            StudentProfile.objects.create(user=user, school=cls.school, enrolled_class=class_obj)
+        UserLessonProgress.objects.create(user=cls.student, lesson=cls.lesson, completed=True)
+        UserLessonProgress.objects.create(user=cls.classmate, lesson=cls.lesson, completed=False)
+        # Progress by a student of another class doesn't count towards this one.
+        UserLessonProgress.objects.create(user=cls.newcomer, lesson=cls.other_lesson, completed=True)
+        StudentRiskSignal.objects.create(user=cls.student, class_obj=cls.class_obj, needs_attention=True)
+        StudentRiskSignal.objects.create(user=cls.classmate, class_obj=cls.class_obj, needs_attention=False)
+        cls.profile = TeacherProfile.objects.create(user=cls.teacher, school=cls.school)
+        cls.profile.assigned_classes.set([cls.class_obj, cls.empty_class])
+
+    def setUp(self):
+        cache.delete(f"teacher-roster:{self.profile.pk}")
+
+    def test_counts_for_every_class_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows = class_roster([self.class_obj.pk, self.empty_class.pk])
+        counts = {
+            row['name']: (row['student_count'], row['subject_count'], row['lesson_count'], row['average_completion'], row['pending_attention_count'])
+            for row in rows
+        }
+        # One of 2 students x 2 lessons completed.
+        self.assertEqual(counts, {"Class 6": (2, 1, 2, 25.0, 1), "Class 5": (1, 0, 0, None, 0)})
+
+    def test_teacher_roster_is_cached(self):
+        client = APIClient()
+        client.force_authenticate(self.teacher)
+        first = client.get('/api/teacher-actions/my_classes/').data
+        self.assertEqual([row['name'] for row in first], ["Class 5", "Class 6"])
+
+        UserLessonProgress.objects.filter(user=self.classmate).update(completed=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(teacher_roster(self.profile), first)
+        cache.delete(f"teacher-roster:{self.profile.pk}")
+        self.assertEqual(teacher_roster(self.profile)[1]['average_completion'], 50.0)
+
+
+@override_settings(ATTENTION_FAILURE_STREAK=3, ATTENTION_INACTIVE_DAYS=7, ATTENTION_SCORE_DROP=10)
+class RiskSignalTests(ContentTestData):
+    today = date(2026, 10, 10)
+
+    def signal(self, **fields):
+        return risk.evaluate(StudentRiskSignal(**{'last_active_date': self.today, **fields}), self.today, now=utc(2026, 10, 10, 12))
+
+    def test_each_threshold(self):
+        self.assertEqual(self.signal().reasons, [])
+        self.assertEqual(self.signal(consecutive_failures=2).reasons, [])
+        self.assertEqual((self.signal(consecutive_failures=3).reasons, self.signal(consecutive_failures=3).risk_score), (['failing'], 30))
+        self.assertEqual(self.signal(locked_until=utc(2026, 10, 10, 13)).reasons, ['locked_out'])
+        self.assertEqual(self.signal(locked_until=utc(2026, 10, 10, 11)).reasons, [])
+        self.assertEqual(self.signal(last_active_date=self.today - timedelta(days=6)).reasons, [])
+        inactive = self.signal(last_active_date=self.today - timedelta(days=7))
+        self.assertEqual((inactive.reasons, inactive.risk_score, inactive.needs_attention), (['inactive'], 7, True))
+        self.assertEqual(self.signal(last_active_date=None).risk_score, 60)
+        self.assertEqual(self.signal(score_fast_avg=60, score_slow_avg=69.5).reasons, [])
+        declining = self.signal(score_fast_avg=60, score_slow_avg=72)
+        self.assertEqual((declining.reasons, declining.risk_score), (['declining'], 12))
+
+    def test_attempts_build_and_clear_the_failure_streak(self):
+        for _ in range(3):
+            signal = risk.quiz_attempt(self.student, self.class_obj.pk, self.today, 20, passed=False)
+        self.assertEqual((signal.consecutive_failures, signal.needs_attention), (3, True))
+        self.assertEqual(list(risk.attention_queue(self.class_obj.pk)), [signal])
+        signal = risk.quiz_attempt(self.student, self.class_obj.pk, self.today, 90, passed=True)
+        self.assertEqual((signal.consecutive_failures, signal.needs_attention), (0, False))
+
+    def test_refresh_catches_up_on_what_writes_miss(self):
+        StudentProfile.objects.create(user=self.student, school=self.school, enrolled_class=self.class_obj)
+        self.assertEqual(risk.refresh(self.today), 1)  # A signal is created for the new student.
+        self.assertEqual(StudentRiskSignal.objects.get(user=self.student).reasons, ['inactive'])
+
+        risk.activity(self.student, self.class_obj.pk, self.today)
+        other_class = Class.objects.create(school=self.school, name="Class 7")
+        StudentProfile.objects.filter(user=self.student).update(enrolled_class=other_class)
+        risk.refresh(self.today)
+        signal = StudentRiskSignal.objects.get(user=self.student)
+        self.assertEqual((signal.class_obj, signal.needs_attention), (other_class, False))
+
+        risk.refresh(self.today + timedelta(days=7))
+        self.assertEqual(StudentRiskSignal.objects.get(user=self.student).reasons, ['inactive'])
+
+    def test_attention_queue_is_limited_to_the_users_school(self):
+        StudentRiskSignal.objects.create(user=self.student, class_obj=self.class_obj, needs_attention=True, risk_score=30)
+        elsewhere = School.objects.create(name="Hill Top", school_id_code="HT01", official_email="office@ht.example")
+        outsider = CustomUser.objects.create_user(username="olga", password="x", role="Teacher", school=elsewhere)
+        staff = CustomUser.objects.create_user(username="ops", password="x", role="Admin", is_staff=True)
+
+        client = APIClient()
+        for user, expected in ((self.teacher, 1), (outsider, 0), (self.student, 0), (staff, 1)):
+            client.force_authenticate(user)
+            response = client.get('/api/attention-queue/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], expected, user.username)
+
+
+class BookDownloadTests(MediaRootMixin, ContentTestData):
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.book = Book.objects.create(title="Plants", class_obj=self.class_obj, file=ContentFile(self.data, name="plants.pdf"))
+        self.url = f'/api/books/{self.book.pk}/download/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/pdf', **headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('bytes=5-2', 100))  # Invalid, so ignored rather than unsatisfiable.
+        self.assertIsNone(parse_range(None, 100))
+        for header in ('bytes=100-', 'bytes=100-200', 'bytes=-0'):
+            self.assertIs(parse_range(header, 100), False, header)
+
+    def test_whole_file_and_ranges(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response.body, response['Accept-Ranges']), (200, self.data, 'bytes'))
+        self.assertIn("filename*=UTF-8''Plants.pdf", response['Content-Disposition'])
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual((response.status_code, response.body, response['Content-Range']), (206, self.data[10:20], 'bytes 10-19/1024'))
+        self.assertEqual(self.get(HTTP_RANGE='bytes=-4').body, self.data[-4:])
+
+        response = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'))
+        response = self.get(HTTP_RANGE='bytes=5-3')  # Invalid: ignored.
+        self.assertEqual((response.status_code, response.body), (200, self.data))
+
+    def test_validators(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        # A stale partial copy gets the whole file instead of a range of the new one.
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, len(response.body)), (200, 1024))
+
+    def test_access_rules_and_json_errors(self):
+        elsewhere = School.objects.create(name="Hill Top", school_id_code="HT01", official_email="office@ht.example")
+        self.client.force_authenticate(CustomUser.objects.create_user(username="olga", password="x", role="Teacher", school=elsewhere))
+        response = self.get()
+        self.assertEqual((response.status_code, response['Content-Type']), (403, 'application/json'))
+        self.assertEqual(response.json(), {'detail': "You do not have access to this book."})
+
+        self.client.force_authenticate(None)
+        response = self.get()
+        self.assertEqual((response.status_code, response['Content-Type']), (401, 'application/json'))
+        self.assertIn('detail', response.json())
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_development_media_route_serves_only_public_blobs(self):
+        with override_settings(DEBUG=True):
+            debug_urls = importlib.reload(project_urls)
+        self.addCleanup(importlib.reload, project_urls)
+        with self.assertRaises(Resolver404):
+            resolve('/' + self.book.file.url.lstrip('/'), urlconf=debug_urls)
+        self.assertEqual(resolve(f'/media/blobs/public/ab/cd/{"a" * 64}.jpg', urlconf=debug_urls).func, serve)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadSessionTests(MediaRootMixin, ContentTestData):
+    data = b"%PDF-1.4 " + bytes(range(256)) * 3
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def start(self, **fields):
+        payload = {'filename': "notes/Plants.pdf", 'total_size': len(self.data), 'title': "Plants", 'class_obj_id': self.class_obj.pk, **fields}
+        response = self.client.post('/api/uploads/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        return f"/api/uploads/{response.data['id']}/"
+
+    def put(self, url, offset, chunk, checksum=None):
+        return self.client.generic(
+            'PUT', url, chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), HTTP_X_CHUNK_SHA256=checksum or sha256(chunk),
+        )
+
+    def test_resume_replay_and_complete(self):
+        url = self.start(sha256=sha256(self.data))
+        first, rest = self.data[:500], self.data[500:]
+        self.assertEqual(self.put(url, 0, first)['Upload-Offset'], '500')
+
+        # The client lost the reply and resends the chunk: 409 tells it where to carry on.
+        response = self.put(url, 0, first)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '500'))
+        self.assertEqual(self.client.get(url).data['received_size'], 500)
+        self.assertEqual(self.client.post(f"{url}complete/").status_code, 409)
+
+        self.assertEqual(self.put(url, 500, rest).status_code, 200)
+        response = self.client.post(f"{url}complete/")
+        self.assertEqual(response.status_code, 201)
+        book = Book.objects.get(pk=response.data['id'])
+        with book.file.open('rb') as handle:
+            self.assertEqual(handle.read(), self.data)
+        self.assertEqual(book.class_obj, self.class_obj)
+        self.assertFalse(os.path.exists(uploads.part_path(UploadSession.objects.get())))
+        self.assertEqual(self.client.post(f"{url}complete/").status_code, 410)
+        self.assertEqual(self.put(url, len(self.data), b"x").status_code, 410)
+
+    def test_bad_chunk_checksum_is_cut_back(self):
+        url = self.start()
+        self.put(url, 0, self.data[:100])
+        response = self.put(url, 100, self.data[100:200], checksum=sha256(b"other"))
+        self.assertEqual((response.status_code, response['Upload-Offset']), (400, '100'))
+        session = UploadSession.objects.get()
+        self.assertEqual((session.received_size, os.path.getsize(uploads.part_path(session))), (100, 100))
+        self.assertEqual(self.put(url, 100, self.data[100:200]).status_code, 200)
+
+    def test_chunk_is_received_before_the_session_is_locked(self):
+        self.start()
+        session = UploadSession.objects.get()
+        body = BytesIO(self.data[:100])
+        locked = uploads._locked
+
+        def lock_after_a_racing_writer(session):
+            self.assertEqual(body.tell(), 100)  # The whole body was read without the lock.
+            # Meanwhile a retry of the same chunk got in first.
+            with mock.patch.object(uploads, '_locked', locked):
+                uploads.write_chunk(UploadSession.objects.get(pk=session.pk), 0, BytesIO(self.data[:100]), 100, sha256(self.data[:100]))
+            return locked(session)
+
+        with mock.patch.object(uploads, '_locked', lock_after_a_racing_writer):
+            with self.assertRaises(uploads.UploadError) as raised:
+                uploads.write_chunk(session, 0, body, 100, sha256(self.data[:100]))
+        self.assertEqual((raised.exception.status, raised.exception.offset), (409, 100))
+        with open(uploads.part_path(session), 'rb') as part:
+            self.assertEqual(part.read(), self.data[:100])
+        self.assertEqual(os.listdir(uploads.upload_dir()), [f"{session.pk.hex}.part"])  # No chunk files left.
+
+    def test_whole_file_checksum_mismatch_aborts(self):
+        url = self.start(sha256=sha256(b"something else"))
+        self.put(url, 0, self.data)
+        self.assertEqual(self.client.post(f"{url}complete/").status_code, 422)
+        session = UploadSession.objects.get()
+        self.assertEqual(session.status, 'aborted')
+        self.assertFalse(os.path.exists(uploads.part_path(session)))
+        self.assertFalse(Book.objects.exists())
+
+    def test_sessions_belong_to_their_uploader(self):
+        url = self.start()
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.post('/api/uploads/', {'filename': "a.pdf", 'total_size': 10, 'title': "A"}, format='json').status_code, 403)
+
+
+class BlobStorageTests(MediaRootMixin, ContentTestData):
+    def refs(self, name):
+        return StoredBlob.objects.get(name=name).ref_count
+
+    def test_reference_counts_follow_saves_and_deletes(self):
+        first = Book.objects.create(title="A", file=ContentFile(b"same bytes", name="a.pdf"))
+        second = Book.objects.create(title="B", file=ContentFile(b"same bytes", name="b.pdf"))
+        name = first.file.name
+        self.assertEqual(second.file.name, name)  # Deduplicated.
+        self.assertTrue(name.startswith('blobs/') and not name.startswith('blobs/public/'))
+        self.assertEqual(self.refs(name), 2)
+
+        second.file = ContentFile(b"other bytes", name="b.pdf")
+        second.save()
+        self.assertEqual((self.refs(name), self.refs(second.file.name)), (1, 1))
+
+        Book.objects.only('title').get(pk=first.pk).save()  # The file field isn't loaded, so isn't counted.
+        self.assertEqual(self.refs(name), 1)
+        Book.objects.get(pk=first.pk).delete()
+        self.assertEqual(self.refs(name), 0)
+
+    def test_profile_pictures_are_public_blobs(self):
+        profile = StudentProfile.objects.create(user=self.student, profile_picture=ContentFile(b"picture", name="me.jpg"))
+        self.assertTrue(profile.profile_picture.name.startswith('blobs/public/'))
+        self.assertEqual(self.refs(profile.profile_picture.name), 1)
+        self.assertLessEqual({(Book, 'file'), (StudentProfile, 'profile_picture')}, set(storage.blob_fields()))
+
+    @override_settings(BLOB_GC_GRACE_SECONDS=60)
+    def test_saving_refreshes_an_unreferenced_blob_before_reusing_it(self):
+        book = Book.objects.create(title="A", file=ContentFile(b"kept", name="a.pdf"))
+        name = book.file.name
+        book.delete()
+        StoredBlob.objects.filter(name=name).update(updated_at=utc(2020, 1, 1))
+
+        Book.objects.create(title="B", file=ContentFile(b"kept", name="b.pdf"))
+        self.assertEqual(storage.collect_garbage(), (0, 0))
+        self.assertTrue(storage.blob_storage.exists(name))
+
+    @override_settings(BLOB_GC_GRACE_SECONDS=60)
+    def test_collected_blobs_are_written_again(self):
+        book = Book.objects.create(title="A", file=ContentFile(b"gone", name="a.pdf"))
+        name = book.file.name
+        book.delete()
+        StoredBlob.objects.filter(name=name).update(updated_at=utc(2020, 1, 1))
+        self.assertEqual(storage.collect_garbage(), (1, 4))
+        self.assertFalse(storage.blob_storage.exists(name) or StoredBlob.objects.filter(name=name).exists())
+
+        book = Book.objects.create(title="A", file=ContentFile(b"gone", name="a.pdf"))
+        self.assertTrue(storage.blob_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+
+def epub(*chapters):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('META-INF/container.xml', (
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf"/></rootfiles></container>'
+        ))
+        items = ''.join(f'<item id="c{i}" href="chapter%20{i}.xhtml"/>' for i in range(len(chapters)))
+        spine = ''.join(f'<itemref idref="c{i}"/>' for i in reversed(range(len(chapters))))
+        archive.writestr('OEBPS/content.opf', (
+            f'<package xmlns="http://www.idpf.org/2007/opf"><manifest>{items}</manifest><spine>{spine}</spine></package>'
+        ))
+        for i, body in enumerate(chapters):
+            archive.writestr(f'OEBPS/chapter {i}.xhtml', f'<html><head><style>p {{}}</style></head><body>{body}</body></html>')
+    return buffer.getvalue()
+
+
+@override_settings(BOOK_TEXT_BATCH_SIZE=1)
+class BookTextTests(MediaRootMixin, ContentTestData):
+    def setUp(self):
+        super().setUp()
+        # Spine order is the reverse of the manifest, so chapter 1 is the photosynthesis one.
+        data = epub("<p>Roots &amp; <b>water</b> &lt;uptake&gt;</p>", "<p>Leaves make food by photosynthesis.</p><script>x()</script>")
+        self.book = Book.objects.create(title="Plants", class_obj=self.class_obj, file=ContentFile(data, name="plants.epub"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def pages(self):
+        return list(BookPage.objects.filter(book=self.book).order_by('number').values_list('number', 'text'))
+
+    def search(self, query):
+        response = self.client.get('/api/books/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_epub_chapters_are_indexed_in_spine_order(self):
+        self.assertEqual(fulltext.index_pending(), (1, 2))
+        self.assertEqual(self.pages(), [(1, "Leaves make food by photosynthesis."), (2, "Roots & water <uptake>")])
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.text_source, self.book.text_status, self.book.text_claimed_until), (self.book.file.name, 'indexed', None))
+        self.assertFalse(fulltext.pending_books().exists())
+
+    def test_search_ranks_pages_and_marks_matches(self):
+        fulltext.index_pending()
+        self.assertEqual(self.search("photo"), [{
+            'book': self.book.pk, 'title': "Plants", 'page': 1,
+            'snippet': "Leaves make food by <mark>photosynthesis</mark>.",
+        }])
+        # Extracted text is escaped around the marks.
+        self.assertEqual(self.search("water")[0]['snippet'], "Roots &amp; <mark>water</mark> &lt;uptake&gt;")
+        # FTS5 syntax is searched as words, not run as operators.
+        self.assertEqual(self.search('roots OR "leaves'), [])
+        self.assertEqual(self.search("nothing here"), [])
+
+    def test_pdf_without_pypdf_is_unsupported(self):
+        book = Book.objects.create(title="Scan", class_obj=self.class_obj, file=ContentFile(b"%PDF-1.4", name="scan.pdf"))
+        with mock.patch.object(fulltext, 'PdfReader', None):
+            self.assertEqual(fulltext.index_book(book), 0)
+        book.refresh_from_db()
+        self.assertEqual(book.text_status, 'unsupported')
+
+    def test_interrupted_run_resumes_only_after_its_lease_lapses(self):
+        fulltext.index_pending()
+        # As if the worker had stopped after the first chapter.
+        BookPage.objects.filter(book=self.book, number=2).delete()
+        Book.objects.filter(pk=self.book.pk).update(text_status='indexing', text_claimed_until=timezone.now() + timedelta(minutes=5))
+        self.assertFalse(fulltext.pending_books().exists())
+        self.book.refresh_from_db()
+        self.assertEqual(fulltext.index_book(self.book), 0)
+
+        Book.objects.filter(pk=self.book.pk).update(text_claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(fulltext.index_pending(), (1, 1))
+        self.assertEqual([number for number, _ in self.pages()], [1, 2])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.text_status, 'indexed')
+
+    def test_worker_stops_once_another_takes_over(self):
+        def taken_over(handle, start):
+            yield 1, "first"
+            Book.objects.filter(pk=self.book.pk).update(text_claimed_until=timezone.now() + timedelta(hours=1))
+            yield 2, "second"
+
+        with mock.patch.dict(fulltext.EXTRACTORS, {'.epub': taken_over}):
+            self.assertEqual(fulltext.index_book(self.book), 1)
+        self.assertEqual(self.pages(), [(1, "first")])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.text_status, 'indexing')  # Left to the new worker, not marked failed.
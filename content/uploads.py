@@ -0,0 +1,192 @@
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Book, UploadSession
+
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    A chunk or completion request that can't be applied; `status` is the HTTP status to answer with.
+    """
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class PartFile(File):
+    # FileSystemStorage moves files that expose temporary_file_path() instead of copying them.
+    def temporary_file_path(self):
+        return self.name
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def upload_dir():
+    return _setting('UPLOAD_SESSION_DIR', os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial'))
+
+
+def part_path(session):
+    return os.path.join(upload_dir(), f"{session.pk.hex}.part")
+
+
+def max_chunk_size():
+    return _setting('UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+
+
+def start(user, **fields):
+    session = UploadSession.objects.create(
+        user=user, expires_at=timezone.now() + timedelta(seconds=_setting('UPLOAD_SESSION_LIFETIME', 24 * 60 * 60)), **fields,
+    )
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def _locked(session):
+    # Chunk appends and completion of one session run one at a time: each holds the row lock from
+    # its checks until its file changes and the new state are in place. Nothing slow runs under it.
+    return UploadSession.objects.select_for_update().get(pk=session.pk)
+
+
+def _check_chunk(session, offset, length):
+    if session.status != 'active' or session.expires_at <= timezone.now():
+        raise UploadError("This upload session is no longer active.", status=410)
+    if offset != session.received_size:
+        # Also how a racing PUT of the same chunk ends: it sees the offset the winner advanced.
+        raise UploadError("Chunk offset does not match the bytes received so far.", status=409, offset=session.received_size)
+    if offset + length > session.total_size:
+        raise UploadError("Chunk runs past the declared file size.")
+
+
+def _receive(session, offset, stream, length, sha256):
+    """
+    Streams the chunk into its own file beside the partial one, hashing as it goes, and returns its
+    path once it is whole and its SHA-256 matches.
+    """
+    fd, path = tempfile.mkstemp(dir=upload_dir(), prefix=f"{session.pk.hex}.", suffix='.chunk')
+    try:
+        digest = hashlib.sha256()
+        written = 0
+        with os.fdopen(fd, 'wb') as chunk:
+            while written < length:
+                block = stream.read(min(READ_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                chunk.write(block)
+                digest.update(block)
+                written += len(block)
+        if written != length or digest.hexdigest() != sha256.lower():
+            raise UploadError("Chunk was incomplete or failed its checksum; resend it.", offset=offset)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def write_chunk(session, offset, stream, length, sha256):
+    """
+    Receives one chunk at `offset`, never holding it in memory whole. The body is read from the
+    client, which on a slow network can take minutes, before any lock is taken; the row lock only
+    covers re-checking the offset and appending the verified chunk from local disk. A chunk that
+    fails its checksum is dropped and the client resends it. Returns the new offset.
+    """
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError(f"Chunks must be between 1 and {max_chunk_size()} bytes.", status=413 if length > 0 else 400)
+    _check_chunk(session, offset, length)  # Fails fast, before the body is read.
+
+    chunk_path = _receive(session, offset, stream, length, sha256)
+    try:
+        with transaction.atomic():
+            locked = _locked(session)
+            _check_chunk(locked, offset, length)
+            with open(part_path(locked), 'r+b') as part, open(chunk_path, 'rb') as chunk:
+                part.seek(offset)
+                try:
+                    shutil.copyfileobj(chunk, part, READ_BLOCK_SIZE)
+                    part.truncate()
+                except OSError:
+                    part.truncate(offset)
+                    raise
+            locked.received_size = offset + length
+            locked.save(update_fields=['received_size', 'updated_at'])
+    finally:
+        os.remove(chunk_path)
+    session.received_size = locked.received_size
+    return session.received_size
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(READ_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete(session):
+    """
+    Checks the upload is whole (and matches the declared SHA-256, read back in blocks), then moves
+    the partial file into storage as a new Book's file without copying it.
+    """
+    with transaction.atomic():
+        locked = _locked(session)
+        if locked.status != 'active':
+            raise UploadError("This upload session is no longer active.", status=410)
+        if locked.received_size != locked.total_size:
+            raise UploadError("The upload is not complete yet.", status=409, offset=locked.received_size)
+        path = part_path(locked)
+        if locked.sha256 and _file_sha256(path) != locked.sha256.lower():
+            abort(locked)  # Committed before the error is raised below.
+            book = None
+        else:
+            book = Book(title=locked.title, author=locked.author, subject=locked.subject, class_obj=locked.class_obj)
+            with open(path, 'rb') as handle:
+                book.file.save(locked.filename, PartFile(handle, name=path), save=False)
+            book.save()
+            locked.book = book
+            locked.status = 'complete'
+            locked.save(update_fields=['book', 'status', 'updated_at'])
+    if book is None:
+        raise UploadError("The assembled file does not match its checksum; start a new upload.", status=422)
+    if os.path.exists(path):  # Storages that copy rather than move leave it behind.
+        os.remove(path)
+    session.book, session.status = book, 'complete'
+    return book
+
+
+def abort(session):
+    session.status = 'aborted'
+    session.save(update_fields=['status', 'updated_at'])
+    # Chunk files are only left behind if a worker died while receiving one.
+    for path in [part_path(session), *glob.glob(os.path.join(upload_dir(), f"{session.pk.hex}.*.chunk"))]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired(now=None):
+    """
+    Aborts sessions past their expiry and removes their partial files. Returns how many were purged.
+    """
+    now = now or timezone.now()
+    stale = UploadSession.objects.filter(status='active', expires_at__lte=now)
+    count = 0
+    for session in stale.iterator():
+        abort(session)
+        count += 1
+    return count
@@ -6,7 +6,9 @@ from .views import (
     dictionary_lookup, BookViewSet, UserLessonProgressViewSet, ai_note_taking, 
     ProcessedNoteViewSet, UserQuizAttemptViewSet, RewardViewSet, UserRewardViewSet, CheckpointViewSet,
     AILessonQuizAttemptViewSet, UserNoteViewSet, TranslatedLessonContentViewSet,
-    ai_summarize_lesson, ai_translate_lesson
+    ai_summarize_lesson, ai_translate_lesson, ScoreAccumulatorViewSet,
+    LearningStreakViewSet, LeaderboardViewSet, ActivityRollupViewSet,
+    ActiveUsersViewSet, AttentionQueueViewSet, UploadSessionViewSet
 )
 
 router = DefaultRouter()
@@ -26,6 +28,13 @@ router.register(r'user-rewards', UserRewardViewSet, basename='user-reward')
 router.register(r'checkpoints', CheckpointViewSet, basename='checkpoint')
 router.register(r'usernotes', UserNoteViewSet, basename='usernote')
 router.register(r'translated-content', TranslatedLessonContentViewSet, basename='translatedcontent')
+router.register(r'score-summaries', ScoreAccumulatorViewSet)
+router.register(r'streaks', LearningStreakViewSet)
+router.register(r'leaderboards', LeaderboardViewSet, basename='leaderboard')
+router.register(r'activity-rollups', ActivityRollupViewSet, basename='activity-rollup')
+router.register(r'active-users', ActiveUsersViewSet, basename='active-users')
+router.register(r'attention-queue', AttentionQueueViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 
 
 urlpatterns = [
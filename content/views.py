@@ -1,3 +1,4 @@
+import os
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes as dec_permission_classes
@@ -5,24 +6,34 @@ from rest_framework.response import Response
 from .models import (
     Class, Subject, Lesson, Quiz, Question, Choice, UserLessonProgress, 
     UserQuizAttempt, Book, ProcessedNote, Reward, UserReward, Checkpoint, AILessonQuizAttempt,
-    UserNote, TranslatedLessonContent
+    UserNote, TranslatedLessonContent, ScoreAccumulator, LearningStreak, DailyActivityRollup, StudentRiskSignal, UploadSession
 )
-from accounts.models import CustomUser, ParentStudentLink, StudentProfile
+from accounts.models import CustomUser, StudentProfile
+from accounts.authentication import linked_student_ids
+from notifications import outbox
 from .serializers import ( 
     ProcessedNoteSerializer, ClassSerializer, SubjectSerializer, LessonSerializer, BookSerializer, 
     UserLessonProgressSerializer, QuizSerializer, QuestionSerializer, ChoiceSerializer, UserQuizAttemptSerializer,
     RewardSerializer, UserRewardSerializer, CheckpointSerializer, AILessonQuizAttemptSerializer,
-    UserNoteSerializer, TranslatedLessonContentSerializer
+    UserNoteSerializer, TranslatedLessonContentSerializer, ScoreAccumulatorSerializer,
+    LearningStreakSerializer, StudentRiskSignalSerializer, UploadSessionSerializer
 )
 from accounts.permissions import IsTeacher, IsTeacherOrReadOnly, IsStudent, IsParent
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend 
 from django.http import JsonResponse 
 from django.db.models import Q, Exists, OuterRef
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
+from . import activity
+from .downloads import PassthroughRenderer, serve_file
+from . import fulltext
+from . import uploads
+from .gamification import leaderboards
+from . import rollups, sketches
 
 
 class ClassViewSet(viewsets.ModelViewSet):
@@ -165,7 +176,9 @@ class QuizViewSet(viewsets.ModelViewSet):
         total_questions_in_quiz = quiz.questions.count()
 
         if total_questions_in_quiz == 0:
-            attempt = UserQuizAttempt.objects.create(user=user, quiz=quiz, score=0, passed=False, answers=answers_data)
+            with transaction.atomic():
+                attempt = UserQuizAttempt.objects.create(user=user, quiz=quiz, score=0, passed=False, answers=answers_data)
+                activity.quiz_attempt_recorded(user, quiz.lesson.subject_id, attempt.score, attempt.passed, attempt.completed_at)
             return Response(UserQuizAttemptSerializer(attempt, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
 
         for answer_data in answers_data:
@@ -188,13 +201,15 @@ class QuizViewSet(viewsets.ModelViewSet):
         score_percentage = (correct_answers_count / total_questions_in_quiz) * 100 if total_questions_in_quiz > 0 else 0
         passed = score_percentage >= quiz.pass_mark_percentage
 
-        attempt = UserQuizAttempt.objects.create(
-            user=user,
-            quiz=quiz,
-            score=score_percentage,
-            passed=passed,
-            answers=answers_data 
-        )
+        with transaction.atomic():
+            attempt = UserQuizAttempt.objects.create(
+                user=user,
+                quiz=quiz,
+                score=score_percentage,
+                passed=passed,
+                answers=answers_data 
+            )
+            activity.quiz_attempt_recorded(user, quiz.lesson.subject_id, attempt.score, attempt.passed, attempt.completed_at)
         
         return Response(UserQuizAttemptSerializer(attempt, context=self.get_serializer_context()).data, status=status.HTTP_200_OK)
 
@@ -280,8 +295,7 @@ class UserLessonProgressViewSet(viewsets.ModelViewSet):
             student_ids = CustomUser.objects.filter(school=user.school, role='Student').values_list('id', flat=True)
             return qs.filter(user_id__in=student_ids)
         elif user.role == 'Parent':
-            linked_student_ids = ParentStudentLink.objects.filter(parent=user).values_list('student_id', flat=True)
-            return qs.filter(user_id__in=linked_student_ids)
+            return qs.filter(user_id__in=linked_student_ids(user))
         elif user.is_staff or (user.role == 'Admin' and user.is_school_admin): 
             if user.school:
                  student_ids = CustomUser.objects.filter(school=user.school, role='Student').values_list('id', flat=True)
@@ -293,20 +307,26 @@ class UserLessonProgressViewSet(viewsets.ModelViewSet):
         if not self.request.user.is_authenticated or self.request.user.role != 'Student':
             raise PermissionDenied("Only students can record their lesson progress.")
         lesson = serializer.validated_data.get('lesson')
-        existing_progress, created = UserLessonProgress.objects.update_or_create(
-            user=self.request.user, 
-            lesson=lesson,
-            defaults=serializer.validated_data 
-        )
-        if not created: 
+        with transaction.atomic():
+            was_completed = UserLessonProgress.objects.filter(user=self.request.user, lesson=lesson, completed=True).exists()
+            existing_progress, _ = UserLessonProgress.objects.update_or_create(
+                user=self.request.user, 
+                lesson=lesson,
+                defaults=serializer.validated_data 
+            )
             serializer.instance = existing_progress
-        serializer.save(user=self.request.user)
+            progress = serializer.save(user=self.request.user)
+            activity.lesson_progress_recorded(self.request.user, progress, progress.completed and not was_completed)
 
 
     def perform_update(self, serializer):
         if serializer.instance.user != self.request.user and not (self.request.user.is_staff or (self.request.user.is_authenticated and self.request.user.role == 'Teacher')): 
             raise PermissionDenied("You can only update your own progress or lack permissions.")
-        serializer.save()
+        was_completed = serializer.instance.completed
+        with transaction.atomic():
+            progress = serializer.save()
+            if progress.user == self.request.user:
+                activity.lesson_progress_recorded(self.request.user, progress, progress.completed and not was_completed)
 
 
 class ProcessedNoteViewSet(viewsets.ModelViewSet):
@@ -322,16 +342,26 @@ class ProcessedNoteViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         original_notes = serializer.validated_data.get('original_notes')
         processed_output = f"AI Processed Output (Placeholder): {original_notes[:50]}..." if original_notes else "No notes to process."
-        serializer.save(user=self.request.user, processed_output=processed_output)
+        with transaction.atomic():
+            note = serializer.save(user=self.request.user, processed_output=processed_output)
+            activity.note_saved(self.request.user, note.created_at)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def export_email(self, request, pk=None):
         note = self.get_object()
-        return Response({"message": f"Email export for note '{note.id}' requested (placeholder)."}, status=status.HTTP_200_OK)
+        if not request.user.email:
+            return Response({'error': 'Add an email address to your profile to export notes.'}, status=status.HTTP_400_BAD_REQUEST)
+        lesson = f" for {note.lesson.title}" if note.lesson else ''
+        # Queued rather than sent here: the outbox worker delivers it without holding up this request.
+        outbox.enqueue(
+            request.user, 'note_export', f"Your notes{lesson}",
+            f"{note.processed_output or ''}\n\nOriginal notes:\n{note.original_notes}".strip(),
+        )
+        return Response({"message": f"Email export for note '{note.id}' queued."}, status=status.HTTP_202_ACCEPTED)
 
 
 class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all().select_related('subject', 'class_obj')
+    queryset = Book.objects.all().select_related('subject__class_obj', 'class_obj')
     serializer_class = BookSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
     filter_backends = [DjangoFilterBackend]
@@ -341,37 +371,161 @@ class BookViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         return {'request': self.request, **super().get_serializer_context()}
     
+    @staticmethod
+    def can_upload(user, subject, class_obj):
+        # Platform staff anywhere; teachers and school admins within their own school.
+        if user.is_staff:
+            return True
+        if not user.is_authenticated or not (user.role == 'Teacher' or (user.role == 'Admin' and user.is_school_admin)):
+            return False
+        if not subject and not class_obj:
+            return bool(user.school)
+        return bool(
+            (subject and subject.class_obj.school == user.school) or
+            (class_obj and class_obj.school == user.school)
+        )
+
     def perform_create(self, serializer):
-        user = self.request.user
-        can_create = False
+        subject = serializer.validated_data.get('subject')
+        class_obj = serializer.validated_data.get('class_obj')
+        if not self.can_upload(self.request.user, subject, class_obj):
+            raise PermissionDenied("You do not have permission to upload books for this context.")
+        serializer.save()
+
+    @staticmethod
+    def can_read_file(user, book):
+        # Books tied to a class or subject belong to that school; parents read their children's schools' books.
         if user.is_staff:
-            can_create = True
-        elif user.is_authenticated and user.role == 'Teacher':
-            subject = serializer.validated_data.get('subject')
-            class_obj = serializer.validated_data.get('class_obj')
-            school_context_ok = False
-            if subject and subject.class_obj.school == user.school: school_context_ok = True
-            if class_obj and class_obj.school == user.school: school_context_ok = True
-            if not subject and not class_obj and user.school: 
-                serializer.save() 
-                return
-            if school_context_ok: can_create = True
+            return True
+        class_obj = book.class_obj or (book.subject.class_obj if book.subject else None)
+        if class_obj is None or class_obj.school_id is None:
+            return True
+        if user.school_id == class_obj.school_id:
+            return True
+        if user.role == 'Parent':
+            return StudentProfile.objects.filter(user_id__in=linked_student_ids(user), school_id=class_obj.school_id).exists()
+        return False
+
+    @staticmethod
+    def readable_books(user, queryset):
+        # can_read_file() as a filter: books with no school, and books of the user's school (or,
+        # for parents, their children's schools).
+        if user.is_staff:
+            return queryset
+        schools = {user.school_id} - {None}
+        if user.role == 'Parent':
+            schools.update(StudentProfile.objects.filter(user_id__in=linked_student_ids(user)).exclude(school=None).values_list('school_id', flat=True))
+        return queryset.filter(
+            Q(class_obj__isnull=False, class_obj__school_id__in=schools) |
+            Q(class_obj__isnull=True, subject__class_obj__school_id__in=schools) |
+            Q(class_obj__isnull=False, class_obj__school__isnull=True) |
+            Q(class_obj__isnull=True, subject__isnull=True) |
+            Q(class_obj__isnull=True, subject__class_obj__school__isnull=True)
+        )
 
-        elif user.is_authenticated and user.role == 'Admin' and user.is_school_admin:
-            subject = serializer.validated_data.get('subject')
-            class_obj = serializer.validated_data.get('class_obj')
-            if (subject and subject.class_obj.school == user.school) or \
-               (class_obj and class_obj.school == user.school) or \
-               (not subject and not class_obj and user.school): 
-                can_create = True
-                if not subject and not class_obj:
-                    serializer.save() 
-                    return
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """
+        Full-text search inside the books the user can read: ?q=<words>&limit=<n, max 50>&offset=<n>.
+        Returns matching pages, best first, each with an HTML snippet marking the matched words.
+        """
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            raise ValidationError({"q": "Enter at least 2 characters."})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            raise ValidationError({"limit": "limit and offset must be integers."})
+        results = fulltext.search(query, self.readable_books(request.user, Book.objects.all()), limit=limit, offset=offset)
+        return Response({'results': results, 'next_offset': offset + limit if len(results) == limit else None})
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated], renderer_classes=[PassthroughRenderer])
+    def download(self, request, pk=None):
+        """
+        The book's file for signed-in readers with access, with HTTP Range support so PDF viewers
+        can fetch pages lazily. See content.downloads.serve_file for the offload modes.
+        """
+        book = self.get_object()
+        if not self.can_read_file(request.user, book):
+            raise PermissionDenied("You do not have access to this book.")
+        if not book.file:
+            raise NotFound("This book has no file.")
+        # Blob names are hashes; offer the reader the book's title instead.
+        return serve_file(request, book.file, filename=f"{book.title}{os.path.splitext(book.file.name)[1]}")
+
+
+
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """
+    Resumable chunked book uploads:
+
+        POST   uploads/                 {filename, total_size, title, ...[, sha256]} -> session with id and chunk_size
+        PUT    uploads/<id>/            raw chunk body; headers Upload-Offset and X-Chunk-SHA256
+        GET    uploads/<id>/            current offset, to resume after a dropped connection
+        POST   uploads/<id>/complete/   assemble and create the Book
+        DELETE uploads/<id>/            abort
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return self.queryset.filter(user=self.request.user)
 
-        if not can_create:
+    def _offset_response(self, session, status_code=status.HTTP_200_OK):
+        response = Response(self.get_serializer(session).data, status=status_code)
+        response['Upload-Offset'] = str(session.received_size)
+        return response
+
+    def _error_response(self, error):
+        response = Response({'error': str(error), 'offset': error.offset}, status=error.status)
+        if error.offset is not None:
+            response['Upload-Offset'] = str(error.offset)
+        return response
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if not BookViewSet.can_upload(request.user, data.get('subject'), data.get('class_obj')):
             raise PermissionDenied("You do not have permission to upload books for this context.")
-        serializer.save()
+        return self._offset_response(uploads.start(request.user, **data), status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return self._offset_response(self.get_object())
+
+    def update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({'error': 'Upload-Offset and Content-Length headers are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        checksum = request.META.get('HTTP_X_CHUNK_SHA256', '')
+        if not checksum:
+            return Response({'error': 'X-Chunk-SHA256 header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        # The body is read straight from the request stream; request.data is never parsed.
+        try:
+            uploads.write_chunk(session, offset, request.stream, length, checksum)
+        except uploads.UploadError as e:
+            return self._error_response(e)
+        return self._offset_response(session)
+
+    def destroy(self, request, pk=None):
+        session = self.get_object()
+        if session.status == 'active':
+            uploads.abort(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        try:
+            book = uploads.complete(session)
+        except uploads.UploadError as e:
+            return self._error_response(e)
+        return Response(BookSerializer(book, context=self.get_serializer_context()).data, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
@@ -393,12 +547,14 @@ def ai_note_taking(request):
         except Lesson.DoesNotExist:
             pass 
 
-    processed_note_obj = ProcessedNote.objects.create(
-        user=user,
-        lesson=lesson,
-        original_notes=notes_input,
-        processed_output=processed_notes_result
-    )
+    with transaction.atomic():
+        processed_note_obj = ProcessedNote.objects.create(
+            user=user,
+            lesson=lesson,
+            original_notes=notes_input,
+            processed_output=processed_notes_result
+        )
+        activity.note_saved(user, processed_note_obj.created_at)
     
     serializer = ProcessedNoteSerializer(processed_note_obj, context={'request': request})
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -429,8 +585,7 @@ class UserQuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
         if user.role == 'Student':
             return qs.filter(user=user)
         elif user.role == 'Parent':
-            linked_student_ids = ParentStudentLink.objects.filter(parent=user).values_list('student_id', flat=True)
-            return qs.filter(user_id__in=linked_student_ids)
+            return qs.filter(user_id__in=linked_student_ids(user))
         elif user.role == 'Teacher' and user.school:
             student_ids_in_school = CustomUser.objects.filter(school=user.school, role='Student').values_list('id', flat=True)
             return qs.filter(user_id__in=student_ids_in_school)
@@ -445,8 +600,161 @@ class UserQuizAttemptViewSet(viewsets.ReadOnlyModelViewSet):
         return {'request': self.request, **super().get_serializer_context()}
 
 
+class ScoreAccumulatorViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ScoreAccumulator.objects.all().select_related('subject')
+    serializer_class = ScoreAccumulatorSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['user', 'subject', 'subject__class_obj', 'term']
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = super().get_queryset()
+        if user.role == 'Student':
+            return qs.filter(user=user)
+        elif user.role == 'Parent':
+            return qs.filter(user_id__in=linked_student_ids(user))
+        elif (user.role == 'Teacher' or (user.role == 'Admin' and user.is_school_admin)) and user.school:
+            return qs.filter(user__school=user.school, user__role='Student')
+        elif user.is_staff:
+            return qs
+        return qs.none()
+
+
+class LearningStreakViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = LearningStreak.objects.all().select_related('user__school')
+    serializer_class = LearningStreakSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['user']
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = super().get_queryset()
+        if user.role == 'Student':
+            return qs.filter(user=user)
+        elif user.role == 'Parent':
+            return qs.filter(user_id__in=linked_student_ids(user))
+        elif (user.role == 'Teacher' or (user.role == 'Admin' and user.is_school_admin)) and user.school:
+            return qs.filter(user__school=user.school)
+        elif user.is_staff:
+            return qs
+        return qs.none()
+
+    @action(detail=False, methods=['get'])
+    def me(self, request):
+        streak, _ = LearningStreak.objects.get_or_create(user=request.user)
+        return Response(self.get_serializer(streak).data)
+
+
+class LeaderboardViewSet(viewsets.ViewSet):
+    """
+    Ranked points leaderboards per class or school: /leaderboards/?scope=class&id=3&limit=10
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        scope = request.query_params.get('scope', 'class')
+        scope_id = request.query_params.get('id')
+        if scope not in ('class', 'school') or not scope_id or not scope_id.isdigit():
+            raise ValidationError({"detail": "Provide scope ('class' or 'school') and a numeric id."})
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+
+        school_id, top, me = leaderboards.standings(scope, int(scope_id), limit=limit, user_id=request.user.id)
+        if not request.user.is_staff and (school_id is None or school_id != request.user.school_id):
+            raise PermissionDenied("You can only view leaderboards for your own school.")
+        return Response({'scope': scope, 'id': int(scope_id), 'top': top, 'me': me})
+
+
+class ActivityRollupViewSet(viewsets.ViewSet):
+    """
+    Daily activity time series: /activity-rollups/?metric=active_students&start=2025-06-01&end=2025-06-30
+    Optional: school, class_obj, group_by=class. Dates are school-local days; defaults to the current month.
+    """
+    permission_classes = [IsAuthenticated]
+    max_range_days = 400
+
+    def _parse_date(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: "Use YYYY-MM-DD."})
+
+    def _parse_id(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "Must be an integer id."})
+
+    def list(self, request):
+        user = request.user
+        metric = request.query_params.get('metric', 'active_students')
+        if metric not in dict(DailyActivityRollup.METRIC_CHOICES):
+            raise ValidationError({"metric": f"Choose from {', '.join(dict(DailyActivityRollup.METRIC_CHOICES))}."})
+
+        school_id = self._parse_id('school')
+        class_id = self._parse_id('class_obj')
+        if not user.is_staff:
+            if user.role not in ('Teacher', 'Admin') or not user.school_id:
+                raise PermissionDenied("Only school staff can view activity analytics.")
+            school_id = user.school_id
+
+        today = user.school.local_date() if user.school_id else timezone.localdate()
+        start = self._parse_date('start', today.replace(day=1))
+        end = self._parse_date('end', today)
+        if end < start or (end - start).days > self.max_range_days:
+            raise ValidationError({"detail": f"end must be on or after start and within {self.max_range_days} days."})
+
+        rows = rollups.series(
+            metric, start, end,
+            school_id=school_id,
+            class_id=class_id,
+            group_by_class=request.query_params.get('group_by') == 'class',
+        )
+        return Response({'metric': metric, 'start': start, 'end': end, 'results': rows})
+
+
+class ActiveUsersViewSet(ActivityRollupViewSet):
+    """
+    Approximate distinct active students (HyperLogLog, ~2% error). Without start/end returns
+    daily, weekly and monthly actives ending today. Platform staff may omit school to get all schools.
+    """
+    def list(self, request):
+        user = request.user
+        school_id = self._parse_id('school')
+        if not user.is_staff:
+            if not (user.role == 'Admin' and user.is_school_admin and user.school_id):
+                raise PermissionDenied("Only school or platform admins can view active user counts.")
+            school_id = user.school_id
+
+        today = user.school.local_date() if user.school_id else timezone.localdate()
+        if 'start' in request.query_params or 'end' in request.query_params:
+            start = self._parse_date('start', today)
+            end = self._parse_date('end', today)
+            if end < start or (end - start).days > self.max_range_days:
+                raise ValidationError({"detail": f"end must be on or after start and within {self.max_range_days} days."})
+            return Response({'school': school_id, 'start': start, 'end': end, 'active_users': sketches.distinct_active_users(start, end, school_id)})
+
+        return Response({
+            'school': school_id,
+            'date': today,
+            'daily': sketches.distinct_active_users(today, today, school_id),
+            'weekly': sketches.distinct_active_users(today - timedelta(days=6), today, school_id),
+            'monthly': sketches.distinct_active_users(today - timedelta(days=29), today, school_id),
+        })
+
+
 class RewardViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Reward.objects.all()
+    queryset = Reward.objects.all().prefetch_related('rules')
     serializer_class = RewardSerializer
     permission_classes = [permissions.AllowAny] # All users can see available rewards
 
@@ -511,7 +819,9 @@ class AILessonQuizAttemptViewSet(viewsets.ModelViewSet):
         if not passed:
             can_reattempt_at = timezone.now() + timedelta(hours=2)
 
-        serializer.save(user=user, can_reattempt_at=can_reattempt_at)
+        with transaction.atomic():
+            attempt = serializer.save(user=user, can_reattempt_at=can_reattempt_at)
+            activity.quiz_attempt_recorded(user, attempt.lesson.subject_id, attempt.score, attempt.passed, attempt.attempted_at, attempt.can_reattempt_at)
 
 class UserNoteViewSet(viewsets.ModelViewSet):
     queryset = UserNote.objects.all()
@@ -524,11 +834,13 @@ class UserNoteViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         lesson = serializer.validated_data.get('lesson')
         # Use update_or_create to handle both creation and updates seamlessly
-        note, created = UserNote.objects.update_or_create(
-            user=self.request.user,
-            lesson=lesson,
-            defaults={'notes': serializer.validated_data.get('notes')}
-        )
+        with transaction.atomic():
+            note, created = UserNote.objects.update_or_create(
+                user=self.request.user,
+                lesson=lesson,
+                defaults={'notes': serializer.validated_data.get('notes')}
+            )
+            activity.note_saved(self.request.user, note.updated_at)
         serializer.instance = note # Ensure serializer has the instance for response
         # No need to call save again as update_or_create does it
     
@@ -536,7 +848,9 @@ class UserNoteViewSet(viewsets.ModelViewSet):
         # Ensure user can only update their own notes
         if serializer.instance.user != self.request.user:
             raise PermissionDenied("You can only update your own notes.")
-        serializer.save()
+        with transaction.atomic():
+            note = serializer.save()
+            activity.note_saved(self.request.user, note.updated_at)
 
 
 class TranslatedLessonContentViewSet(viewsets.ModelViewSet):
@@ -605,3 +919,27 @@ def ai_translate_lesson(request):
         return Response(TranslatedLessonContentSerializer(translation).data, status=status.HTTP_200_OK)
     except Lesson.DoesNotExist:
         return Response({'error': 'Lesson not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+class AttentionQueueViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Students needing attention, highest risk first. Filter by ?class_obj=<id>; pass ?all=true to
+    include students with no current warning signs.
+    """
+    queryset = StudentRiskSignal.objects.all().select_related('user__student_profile')
+    serializer_class = StudentRiskSignalSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['class_obj', 'user']
+
+    def get_queryset(self):
+        user = self.request.user
+        qs = super().get_queryset()
+        if self.request.query_params.get('all', '').lower() not in ('1', 'true', 'yes'):
+            qs = qs.filter(needs_attention=True)
+        qs = qs.order_by('-risk_score', 'id')
+        if (user.role == 'Teacher' or (user.role == 'Admin' and user.is_school_admin)) and user.school:
+            return qs.filter(class_obj__school=user.school)
+        elif user.is_staff:
+            return qs
+        return qs.none()
@@ -0,0 +1,147 @@
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from accounts.authentication import linked_student_ids
+from accounts.models import StudentProfile
+from content.models import Class as ContentClass
+from . import pubsub
+from .models import Event
+
+CACHE_VERSION_KEY = 'event-calendar:version'
+USER_AUDIENCE_KEY = 'event-audience:{}'
+# Query parameters that narrow the audience of a calendar; each combination is cached separately.
+AUDIENCE_FIELDS = ('school', 'target_class', 'type')
+
+
+def invalidate_cache():
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(CACHE_VERSION_KEY, 2, None)
+
+
+def overlapping(queryset, start, end):
+    """
+    Events that overlap [start, end]. Split into two range conditions so each side can use an index:
+    events starting inside the window on (school, date), and earlier events still running on
+    (school, end_date). A single COALESCE(end_date, date) >= start could use neither.
+    """
+    return queryset.filter(Q(date__range=(start, end)) | Q(date__lt=start, end_date__gte=start))
+
+
+def _months(start, end):
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _month_rows(year, month, audience, serializer_class):
+    first = date(year, month, 1)
+    last = date(year, month, monthrange(year, month)[1])
+    queryset = overlapping(
+        Event.objects.select_related('school', 'target_class', 'created_by').filter(**audience), first, last
+    ).order_by('date', 'id')
+    return [dict(row) for row in serializer_class(queryset, many=True).data]
+
+
+def events_between(start, end, audience, serializer_class):
+    """
+    Serialized events overlapping [start, end] for one audience (filters on AUDIENCE_FIELDS).
+    Results are cached per calendar month, so a month view is one indexed query on a miss and a
+    single cache read on a hit. Any event write invalidates every cached month.
+    """
+    version = cache.get_or_set(CACHE_VERSION_KEY, 1, None)
+    audience_key = ':'.join(f"{field}={audience.get(field, '')}" for field in AUDIENCE_FIELDS)
+    keys = {f"event-calendar:{version}:{year}-{month:02d}:{audience_key}": (year, month) for year, month in _months(start, end)}
+    cached = cache.get_many(keys)
+    missing = {}
+    for key, (year, month) in keys.items():
+        if key not in cached:
+            missing[key] = cached[key] = _month_rows(year, month, audience, serializer_class)
+    if missing:
+        cache.set_many(missing, getattr(settings, 'EVENT_CALENDAR_CACHE_SECONDS', 300))
+
+    # A multi-month event shows up in every month it touches; keep one copy.
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    events = {}
+    for key in keys:
+        for row in cached[key]:
+            if row['date'] <= end_iso and (row['end_date'] or row['date']) >= start_iso:
+                events[row['id']] = row
+    return sorted(events.values(), key=lambda row: (row['date'], row['id']))
+
+
+def _resolve_audience(user):
+    schools, classes = set(), set()
+    if user.school_id:
+        schools.add(user.school_id)
+    if user.role == 'Student':
+        rows = StudentProfile.objects.filter(user=user).values_list('school_id', 'enrolled_class_id')
+    elif user.role == 'Teacher':
+        rows = ContentClass.objects.filter(teachers_assigned__user=user).values_list('school_id', 'id')
+    elif user.role == 'Parent':
+        rows = StudentProfile.objects.filter(user_id__in=linked_student_ids(user)).values_list('school_id', 'enrolled_class_id')
+    else:
+        rows = []
+    for school_id, class_id in rows:
+        if school_id:
+            schools.add(school_id)
+        if class_id:
+            classes.add(class_id)
+    return sorted(schools), sorted(classes)
+
+
+def user_audience(user):
+    """
+    (school ids, class ids) whose events the user should see: their own school and, by role, the
+    enrolled class, the assigned classes or the children's classes. Cached per user.
+    """
+    key = USER_AUDIENCE_KEY.format(user.pk)
+    audience = cache.get(key)
+    if audience is None:
+        audience = _resolve_audience(user)
+        cache.set(key, audience, getattr(settings, 'EVENT_AUDIENCE_CACHE_SECONDS', 300))
+    return audience
+
+
+def invalidate_user_audience(*user_ids):
+    cache.delete_many([USER_AUDIENCE_KEY.format(user_id) for user_id in user_ids])
+
+
+def feed_queryset(user):
+    """
+    Platform-wide, school-wide and class events for the user as a single query: the audiences are
+    OR'ed together instead of fetched separately and merged.
+    """
+    return audience_events(*user_audience(user))
+
+
+def audience_events(school_ids, class_ids):
+    return Event.objects.filter(
+        Q(school__isnull=True, target_class__isnull=True)
+        | Q(school_id__in=school_ids, target_class__isnull=True)
+        | Q(target_class_id__in=class_ids)
+    )
+
+
+def event_channel(event):
+    # The narrowest audience an event targets; subscribers hold every channel they belong to.
+    if event.target_class_id:
+        return pubsub.class_channel(event.target_class_id)
+    if event.school_id:
+        return pubsub.school_channel(event.school_id)
+    return pubsub.platform_channel()
+
+
+def user_channels(user):
+    school_ids, class_ids = user_audience(user)
+    return [
+        pubsub.platform_channel(), pubsub.user_channel(user.pk),
+        *(pubsub.school_channel(school_id) for school_id in school_ids),
+        *(pubsub.class_channel(class_id) for class_id in class_ids),
+    ]
@@ -0,0 +1,68 @@
+from datetime import timedelta, timezone as dt_timezone
+
+PRODID = '-//StepWise//Events//EN'
+ITERATOR_CHUNK_SIZE = 500
+
+
+def escape_text(value):
+    # RFC 5545 3.3.11: backslash, semicolon, comma and newlines are escaped in TEXT values.
+    return (
+        (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def fold(line):
+    """
+    Folds a content line to 75 octets per physical line (RFC 5545 3.1), never splitting a UTF-8 character.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # Continuation lines start with a space.
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def event_lines(event, host):
+    # All-day events: DTEND is exclusive, so a one-day event ends the next day.
+    end = (event.end_date or event.date) + timedelta(days=1)
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{event.pk}@{host}",
+        f"DTSTAMP:{_utc(event.updated_at)}",
+        f"LAST-MODIFIED:{_utc(event.updated_at)}",
+        f"DTSTART;VALUE=DATE:{event.date:%Y%m%d}",
+        f"DTEND;VALUE=DATE:{end:%Y%m%d}",
+        f"SUMMARY:{escape_text(event.title)}",
+        f"CATEGORIES:{escape_text(event.type)}",
+    ]
+    if event.description:
+        lines.append(f"DESCRIPTION:{escape_text(event.description)}")
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def stream_calendar(queryset, name, host):
+    """
+    Yields an iCalendar document one event at a time; the queryset is read with iterator() so
+    memory stays flat however many events a school has.
+    """
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f"PRODID:{PRODID}", 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+        f"X-WR-CALNAME:{escape_text(name)}",
+    ])
+    for event in queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield event_lines(event, host)
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import deliver
+
+
+class Command(BaseCommand):
+    help = "Delivers due outbox messages as one digest per recipient over a single mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Messages claimed per batch (default: OUTBOX_BATCH_SIZE).")
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling for due messages.")
+        parser.add_argument('--interval', type=float, default=10, help="Seconds to sleep between polls when idle (with --loop).")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver(batch_size=options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue  # Drain everything that is due before sleeping.
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {total_sent} digests; {total_failed} failed and will be retried."))
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.9 on 2026-10-19 18:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0006_school_normalized_name_schoolnametrigram'),
+        ('content', '0015_studentrisksignal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('date', models.DateField()),
+                ('end_date', models.DateField(blank=True, help_text='Optional: For multi-day events', null=True)),
+                ('type', models.CharField(choices=[('Holiday', 'Holiday'), ('Exam', 'Exam'), ('Meeting', 'Meeting'), ('Activity', 'Activity'), ('Deadline', 'Deadline'), ('General', 'General')], default='General', max_length=10)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_events', to=settings.AUTH_USER_MODEL)),
+                ('school', models.ForeignKey(blank=True, help_text='If specific to a school', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='school_events', to='accounts.school')),
+                ('target_class', models.ForeignKey(blank=True, help_text='If specific to a class within the selected school', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='class_events', to='content.class')),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['school', 'date'], name='event_school_date'), models.Index(fields=['school', 'end_date'], name='event_school_end_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.9 on 2026-10-20 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='notifications.event'),
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('note_export', 'Note export'), ('event', 'Event announcement'), ('event_fanout', 'Event announcement to expand'), ('reward', 'Reward notice')], max_length=20),
+        ),
+    ]
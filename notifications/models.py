@@ -1,6 +1,7 @@
 
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from accounts.models import School # Import School
 from content.models import Class as ContentClass # Import Class from content
 
@@ -24,11 +25,17 @@ class Event(models.Model):
     # Target audience for the event
     school = models.ForeignKey(School, on_delete=models.CASCADE, null=True, blank=True, related_name='school_events', help_text="If specific to a school")
     target_class = models.ForeignKey(ContentClass, on_delete=models.SET_NULL, null=True, blank=True, related_name='class_events', help_text="If specific to a class within the selected school")
+    updated_at = models.DateTimeField(auto_now=True)  # Drives the ETag on calendar feeds.
     # target_role = models.CharField(max_length=10, choices=CustomUser.ROLE_CHOICES, blank=True, null=True) # Could be too broad, consider target_class or school
 
 
     class Meta:
         ordering = ['date']
+        indexes = [
+            # Calendar range queries scan one of these per side of the overlap test.
+            models.Index(fields=['school', 'date'], name='event_school_date'),
+            models.Index(fields=['school', 'end_date'], name='event_school_end_date'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.type}) on {self.date}"
@@ -38,3 +45,51 @@ class Event(models.Model):
         if self.target_class and self.school and self.target_class.school != self.school:
             raise ValidationError({'target_class': 'Target class must belong to the selected school.'})
 
+
+
+class OutboxMessage(models.Model):
+    """
+    A notification waiting to be delivered. Request paths only insert rows here; the deliver_outbox
+    worker batches due rows per recipient into digests and sends them over one connection.
+    """
+    KIND_CHOICES = [
+        ('note_export', 'Note export'),
+        ('event', 'Event announcement'),
+        ('event_fanout', 'Event announcement to expand'),
+        ('reward', 'Reward notice'),
+    ]
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_messages')
+    # Set on 'event_fanout' rows only: the worker expands them into one message per recipient.
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    address = models.CharField(max_length=254, help_text="Delivery address at the time the message was queued.")
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default='email')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, null=True, blank=True, help_text="Set while a worker holds the message.")
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # The worker's "what is due" scan.
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due'),
+            models.Index(fields=['claim_token'], name='outbox_claim'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.address} ({self.status})"
@@ -0,0 +1,170 @@
+import logging
+import smtplib
+import uuid
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import CustomUser, StudentProfile
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_BATCH_SIZE = 1000
+DIGEST_SEPARATOR = '\n\n' + '-' * 40 + '\n\n'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(user, kind, subject, body):
+    """
+    Queues one message for a user. Returns the message, or None if the user has no address.
+    """
+    if not user.email:
+        return None
+    return OutboxMessage.objects.create(recipient=user, address=user.email, kind=kind, subject=subject, body=body)
+
+
+def event_recipients(event):
+    # Class events reach the class's students, their teachers and the students' parents; school
+    # events the school's users and parents of its students; platform events everyone.
+    users = CustomUser.objects.filter(is_active=True).exclude(email='')
+    if event.target_class_id:
+        students = StudentProfile.objects.filter(enrolled_class_id=event.target_class_id).values('user_id')
+        users = users.filter(
+            Q(pk__in=students) | Q(teacher_profile__assigned_classes=event.target_class_id) | Q(parent_links__student_id__in=students)
+        )
+    elif event.school_id:
+        students = StudentProfile.objects.filter(school_id=event.school_id).values('user_id')
+        users = users.filter(Q(school_id=event.school_id) | Q(parent_links__student_id__in=students))
+    return users.distinct().values_list('id', 'email')
+
+
+def announce_event(event):
+    """
+    Queues an announcement of a new event as a single row; deliver() expands it into one message
+    per member of the audience, so the request that created the event writes one row, not one
+    per user.
+    """
+    when = f"{event.date}" + (f" to {event.end_date}" if event.end_date else '')
+    subject = f"New {event.type.lower()}: {event.title}"
+    body = f"{event.title}\n{when}\n\n{event.description or ''}".rstrip()
+    return OutboxMessage.objects.create(event=event, address='', kind='event_fanout', subject=subject, body=body)
+
+
+def expand_announcements(limit=None):
+    """
+    Turns due event announcements into per-recipient messages, in bulk inserts. Each announcement
+    is taken with a conditional UPDATE and expanded in the same transaction, so it is expanded
+    exactly once even with several workers. Returns the number of messages queued.
+    """
+    due = OutboxMessage.objects.filter(kind='event_fanout', status='pending', next_attempt_at__lte=timezone.now())
+    queued = 0
+    for announcement in due.select_related('event').order_by('created_at')[:limit or _setting('OUTBOX_BATCH_SIZE', 200)]:
+        with transaction.atomic():
+            if not OutboxMessage.objects.filter(pk=announcement.pk, status='pending').update(status='sent', sent_at=timezone.now()):
+                continue
+            batch = []
+            for user_id, email in event_recipients(announcement.event).iterator(chunk_size=ENQUEUE_BATCH_SIZE):
+                batch.append(OutboxMessage(recipient_id=user_id, address=email, kind='event', subject=announcement.subject, body=announcement.body))
+                if len(batch) >= ENQUEUE_BATCH_SIZE:
+                    OutboxMessage.objects.bulk_create(batch)
+                    queued += len(batch)
+                    batch = []
+            OutboxMessage.objects.bulk_create(batch)
+            queued += len(batch)
+    return queued
+
+
+def _claim(limit):
+    # Claiming is one conditional UPDATE, so concurrent workers never take the same row. The claim
+    # is a lease: if a worker dies, next_attempt_at passes and the rows become due again.
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        OutboxMessage.objects.filter(status='pending', next_attempt_at__lte=now).exclude(kind='event_fanout')
+        .order_by('next_attempt_at').values_list('pk', flat=True)[:limit]
+    )
+    OutboxMessage.objects.filter(pk__in=list(due), status='pending', next_attempt_at__lte=now).update(
+        claim_token=token, next_attempt_at=now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 300)),
+    )
+    return list(OutboxMessage.objects.filter(claim_token=token).order_by('address', 'created_at'))
+
+
+def build_digest(messages):
+    if len(messages) == 1:
+        return messages[0].subject, messages[0].body
+    subject = f"StepWise: {len(messages)} new updates"
+    return subject, DIGEST_SEPARATOR.join(f"{message.subject}\n\n{message.body}" for message in messages)
+
+
+def _retry_delay(attempts):
+    return timedelta(seconds=_setting('OUTBOX_RETRY_BASE_SECONDS', 60) * 2 ** (attempts - 1))
+
+
+def _mark_failed(messages, error):
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    for message in messages:
+        message.attempts += 1
+        message.last_error = error[:2000]
+        message.claim_token = None
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+        else:
+            message.next_attempt_at = now + _retry_delay(message.attempts)
+    OutboxMessage.objects.bulk_update(messages, ['attempts', 'last_error', 'claim_token', 'status', 'next_attempt_at'])
+
+
+def deliver(batch_size=None, connection=None):
+    """
+    Sends one batch of due messages: one digest per address, all over a single reused connection.
+    Event announcements are expanded first. Failed digests are retried with exponential backoff up
+    to OUTBOX_MAX_ATTEMPTS. Returns (digests sent, digests failed).
+    """
+    expand_announcements()
+    messages = _claim(batch_size or _setting('OUTBOX_BATCH_SIZE', 200))
+    if not messages:
+        return 0, 0
+    digests = [(address, list(group)) for address, group in groupby(messages, key=lambda message: message.address)]
+    connection = connection or get_connection()
+    sent_ids, sent, failed = [], 0, 0
+    pending = iter(digests)
+    try:
+        connection.open()
+        for address, group in pending:
+            subject, body = build_digest(group)
+            try:
+                EmailMessage(subject, body, to=[address], connection=connection).send()
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                # The server rejected this message; the connection is still good.
+                _mark_failed(group, str(e))
+                failed += 1
+            except OSError as e:
+                # Dropped connection (SMTPServerDisconnected is an OSError too): fail this digest
+                # and reconnect for the rest of the batch.
+                _mark_failed(group, str(e))
+                failed += 1
+                connection.close()
+                connection.open()
+            else:
+                sent_ids.extend(message.pk for message in group)
+                sent += 1
+    except OSError as e:
+        # Could not (re)connect: the digests not yet attempted go back with a retry delay.
+        logger.warning("Outbox delivery aborted: %s", e)
+        for _, group in pending:
+            _mark_failed(group, str(e))
+            failed += 1
+    finally:
+        connection.close()
+        if sent_ids:
+            OutboxMessage.objects.filter(pk__in=sent_ids).update(status='sent', sent_at=timezone.now(), claim_token=None)
+    return sent, failed
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+    import redis.asyncio as redis_async
+except ImportError:  # Only needed for the cross-process backend.
+    redis = redis_async = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'notifications.pubsub.LocalBackend'
+
+
+class Subscription:
+    """
+    One connected client: a bounded queue of ready-to-send SSE frames, owned by the client's event loop.
+    """
+    def __init__(self, channels, loop, max_size):
+        self.channels = frozenset(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_size)
+
+    def deliver(self, frame):
+        # Runs on self.loop. A client that stops reading loses its oldest frames, not the server's memory.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """
+    Fans frames out to the subscriptions of this process. dispatch() is safe to call from any thread;
+    delivery is handed to each subscriber's own event loop.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_channel = {}
+
+    def subscribe(self, channels):
+        subscription = Subscription(
+            channels, asyncio.get_running_loop(), getattr(settings, 'NOTIFICATIONS_STREAM_QUEUE_SIZE', 100),
+        )
+        with self._lock:
+            for channel in subscription.channels:
+                self._by_channel.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._by_channel.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_channel[channel]
+
+    def dispatch(self, channel, frame):
+        with self._lock:
+            subscribers = list(self._by_channel.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, frame)
+            except RuntimeError:  # The client's loop has shut down; unsubscribe() will follow.
+                pass
+
+
+class LocalBackend:
+    """
+    Single-process delivery: a publish reaches only clients connected to this process.
+    """
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, channel, frame):
+        self.broker.dispatch(channel, frame)
+
+    async def start(self):
+        pass
+
+
+class RedisBackend:
+    """
+    Cross-process delivery over Redis PUBLISH. Each process runs one pattern subscription (started
+    with its first streaming client) that feeds the local broker, so Redis sees one connection per
+    process rather than one per client.
+    """
+    def __init__(self, broker, url='redis://localhost:6379/0', prefix='stepwise:stream:'):
+        if redis is None:
+            raise ImproperlyConfigured("RedisBackend requires the redis package.")
+        self.broker = broker
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+
+    def publish(self, channel, frame):
+        self._client.publish(self.prefix + channel, frame)
+
+    async def start(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                client = redis_async.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(self.prefix + '*')
+                    async for message in pubsub.listen():
+                        if message['type'] == 'pmessage':
+                            channel = message['channel'].decode()[len(self.prefix):]
+                            self.broker.dispatch(channel, message['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Redis stream listener failed; reconnecting.")
+                await asyncio.sleep(1)
+
+
+broker = LocalBroker()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(getattr(settings, 'NOTIFICATIONS_PUBSUB_BACKEND', DEFAULT_BACKEND))
+                _backend = backend_class(broker, **getattr(settings, 'NOTIFICATIONS_PUBSUB_OPTIONS', {}))
+    return _backend
+
+
+def sse_frame(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def publish(channel, event_type, data):
+    """
+    Pushes a message to every client subscribed to `channel` once the current transaction commits
+    (immediately outside one). The frame is encoded once here, however many clients receive it.
+    """
+    frame = sse_frame(event_type, data)
+    transaction.on_commit(lambda: _publish_now(channel, frame))
+
+
+def _publish_now(channel, frame):
+    try:
+        get_backend().publish(channel, frame)
+    except Exception:
+        # Push is best-effort; the write that triggered it has already committed.
+        logger.exception("Could not publish to %s.", channel)
+
+
+def platform_channel():
+    return 'platform'
+
+
+def school_channel(school_id):
+    return f"school:{school_id}"
+
+
+def class_channel(class_id):
+    return f"class:{class_id}"
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
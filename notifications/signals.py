@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from accounts.models import CustomUser, ParentStudentLink, StudentProfile, TeacherProfile
+from . import outbox, pubsub
+from .calendars import event_channel, invalidate_cache, invalidate_user_audience
+from .models import Event
+from .serializers import EventSerializer
+
+
+@receiver([post_save, post_delete], sender=Event)
+def event_changed(sender, instance, signal, created=False, **kwargs):
+    invalidate_cache()
+    if signal is post_delete:
+        pubsub.publish(event_channel(instance), 'event_deleted', {'id': instance.pk})
+    else:
+        pubsub.publish(event_channel(instance), 'event_created' if created else 'event_updated', EventSerializer(instance).data)
+        if created:
+            outbox.announce_event(instance)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=TeacherProfile)
+def audience_owner_changed(sender, instance, **kwargs):
+    invalidate_user_audience(instance.pk if sender is CustomUser else instance.user_id)
+
+
+def _placement(profile):
+    # From __dict__ so a deferred field isn't fetched just to remember it.
+    return profile.__dict__.get('school_id'), profile.__dict__.get('enrolled_class_id')
+
+
+def _invalidate_linked_parents(student_id):
+    # Parents see their children's school and class events. Looked up after commit, so a parent
+    # request racing the transaction can't cache the old audience again.
+    def invalidate():
+        invalidate_user_audience(*ParentStudentLink.objects.filter(student_id=student_id).values_list('parent_id', flat=True))
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_init, sender=StudentProfile)
+def remember_student_placement(sender, instance, **kwargs):
+    instance._event_placement = _placement(instance)
+
+
+@receiver(post_save, sender=StudentProfile)
+def student_profile_saved(sender, instance, created=False, **kwargs):
+    invalidate_user_audience(instance.user_id)
+    # Only a new school or class changes what the parents see; most profile saves don't.
+    placement = _placement(instance)
+    if placement != instance._event_placement or (created and placement != (None, None)):
+        _invalidate_linked_parents(instance.user_id)
+    instance._event_placement = placement
+
+
+@receiver(post_delete, sender=StudentProfile)
+def student_profile_deleted(sender, instance, **kwargs):
+    invalidate_user_audience(instance.user_id)
+    _invalidate_linked_parents(instance.user_id)
+
+
+@receiver(m2m_changed, sender=TeacherProfile.assigned_classes.through)
+def teacher_classes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the class side: instance is a Class, pk_set holds teacher profiles.
+        teachers = TeacherProfile.objects.filter(pk__in=pk_set) if pk_set else instance.teachers_assigned.all()
+        invalidate_user_audience(*teachers.values_list('user_id', flat=True))
+    else:
+        invalidate_user_audience(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=ParentStudentLink)
+def parent_link_changed(sender, instance, **kwargs):
+    invalidate_user_audience(instance.parent_id)
@@ -0,0 +1,64 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from accounts.tokens import SignedTokenAuthentication
+from . import calendars, pubsub
+
+
+def _subscriber_channels(request):
+    """
+    Authenticates the stream request and returns the user's channels. Browsers' EventSource can't
+    send headers, so a signed access token may also come as ?access=<token>.
+    """
+    token = request.GET.get('access')
+    if token:
+        user, _ = SignedTokenAuthentication().authenticate_credentials(token)
+    else:
+        user = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]).user
+        if not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+    return calendars.user_channels(user)
+
+
+async def _frames(channels):
+    # Subscribed on the first iteration, not when the response is built: a client that disconnects
+    # before the response starts never subscribes. Nothing between subscribe() and the try can
+    # suspend or raise, so once subscribed the finally always unsubscribes.
+    keepalive = getattr(settings, 'NOTIFICATIONS_STREAM_KEEPALIVE', 15)
+    subscription = pubsub.broker.subscribe(channels)
+    try:
+        yield f"retry: {getattr(settings, 'NOTIFICATIONS_STREAM_RETRY_MS', 5000)}\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Comment line: keeps proxies from closing an idle connection.
+                yield ": keepalive\n\n"
+    finally:
+        # Runs when the client disconnects and the server cancels the response.
+        pubsub.broker.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    """
+    Server-sent events for the signed-in user: new, changed and deleted calendar events for their
+    audiences, plus their own quiz results and reward grants. Replaces polling; needs an ASGI server.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+    try:
+        channels = await sync_to_async(_subscriber_channels)(request)
+    except exceptions.APIException as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+    await pubsub.get_backend().start()
+    response = StreamingHttpResponse(_frames(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream.
+    return response
@@ -0,0 +1,319 @@
+import asyncio
+import smtplib
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser, ParentStudentLink, School, StudentProfile
+from content.models import Class as ContentClass, Reward, UserReward
+from . import calendars, outbox, pubsub, streams, views
+from .models import Event, OutboxMessage
+from .outbox import deliver, enqueue
+
+
+class FlakyBackend(EmailBackend):
+    """
+    Local SMTP stand-in: records opens and fails the first send with a dropped connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opens = 0
+        self.fail_next = True
+
+    def open(self):
+        self.opens += 1
+
+    def send_messages(self, messages):
+        if self.fail_next:
+            self.fail_next = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+@override_settings(OUTBOX_RETRY_BASE_SECONDS=0)
+class OutboxDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.ana = CustomUser.objects.create_user(username="ana", email="ana@gv.example", password="x", role="Student", school=cls.school)
+        cls.ben = CustomUser.objects.create_user(username="ben", email="ben@gv.example", password="x", role="Teacher", school=cls.school)
+
+    def test_messages_are_batched_into_one_digest_per_recipient(self):
+        Event.objects.create(title="Sports day", date="2026-11-02", school=self.school)
+        enqueue(self.ana, 'reward', "You earned 1 new reward", "Starter: first quiz passed")
+        self.assertEqual(OutboxMessage.objects.count(), 2)  # The announcement is expanded by deliver().
+
+        self.assertEqual(deliver(), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["ana@gv.example", "ben@gv.example"])
+        digest = next(message for message in mail.outbox if message.to == ["ana@gv.example"])
+        self.assertEqual(digest.subject, "StepWise: 2 new updates")
+        self.assertIn("Sports day", digest.body)
+        self.assertIn("Starter", digest.body)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        self.assertEqual(deliver(), (0, 0))
+
+    def test_event_announcement_is_one_row_until_the_worker_expands_it(self):
+        class_obj = ContentClass.objects.create(school=self.school, name="Class 6")
+        StudentProfile.objects.create(user=self.ana, school=self.school, enrolled_class=class_obj)
+        parent = CustomUser.objects.create_user(username="pat", email="pat@example.com", password="x", role="Parent")
+        ParentStudentLink.objects.create(parent=parent, student=self.ana)
+
+        Event.objects.create(title="Trip", date=date(2026, 11, 2), school=self.school, target_class=class_obj)
+        self.assertEqual(list(OutboxMessage.objects.values_list('kind', flat=True)), ['event_fanout'])
+        self.assertEqual(outbox.expand_announcements(), 2)
+        self.assertEqual(outbox.expand_announcements(), 0)
+        self.assertEqual(sorted(OutboxMessage.objects.filter(kind='event').values_list('address', flat=True)), ["ana@gv.example", "pat@example.com"])
+
+        self.assertEqual(deliver(), (2, 0))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["ana@gv.example", "pat@example.com"])
+
+    def test_rewards_awarded_by_staff_are_queued_as_a_notice(self):
+        badge = Reward.objects.create(title="Helper", description="Helped a classmate", icon_name="Heart")
+        UserReward.objects.create(user=self.ana, reward=badge)
+        message = OutboxMessage.objects.get(kind='reward')
+        self.assertEqual((message.recipient, message.subject, message.body), (self.ana, "You earned 1 new reward", "Helper: Helped a classmate"))
+
+    def test_dropped_connection_fails_one_digest_and_retries_it(self):
+        enqueue(self.ana, 'note_export', "Your notes", "Photosynthesis")
+        enqueue(self.ben, 'note_export', "Your notes", "Fractions")
+        connection = FlakyBackend()
+
+        self.assertEqual(deliver(connection=connection), (1, 1))
+        self.assertEqual(connection.opens, 2)  # Reconnected once for the rest of the batch.
+        failed = OutboxMessage.objects.get(status='pending')
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("unexpectedly closed", failed.last_error)
+
+        self.assertEqual(deliver(connection=connection), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=1)
+    def test_message_is_marked_failed_after_max_attempts(self):
+        enqueue(self.ana, 'note_export', "Your notes", "Photosynthesis")
+        self.assertEqual(deliver(connection=FlakyBackend()), (0, 1))
+        self.assertEqual(OutboxMessage.objects.get().status, 'failed')
+        self.assertEqual(deliver(), (0, 0))
+
+
+class EventCalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.other = School.objects.create(name="Hill Top", school_id_code="HT01", official_email="office@ht.example")
+        cls.trip = Event.objects.create(title="Camp", date=date(2026, 10, 30), end_date=date(2026, 11, 2), school=cls.school)
+        Event.objects.create(title="Exams", date=date(2026, 11, 20), type='Exam', school=cls.school)
+        Event.objects.create(title="Fair", date=date(2026, 11, 5), school=cls.other)
+
+    def setUp(self):
+        calendars.invalidate_cache()
+
+    def titles(self, start, end, **params):
+        response = APIClient().get('/api/events/', {'start': start, 'end': end, **params})
+        self.assertEqual(response.status_code, 200)
+        return [event['title'] for event in response.data]
+
+    def test_range_returns_overlapping_events_once(self):
+        self.assertEqual(self.titles('2026-10-01', '2026-11-30', school=self.school.pk), ["Camp", "Exams"])
+        self.assertEqual(self.titles('2026-11-01', '2026-11-10'), ["Camp", "Fair"])
+        self.assertEqual(self.titles('2026-11-01', '2026-11-30', school=self.school.pk, type='Exam'), ["Exams"])
+
+    def test_months_are_served_from_the_cache_until_an_event_changes(self):
+        self.titles('2026-11-01', '2026-11-30')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles('2026-11-01', '2026-11-30'), ["Camp", "Fair", "Exams"])
+        self.trip.delete()
+        self.assertEqual(self.titles('2026-11-01', '2026-11-30'), ["Fair", "Exams"])
+
+    def test_writes_in_another_process_invalidate_through_the_shared_version(self):
+        self.titles('2026-11-01', '2026-11-30')
+        Event.objects.filter(title="Fair").update(title="Book fair")  # No signal in this process.
+        self.assertIn("Fair", self.titles('2026-11-01', '2026-11-30'))
+        cache.incr(calendars.CACHE_VERSION_KEY)
+        self.assertIn("Book fair", self.titles('2026-11-01', '2026-11-30'))
+
+    def test_bad_ranges_are_rejected(self):
+        client = APIClient()
+        for params in ({'start': '2026-11-01'}, {'start': '2026-11-30', 'end': '2026-11-01'},
+                       {'start': '2026-01-01', 'end': '2027-06-01'}, {'start': '2026-11-01', 'end': '2026-11-30', 'school': 'x'}):
+            self.assertEqual(client.get('/api/events/', params).status_code, 400, params)
+
+
+class ParentAudienceInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.classes = [ContentClass.objects.create(school=cls.school, name=f"Class {n}") for n in (6, 7)]
+        cls.student = CustomUser.objects.create_user(username="sam", password="x", role="Student", school=cls.school)
+        StudentProfile.objects.create(user=cls.student, school=cls.school, enrolled_class=cls.classes[0])
+        cls.parent = CustomUser.objects.create_user(username="pat", password="x", role="Parent")
+        cls.bystander = CustomUser.objects.create_user(username="bo", password="x", role="Parent")
+        ParentStudentLink.objects.create(parent=cls.parent, student=cls.student)
+
+    def setUp(self):
+        cache.clear()
+        self.profile = StudentProfile.objects.get(user=self.student)
+
+    def test_class_change_invalidates_only_the_linked_parents(self):
+        self.assertEqual(calendars.user_audience(self.parent), ([self.school.pk], [self.classes[0].pk]))
+        calendars.user_audience(self.bystander)
+
+        self.profile.enrolled_class = self.classes[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.assertEqual(calendars.user_audience(self.parent), ([self.school.pk], [self.classes[1].pk]))
+        self.assertIsNotNone(cache.get(calendars.USER_AUDIENCE_KEY.format(self.bystander.pk)))
+
+    def test_other_profile_edits_leave_parents_alone(self):
+        calendars.user_audience(self.parent)
+        self.profile.full_name = "Sam Student"
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.profile.save()
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(cache.get(calendars.USER_AUDIENCE_KEY.format(self.parent.pk)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.delete()
+        self.assertIsNone(cache.get(calendars.USER_AUDIENCE_KEY.format(self.parent.pk)))
+
+
+class EventFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.other = School.objects.create(name="Hill Top", school_id_code="HT01", official_email="office@ht.example")
+        class_6, class_7 = (ContentClass.objects.create(school=cls.school, name=f"Class {n}") for n in (6, 7))
+        class_8 = ContentClass.objects.create(school=cls.other, name="Class 8")
+        cls.student = CustomUser.objects.create_user(username="sam", password="x", role="Student", school=cls.school)
+        StudentProfile.objects.create(user=cls.student, school=cls.school, enrolled_class=class_6)
+        child = CustomUser.objects.create_user(username="kim", password="x", role="Student", school=cls.other)
+        StudentProfile.objects.create(user=child, school=cls.other, enrolled_class=class_8)
+        cls.parent = CustomUser.objects.create_user(username="pat", password="x", role="Parent")
+        ParentStudentLink.objects.create(parent=cls.parent, student=child)
+
+        for title, day, end, audience in (
+            ("Old", date(2026, 10, 1), None, {}),
+            ("Term", date(2026, 10, 20), date(2026, 11, 10), {}),
+            ("Open day", date(2026, 11, 1), None, {}),
+            ("Sports day", date(2026, 11, 3), None, {'school': cls.school}),
+            ("Fair", date(2026, 11, 4), None, {'school': cls.other}),
+            ("Class 6 trip", date(2026, 11, 5), None, {'school': cls.school, 'target_class': class_6}),
+            ("Class 7 trip", date(2026, 11, 5), None, {'school': cls.school, 'target_class': class_7}),
+            ("Class 8 trip", date(2026, 11, 6), None, {'school': cls.other, 'target_class': class_8}),
+        ):
+            Event.objects.create(title=title, date=day, end_date=end, **audience)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def feed(self, user, url='/api/events/feed/', **params):
+        self.client.force_authenticate(user)
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def titles(self, user, **params):
+        return [event['title'] for event in self.feed(user, **params)['results']]
+
+    def test_feed_merges_every_audience_of_the_user(self):
+        self.assertEqual(self.titles(self.student, since='2026-10-15'), ["Term", "Open day", "Sports day", "Class 6 trip"])
+        # A parent sees their children's school and class.
+        self.assertEqual(self.titles(self.parent, since='2026-10-15'), ["Term", "Open day", "Fair", "Class 8 trip"])
+
+    def test_since_keeps_events_still_running(self):
+        self.assertEqual(self.titles(self.student, since='2026-11-04'), ["Term", "Class 6 trip"])
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2026, 11, 4, 12, tzinfo=dt_timezone.utc)):
+            self.assertEqual(self.titles(self.student), ["Term", "Class 6 trip"])
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get('/api/events/feed/', {'since': '4 November'}).status_code, 400)
+
+    @mock.patch.object(views.EventFeedPagination, 'page_size', 2)
+    def test_cursor_pages_are_ordered_and_stable(self):
+        first = self.feed(self.student, since='2026-10-15')
+        self.assertEqual([event['title'] for event in first['results']], ["Term", "Open day"])
+        # Events added before the cursor don't shift the next page.
+        Event.objects.create(title="Assembly", date=date(2026, 10, 25))
+        Event.objects.create(title="Also on the 5th", date=date(2026, 11, 5), school=self.school)
+        second = self.feed(self.student, url=first['next'])
+        self.assertEqual([event['title'] for event in second['results']], ["Sports day", "Class 6 trip"])
+        # Same-day events follow creation (id) order.
+        third = self.feed(self.student, url=second['next'])
+        self.assertEqual([event['title'] for event in third['results']], ["Also on the 5th"])
+        self.assertIsNone(third['next'])
+
+
+class CalendarFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name="Green Valley", school_id_code="GV01", official_email="office@gv.example")
+        cls.events = [Event.objects.create(title=title, date=date(2026, 11, n), school=cls.school) for n, title in ((2, "Sports day"), (9, "Exams"))]
+
+    def fetch(self, **headers):
+        return self.client.get(f'/api/calendars/schools/{self.school.pk}.ics', **headers)
+
+    def test_feed_revalidates_by_etag(self):
+        response = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"SUMMARY:Sports day", b''.join(response.streaming_content))
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.events[1].title = "Final exams"
+        self.events[1].save()
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleting_an_event_is_never_answered_with_304(self):
+        etag = self.fetch()['ETag']
+        self.events[0].delete()
+        self.assertEqual(self.fetch(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.fetch(HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(b"Sports day", b''.join(response.streaming_content))
+
+
+class StreamBrokerTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = pubsub.LocalBroker()
+
+    async def drain(self, subscription):
+        await asyncio.sleep(0)  # Let call_soon_threadsafe deliveries run.
+        frames = []
+        while not subscription.queue.empty():
+            frames.append(await subscription.get())
+        return frames
+
+    async def test_frames_reach_subscribers_of_the_channel_until_they_unsubscribe(self):
+        subscription = self.broker.subscribe(['school:1', 'user:7'])
+        self.broker.dispatch('school:1', 'a')
+        self.broker.dispatch('school:2', 'b')
+        self.broker.dispatch('user:7', 'c')
+        self.assertEqual(await self.drain(subscription), ['a', 'c'])
+
+        self.broker.unsubscribe(subscription)
+        self.broker.dispatch('school:1', 'd')
+        self.assertEqual(await self.drain(subscription), [])
+        self.assertEqual(self.broker._by_channel, {})
+
+    @override_settings(NOTIFICATIONS_STREAM_QUEUE_SIZE=2)
+    async def test_a_slow_client_loses_its_oldest_frames(self):
+        subscription = self.broker.subscribe(['platform'])
+        for frame in ('a', 'b', 'c'):
+            self.broker.dispatch('platform', frame)
+        self.assertEqual(await self.drain(subscription), ['b', 'c'])
+
+    async def test_stream_subscribes_only_once_it_is_iterated(self):
+        with mock.patch.object(pubsub, 'broker', self.broker):
+            frames = streams._frames(['platform'])
+            self.assertEqual(self.broker._by_channel, {})  # A client gone before the first read leaks nothing.
+            self.assertTrue((await anext(frames)).startswith('retry:'))
+            self.assertEqual(len(self.broker._by_channel['platform']), 1)
+            self.broker.dispatch('platform', 'event: ping\n\n')
+            self.assertEqual(await anext(frames), 'event: ping\n\n')
+            await frames.aclose()
+        self.assertEqual(self.broker._by_channel, {})
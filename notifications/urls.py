@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import EventViewSet
+from .streams import event_stream
+from .views import EventViewSet, school_calendar, class_calendar
 
 router = DefaultRouter()
 router.register(r'events', EventViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('calendars/schools/<int:school_id>.ics', school_calendar, name='school-calendar'),
+    path('calendars/classes/<int:class_id>.ics', class_calendar, name='class-calendar'),
+    path('stream/', event_stream, name='event-stream'),
 ]
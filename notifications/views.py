@@ -1,12 +1,35 @@
 
+from hashlib import blake2b
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser, AllowAny, IsAuthenticated
 from .models import Event
 from .serializers import EventSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from accounts.models import CustomUser # To check for is_school_admin
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from accounts.models import School
+from content.models import Class as ContentClass
+from . import calendars, ical
+
+class EventFeedPagination(CursorPagination):
+    # Cursor paging stays a cheap indexed seek however deep the client scrolls.
+    page_size = 20
+    ordering = ('date', 'id')
+
 
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all().select_related('school', 'target_class', 'created_by').order_by('date')
@@ -19,11 +42,73 @@ class EventViewSet(viewsets.ModelViewSet):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             # Only Platform Admins or School Admins (for their school's events) can CUD
             self.permission_classes = [IsAuthenticated, IsAdminUser] # Further logic in perform_create/update for school admin
+        elif self.action == 'feed':
+            self.permission_classes = [IsAuthenticated]
         else:
             # Anyone can view events, even unauthenticated users for a public calendar display
             self.permission_classes = [AllowAny] 
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        # ?start=YYYY-MM-DD&end=YYYY-MM-DD returns every event overlapping the range, unpaginated, for calendar views.
+        if 'start' not in request.query_params and 'end' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        start, end = self._date_range()
+        return Response(calendars.events_between(start, end, self._audience(), self.get_serializer_class()))
+
+    @action(detail=False, pagination_class=EventFeedPagination)
+    def feed(self, request):
+        """
+        The user's events in date order: platform-wide, their school(s) and their class(es), merged.
+        Defaults to events still running today or later; pass ?since=YYYY-MM-DD to start elsewhere.
+        """
+        since = timezone.localdate()
+        if request.query_params.get('since'):
+            try:
+                since = parse_date(request.query_params['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise ValidationError({'since': "Provide a date in YYYY-MM-DD format."})
+        queryset = calendars.feed_queryset(request.user).filter(Q(date__gte=since) | Q(end_date__gte=since))
+        page = self.paginate_queryset(queryset.select_related('school', 'target_class', 'created_by'))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def _date_range(self):
+        params = self.request.query_params
+        errors = {}
+        dates = {}
+        for name in ('start', 'end'):
+            try:
+                dates[name] = parse_date(params.get(name, ''))
+            except ValueError:
+                dates[name] = None
+            if dates[name] is None:
+                errors[name] = "Provide a date in YYYY-MM-DD format."
+        if errors:
+            raise ValidationError(errors)
+        start, end = dates['start'], dates['end']
+        if end < start:
+            raise ValidationError({'end': "End date cannot be before start date."})
+        max_days = getattr(settings, 'EVENT_CALENDAR_MAX_DAYS', 366)
+        if (end - start).days >= max_days:
+            raise ValidationError({'end': f"Date range cannot exceed {max_days} days."})
+        return start, end
+
+    def _audience(self):
+        params = self.request.query_params
+        audience = {}
+        for field in ('school', 'target_class'):
+            if params.get(field):
+                if not params[field].isdigit():
+                    raise ValidationError({field: "Must be an id."})
+                audience[field] = int(params[field])
+        if params.get('type'):
+            if params['type'] not in dict(Event.EVENT_TYPES):
+                raise ValidationError({'type': "Invalid event type."})
+            audience['type'] = params['type']
+        return audience
+
     def perform_create(self, serializer):
         user = self.request.user
         school_for_event = serializer.validated_data.get('school')
@@ -65,3 +150,44 @@ class EventViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("School admins can only delete events for their own school.")
         instance.delete()
 
+
+def _calendar_response(request, queryset, name):
+    # One aggregate decides freshness: a write bumps max(updated_at) and a delete drops the count.
+    # No Last-Modified: a delete leaves max(updated_at) alone, so If-Modified-Since would answer 304
+    # with the deleted event still in the client's copy.
+    state = queryset.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+    last_modified = state['last_modified']
+    fingerprint = f"{state['count']}:{last_modified.isoformat() if last_modified else ''}:{name}"
+    etag = quote_etag(blake2b(fingerprint.encode(), digest_size=16).hexdigest())
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        events = queryset.only('id', 'title', 'description', 'date', 'end_date', 'type', 'updated_at').order_by('date', 'id')
+        response = StreamingHttpResponse(
+            ical.stream_calendar(events, name, request.get_host().split(':')[0]),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'EVENT_ICAL_MAX_AGE', 900))
+    return response
+
+
+@require_safe
+def school_calendar(request, school_id):
+    """
+    Public iCalendar subscription feed: platform-wide and school-wide events for one school.
+    """
+    school = get_object_or_404(School.objects.only('id', 'name'), pk=school_id)
+    return _calendar_response(request, calendars.audience_events([school.id], []), school.name)
+
+
+@require_safe
+def class_calendar(request, class_id):
+    """
+    Public iCalendar subscription feed for one class: its events plus its school's and platform-wide ones.
+    """
+    class_obj = get_object_or_404(ContentClass.objects.select_related('school').only('id', 'name', 'school__name'), pk=class_id)
+    name = f"{class_obj.school.name} - {class_obj.name}" if class_obj.school_id else class_obj.name
+    school_ids = [class_obj.school_id] if class_obj.school_id else []
+    return _calendar_response(request, calendars.audience_events(school_ids, [class_obj.id]), name)
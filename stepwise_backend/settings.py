@@ -94,12 +94,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# Version keys and revocation markers in this cache tell every worker to drop its local copies
+# (auth tokens, reward rules, event calendars, school search), so all workers must share it: Redis
+# when REDIS_URL is set (needs the redis package), otherwise a file cache, which is shared only by
+# workers on one host. Tests swap in a per-process memory cache (stepwise_backend/test_runner.py).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+        }
+    }
+
+TEST_RUNNER = 'stepwise_backend.test_runner.TestRunner'
+
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
+        'accounts.tokens.SignedTokenAuthentication', # "Bearer" tokens from api/token-auth/signed/
         # 'rest_framework.authentication.SessionAuthentication', # If you also use Django admin login
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -166,8 +189,109 @@ STATIC_URL = 'static/'
 # Media files (User uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Protected media (book downloads) is sent by Django unless a front server takes over:
+# 'x-accel-redirect' (nginx, with an internal location at PROTECTED_MEDIA_ACCEL_PREFIX aliasing
+# MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd).
+PROTECTED_MEDIA_OFFLOAD = None
+PROTECTED_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Resumable chunked uploads (api/uploads/). Partial files live in UPLOAD_SESSION_DIR, which should be
+# on the same filesystem as MEDIA_ROOT so completing an upload is a rename rather than a copy.
+UPLOAD_SESSION_DIR = os.path.join(MEDIA_ROOT, 'uploads', 'partial')
+UPLOAD_MAX_SIZE = 500 * 1024 * 1024  # bytes
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024  # bytes per PUT
+UPLOAD_SESSION_LIFETIME = 24 * 60 * 60  # seconds before an unfinished upload is purged
+
+# Book files and profile pictures are stored once per distinct content under MEDIA_ROOT/BLOB_STORAGE_PREFIX
+# (content/storage.py). Only profile pictures may be served directly: the front server can serve
+# MEDIA_URL + 'blobs/public/' with "Cache-Control: public, max-age=31536000, immutable". Book files
+# live elsewhere under 'blobs/' and must only be reachable through the protected download
+# (api/books/<id>/download/), so never expose 'blobs/' as a whole.
+# `manage.py collect_blobs` deletes unreferenced blobs older than BLOB_GC_GRACE_SECONDS.
+BLOB_STORAGE_PREFIX = 'blobs'
+BLOB_GC_GRACE_SECONDS = 60 * 60
+
+# Profile picture variants (accounts/images.py): square crops rendered as WebP and JPEG beside the
+# original by a thread pool after upload. 0 workers renders them inline. `manage.py
+# build_profile_picture_variants` fills in pictures uploaded before this existed.
+PROFILE_PICTURE_VARIANTS = {'thumb': 128, 'medium': 512}  # label -> edge in pixels
+PROFILE_PICTURE_QUALITY = 80
+PROFILE_PICTURE_WORKERS = 2
+
+# Full-text search inside books (content/fulltext.py, api/books/search/). `manage.py index_book_text
+# --loop` extracts new or replaced PDF/EPUB files page by page into BookPage, searched through FTS5
+# on SQLite or a tsvector GIN index on PostgreSQL. PDFs need the optional pypdf package.
+BOOK_TEXT_BATCH_SIZE = 20  # pages committed at a time; an interrupted run resumes from the last batch
+BOOK_TEXT_BOOKS_PER_RUN = 10
+BOOK_TEXT_MAX_PAGE_CHARS = 100_000
+# A worker renews its claim on a book with every batch; a book whose claim lapses (the worker died)
+# is resumed by the next one. Must comfortably exceed the time one batch takes to extract.
+BOOK_TEXT_LEASE_SECONDS = 300
 
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Gamification
+# In-process leaderboards are rebuilt from the database after this many seconds so that
+# multiple worker processes converge on the same rankings.
+LEADERBOARD_RELOAD_SECONDS = 300
+# Reward rules are cached per process; saving a rule bumps a version in the shared cache, and
+# copies older than this are reloaded regardless.
+REWARD_RULES_CACHE_SECONDS = 60
+
+# Password hashing
+# Size of the process pool that hashes and checks passwords (signup, password changes, token
+# logins and roster imports); 1 hashes inline on the request thread, with no 503s. Every web worker
+# process starts its own pool, so keep workers x this number within the CPUs. The limits below are
+# per process too.
+PASSWORD_HASHING_WORKERS = 2
+# Once this many jobs are queued or running, further requests get a 503 with Retry-After instead of
+# waiting (None: 8 per pool worker).
+PASSWORD_HASHING_MAX_PENDING = None
+# Roster imports feed the pool this many passwords at a time, within the same limit (None: one per worker).
+PASSWORD_HASHING_BULK_IN_FLIGHT = None
+PASSWORD_HASHING_TIMEOUT = 10  # Seconds a request waits for its hash before giving up with a 503.
+PASSWORD_HASHING_RETRY_AFTER = 2  # Seconds suggested to clients in the Retry-After header.
+
+# Token authentication cache: resolved users are reused by each process for this many seconds.
+# Logouts, password changes and role changes reach other processes at once through the shared cache.
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_CACHE_SIZE = 10000
+
+# Signed (stateless) tokens: access tokens are verified without I/O, so keep them short-lived.
+SIGNED_ACCESS_TOKEN_LIFETIME = 300  # seconds
+SIGNED_REFRESH_TOKEN_LIFETIME = 24 * 60 * 60  # seconds
+
+# School typeahead: cached results live this long (invalidated early whenever a school changes).
+SCHOOL_SEARCH_CACHE_SECONDS = 300
+
+# Teacher class roster (teacher-actions/my_classes/)
+TEACHER_ROSTER_CACHE_SECONDS = 60
+ATTENTION_INACTIVE_DAYS = 7  # Students with no activity for this many days count as needing attention.
+ATTENTION_FAILURE_STREAK = 3  # Consecutive failed quiz attempts that flag a student.
+ATTENTION_SCORE_DROP = 10  # Points the recent quiz average may fall below the long-run average before flagging.
+
+# Event calendar range queries (events/?start=&end=): per-month results in the shared cache (see CACHES),
+# invalidated for every worker on any event write.
+EVENT_CALENDAR_CACHE_SECONDS = 300
+EVENT_CALENDAR_MAX_DAYS = 366  # Longest range one request may ask for.
+EVENT_AUDIENCE_CACHE_SECONDS = 300  # Per-user school/class audience behind events/feed/.
+EVENT_ICAL_MAX_AGE = 900  # Cache-Control max-age on .ics subscription feeds.
+
+# Server-sent events (api/stream/, served by the ASGI app). The local backend only reaches clients
+# connected to the publishing process; with several workers use
+# 'notifications.pubsub.RedisBackend' and NOTIFICATIONS_PUBSUB_OPTIONS = {'url': 'redis://...'}.
+NOTIFICATIONS_PUBSUB_BACKEND = 'notifications.pubsub.LocalBackend'
+NOTIFICATIONS_PUBSUB_OPTIONS = {}
+NOTIFICATIONS_STREAM_KEEPALIVE = 15  # Seconds between keepalive comments on an idle stream.
+NOTIFICATIONS_STREAM_QUEUE_SIZE = 100  # Frames buffered per client before the oldest are dropped.
+
+# Notification outbox (manage.py deliver_outbox). Mail goes through Django's EMAIL_* settings; point
+# EMAIL_HOST/EMAIL_PORT at a local stand-in such as `python -m aiosmtpd -n -l localhost:1025` to test.
+OUTBOX_BATCH_SIZE = 200  # Messages claimed per delivery batch.
+OUTBOX_MAX_ATTEMPTS = 5  # Then the message is marked failed.
+OUTBOX_RETRY_BASE_SECONDS = 60  # Retry delay doubles after each failed attempt.
+OUTBOX_LEASE_SECONDS = 300  # A crashed worker's claimed messages become due again after this.
+DEFAULT_FROM_EMAIL = 'StepWise <no-reply@stepwise.local>'
@@ -1,18 +1,24 @@
+import os
 
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework.authtoken.views import obtain_auth_token
+from accounts.views import SignedTokenObtainView, SignedTokenRefreshView, obtain_auth_token
 from django.conf import settings # Required for media files in DEBUG mode
 from django.conf.urls.static import static # Required for media files in DEBUG mode
+from content.storage import blob_prefix, public_blob_storage
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('accounts.urls')),
     path('api/token-auth/', obtain_auth_token, name='api_token_auth'), # Django REST framework token auth
+    path('api/token-auth/signed/', SignedTokenObtainView.as_view(), name='api_token_auth_signed'), # Stateless signed tokens
+    path('api/token-auth/refresh/', SignedTokenRefreshView.as_view(), name='api_token_auth_refresh'),
     path('api/', include('content.urls')),
     path('api/', include('notifications.urls')), # Add notifications app URLs
 ]
 
-# Serve media files during development
+# Serve public media files during development. Only the public blobs (profile pictures): book files
+# live elsewhere under the blob prefix and must go through the protected download, here too.
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    public_blobs = f"{blob_prefix()}/{public_blob_storage.subdirectory}/"
+    urlpatterns += static(settings.MEDIA_URL + public_blobs, document_root=os.path.join(settings.MEDIA_ROOT, public_blobs))